@@ -1,53 +1,85 @@
+import collections
+import functools
 import numpy as np
 import scipy.stats as st
+from scipy import linalg
 from scipy.stats import norm
 import scipy.integrate as integrate
+from scipy import signal, sparse
+import scipy.sparse.linalg
+from scipy.special import ndtr
 
-def rouwen(rho, mu, step, num):
+def rouwen(rho, mu, step, num, sparse_tol=None):
     '''
     Adapted from Lu Zhang and Karen Kopecky. Python by Ben Tengelsen.
     Construct transition probability matrix for discretizing an AR(1)
     process. This procedure is from Rouwenhorst (1995), which works
     well for very persistent processes.
 
+    Row i of the Rouwenhorst matrix is the distribution of the sum of a
+    Binomial(i, p) and a Binomial(num - 1 - i, 1 - q) random variable.
+    Rather than building the matrix by the recursion in Rouwenhorst
+    (1995), which is O(num^3), each row is found from the one before it
+    using row_{i+1} * (q, 1 - q) = row_i * (1 - p, p), where * is
+    convolution, so the matrix is built in O(num^2) in one buffer. Only
+    the first half of the rows are computed, the rest follow from the
+    matrix being centrosymmetric.
+
     INPUTS:
     rho  - persistence (close to one)
     mu   - mean and the middle point of the discrete state space
     step - step size of the even-spaced grid
     num  - number of grid points on the discretized process
+    sparse_tol - if not None, drop transition probabilities below this
+                 value and return the matrix as a scipy.sparse matrix.
+                 The remaining probabilities in each column are a
+                 contiguous band around the diagonal.
 
     OUTPUT:
+    transP - transition probability matrix over the grid, with
+             transP[j, i] the probability of moving from state i to
+             state j (columns sum to one)
     dscSp  - discrete state space (num by 1 vector)
-    transP - transition probability matrix over the grid
     '''
+    if num < 2:
+        raise ValueError('rouwen requires at least 2 grid points')
+    if not -1 < rho < 1:
+        raise ValueError('rouwen requires -1 < rho < 1')
 
     # discrete state space
     dscSp = np.linspace(mu - (num - 1) / 2 * step, mu + (num - 1) / 2 * step,
                         num).T
 
-    # transition probability matrix
+    # transition probability matrix, rows are the current state
     q = p = (rho + 1)/2.
-    transP = np.array([[p**2, p*(1-q), (1-q)**2],
-                      [2*p*(1-p), p*q+(1-p)*(1-q), 2*q*(1-q)],
-                      [(1-p)**2, (1-p)*q, q**2]]).T
-
-    while transP.shape[0] <= num - 1:
-
-        # see Rouwenhorst 1995
-        len_P = transP.shape[0]
-        transP = p*np.vstack((np.hstack((transP, np.zeros((len_P, 1)))), np.zeros((1, len_P+1)))) \
-        + (1 - p)*np.vstack((np.hstack((np.zeros((len_P, 1)), transP)), np.zeros((1, len_P+1)))) \
-        + (1 - q)*np.vstack((np.zeros((1, len_P+1)), np.hstack((transP, np.zeros((len_P, 1)))))) \
-        + q * np.vstack((np.zeros((1, len_P+1)), np.hstack((np.zeros((len_P, 1)), transP))))
-
-        transP[1:-1] /= 2.
+    P = np.empty((num, num))
+    P[0] = st.binom.pmf(np.arange(num), num - 1, 1 - q)
+    half = (num + 1) // 2
+    for i in range(half - 1):
+        s = np.convolve(P[i], [1 - p, p])
+        # deconvolve by (q, 1 - q), running the recursion in the
+        # direction where it is stable
+        if q >= 0.5:
+            P[i + 1] = signal.lfilter([1 / q], [1, (1 - q) / q], s[:num])
+        else:
+            P[i + 1] = signal.lfilter(
+                [1 / (1 - q)], [1, q / (1 - q)], s[:0:-1])[::-1]
+    P[half:] = P[:num - half][::-1, ::-1]
+    # remove rounding error
+    np.maximum(P, 0.0, out=P)
+    P /= P.sum(axis=1, keepdims=True)
+
+    if sparse_tol is not None:
+        P[P < sparse_tol] = 0.0
+        P /= P.sum(axis=1, keepdims=True)
+        P = sparse.csr_matrix(P)
 
     # ensure columns sum to 1
-    if np.max(np.abs(np.sum(transP, axis=1) - np.ones(transP.shape))) >= 1e-12:
-        print('Problem in rouwen routine!')
-        return None
-    else:
-        return transP.T, dscSp
+    if np.max(np.abs(np.asarray(P.sum(axis=1)).ravel() - 1)) >= 1e-12:
+        raise ValueError('Problem in rouwen routine! Transition ' +
+                         'probabilities do not sum to one.')
+
+    return P.T, dscSp
 
 
 def tauchenhussey(N, mu, rho, sigma, baseSigma):
@@ -84,19 +116,53 @@ def tauchenhussey(N, mu, rho, sigma, baseSigma):
     algorithm, Econometrica (1991, Vol. 59(2), pp. 371-396)
     """
 
-    Z = np.zeros((N, 1))
-    Zprob = np.zeros((N, N))
-    [Z, w] = gaussnorm(N, mu, baseSigma ** 2)
-    for i in range(N):
-        for j in range(N):
-            EZprime = (1 - rho) * mu + rho * Z[i]
-            Zprob[i, j] = (w[j] * st.norm.pdf(Z[j], EZprime, sigma) /
-                           st.norm.pdf(Z[j], mu, baseSigma))
+    Z, Zprob = tauchenhussey_batch(N, mu, rho, sigma, baseSigma)
 
-    for i in range(N):
-        Zprob[i, :] = Zprob[i, :] / sum(Zprob[i, :])
+    return Z[0][np.newaxis, :], Zprob[0]
 
-    return Z.T, Zprob
+
+def tauchenhussey_batch(N, mu, rho, sigma, baseSigma):
+    """
+    Function tauchenhussey_batch
+
+    Purpose:    Tauchen-Hussey approximations for many calibrations of
+                the AR(1) process at once (see tauchenhussey). mu, rho,
+                sigma and baseSigma may be scalars or arrays, which are
+                broadcast against each other. The Gauss-Hermite nodes
+                are computed once and the transition matrices are
+                computed by broadcasting, without Python loops.
+
+    Input:      N         scalar, number of nodes for Z
+                mu        scalar or array, unconditional mean of process
+                rho       scalar or array
+                sigma     scalar or array, std. dev. of epsilons
+                baseSigma scalar or array, std. dev. used to build the
+                          grid (see tauchenhussey)
+
+    Output:     Z       B*N array, nodes for Z in each calibration,
+                        where B is the size of the broadcast inputs
+                Zprob   B*N*N array, transition probabilities in each
+                        calibration, rows are the current state
+    """
+    mu, rho, sigma, baseSigma = (
+        np.atleast_1d(v).astype(float).ravel()[:, np.newaxis, np.newaxis]
+        for v in np.broadcast_arrays(mu, rho, sigma, baseSigma))
+    x0, w0 = gausshermite(N)
+    x0 = x0.ravel()
+    w = w0.ravel() / np.sqrt(np.pi)
+
+    # nodes, Z[b, 0, j] is node j
+    Z = x0 * np.sqrt(2.) * baseSigma + mu
+    EZprime = (1 - rho) * mu + rho * np.swapaxes(Z, 1, 2)
+    # log of w[j] * pdf(Z[j]; EZprime[i], sigma) / pdf(Z[j]; mu, baseSigma)
+    # up to terms that do not depend on j, which drop out when rows are
+    # normalized
+    log_prob = (np.log(w) - 0.5 * ((Z - EZprime) / sigma) ** 2
+                + 0.5 * ((Z - mu) / baseSigma) ** 2)
+    Zprob = np.exp(log_prob - log_prob.max(axis=2, keepdims=True))
+    Zprob /= Zprob.sum(axis=2, keepdims=True)
+
+    return Z[:, 0, :], Zprob
 
 
 def gaussnorm(n, mu, s2):
@@ -116,52 +182,66 @@ def gaussnorm(n, mu, s2):
 
 def gausshermite(n):
     """
-    Gauss Hermite nodes and weights following 'Numerical Recipes for C'
-    """
+    Gauss Hermite nodes and weights for the weight function exp(-x^2)
 
-    MAXIT = 10
-    EPS = 3e-14
-    PIM4 = 0.7511255444649425
+    Nodes and weights come from the Golub-Welsch algorithm (eigenvalues
+    and eigenvectors of the symmetric tridiagonal Jacobi matrix), then
+    one Newton step on the orthonormal Hermite recurrence, as in
+    'Numerical Recipes for C', refines the nodes and gives weights with
+    full relative accuracy. Results are cached for each n, so repeated
+    calls (e.g., from gaussnorm or tauchenhussey in a calibration loop)
+    only copy the stored arrays.
 
-    x = np.zeros((n, 1))
-    w = np.zeros((n, 1))
-
-    m = int((n + 1) / 2)
-    for i in range(m):
-        if i == 0:
-            z = np.sqrt((2. * n + 1) - 1.85575 * (2. * n+1) ** (-0.16667))
-        elif i == 1:
-            z = z - 1.14 * (n ** 0.426) / z
-        elif i == 2:
-            z = 1.86 * z - 0.86 * x[0]
-        elif i == 3:
-            z = 1.91 * z - 0.91 * x[1]
-        else:
-            z = 2 * z - x[i - 1]
-
-        for iter in range(MAXIT):
-            p1 = PIM4
-            p2 = 0.
-            for j in range(n):
-                p3 = p2
-                p2 = p1
-                p1 = (z * np.sqrt(2. / (j + 1)) * p2 - np.sqrt(float(j) /
-                                                               (j + 1)) * p3)
-            pp = np.sqrt(2. * n) * p2
-            z1 = z
-            z = z1 - p1 / pp
-            if np.absolute(z - z1) <= EPS:
-                break
+    n = # nodes
 
-        if iter > MAXIT:
-            error('too many iterations'), end
-        x[i, 0] = z
-        x[n - i - 1, 0] = -z
-        w[i, 0] = 2. / pp / pp
-        w[n - i - 1, 0] = w[i]
+    Returns [x, w], n*1 arrays with nodes in ascending order and
+    weights
+    """
+    x, w = _gausshermite(int(n))
+    return [x.copy(), w.copy()]
 
-    x = x[::-1]
-    return [x, w]
+
+@functools.lru_cache(maxsize=None)
+def _gausshermite(n):
+    """
+    Cached computation of the Gauss Hermite nodes and weights, see
+    gausshermite. The arrays returned are read-only.
+    """
+    if n < 1:
+        raise ValueError('gausshermite requires at least 1 node')
+    PIM4 = 0.7511255444649425
+
+    # Golub-Welsch
+    off_diag = np.sqrt(np.arange(1, n) / 2.)
+    z, v = linalg.eigh_tridiagonal(np.zeros(n), off_diag)
+    w_gw = np.sqrt(np.pi) * v[0] ** 2
+
+    # Newton step with the recurrence for orthonormal Hermite
+    # polynomials, vectorized over nodes. For nodes far in the tails
+    # the polynomials overflow, and the Golub-Welsch values are kept
+    # (the weights there are zero to machine precision).
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        p1 = np.full(n, PIM4)
+        p2 = np.zeros(n)
+        for j in range(n):
+            p3 = p2
+            p2 = p1
+            p1 = (z * np.sqrt(2. / (j + 1)) * p2
+                  - np.sqrt(float(j) / (j + 1)) * p3)
+        pp = np.sqrt(2. * n) * p2
+        z_newton = z - p1 / pp
+        w_newton = 2. / pp / pp
+    ok = np.isfinite(z_newton) & np.isfinite(w_newton) & (w_newton > 0)
+    x = np.where(ok, z_newton, z)
+    w = np.where(ok, w_newton, w_gw)
+
+    # impose symmetry about zero
+    x = (x - x[::-1]) / 2.
+    w = (w + w[::-1]) / 2.
+    x, w = x[:, np.newaxis], w[:, np.newaxis]
+    x.flags.writeable = False
+    w.flags.writeable = False
+    return x, w
 
 
 def integrand(x, sigma_z, sigma, rho, mu, z_j, z_jp1):
@@ -176,7 +256,8 @@ def integrand(x, sigma_z, sigma, rho, mu, z_j, z_jp1):
     return val
 
 
-def addacooper(N, mu, rho, sigma):
+def addacooper(N, mu, rho, sigma, method="gauss", num_nodes=64,
+               check_tol=None):
     """
     Function addacooper
 
@@ -191,6 +272,13 @@ def addacooper(N, mu, rho, sigma):
                 mu    = scalar, unconditional mean of process
                 rho   = scalar, persistence of the AR(1) process
                 sigma = scalar, std. dev. of epsilons
+                method = "gauss" (default) integrates every cell at once
+                        with fixed Gauss-Legendre nodes, "quad" calls
+                        scipy.integrate.quad once per cell
+                num_nodes = scalar, Gauss-Legendre nodes per interval
+                check_tol = if not None, rows 0, N//2 and N-1 are also
+                        found with quad and a ValueError is raised if
+                        any probability differs by more than check_tol
 
     Output:     z_grid = N*1 vector, nodes for Z
                 pi     = N*N matrix, transition probabilities
@@ -217,12 +305,436 @@ def addacooper(N, mu, rho, sigma):
               + mu)
 
     # compute transition probabilities
-    pi = np.empty((N, N))
-    for i in range(N):
+    if method == "quad":
+        pi = _addacooper_quad(N, mu, rho, sigma, sigma_z, z_cutoffs,
+                              range(N))
+    elif method == "gauss":
+        pi = _addacooper_gauss(N, mu, rho, sigma, sigma_z, z_cutoffs,
+                               num_nodes)
+        if check_tol is not None:
+            rows = np.unique([0, N // 2, N - 1])
+            pi_quad = _addacooper_quad(N, mu, rho, sigma, sigma_z,
+                                       z_cutoffs, rows)
+            err = np.abs(pi[rows] - pi_quad).max()
+            if err > check_tol:
+                raise ValueError(
+                    "Gauss-Legendre transition probabilities differ from "
+                    "quad by %g, more than check_tol=%g; increase "
+                    "num_nodes" % (err, check_tol))
+    else:
+        raise ValueError("method must be 'gauss' or 'quad'")
+
+    return z_grid, pi
+
+
+def _addacooper_quad(N, mu, rho, sigma, sigma_z, z_cutoffs, rows):
+    '''
+    Rows of the Adda-Cooper transition matrix, one scipy.integrate.quad
+    call per cell.
+    '''
+    pi = np.empty((len(rows), N))
+    for k, i in enumerate(rows):
         for j in range(N):
             results = integrate.quad(integrand, z_cutoffs[i], z_cutoffs[i + 1],
                                      args=(sigma_z, sigma, rho, mu,
                                            z_cutoffs[j], z_cutoffs[j + 1]))
-            pi[i, j] = (N / np.sqrt(2 * np.pi * sigma_z ** 2)) * results[0]
+            pi[k, j] = (N / np.sqrt(2 * np.pi * sigma_z ** 2)) * results[0]
+
+    return pi
+
+
+def _addacooper_gauss(N, mu, rho, sigma, sigma_z, z_cutoffs, num_nodes,
+                      trunc=10.0, max_block=2 ** 22):
+    '''
+    All cells of the Adda-Cooper transition matrix at once.
+
+    Each interval [z_i, z_{i+1}] gets the same num_nodes Gauss-Legendre
+    nodes and the normal cdf is broadcast over the N + 1 cut-offs, so a
+    row costs num_nodes * (N + 1) cdf evaluations and no Python loop
+    over cells. The two infinite end intervals are cut at trunc
+    standard deviations of z from mu, which drops less than 1e-23 of
+    probability mass for the default. Rows are done in blocks of at
+    most max_block cdf evaluations to bound memory.
+    '''
+    t, w = np.polynomial.legendre.leggauss(num_nodes)
+    lower = np.maximum(z_cutoffs[:-1], mu - trunc * sigma_z)
+    upper = np.minimum(z_cutoffs[1:], mu + trunc * sigma_z)
+    half = (upper - lower) / 2
+    x = ((lower + upper) / 2)[:, np.newaxis] + half[:, np.newaxis] * t
+    # quadrature weight times the density of z at each node
+    dens = (N * half[:, np.newaxis] * w
+            * norm.pdf(x, loc=mu, scale=sigma_z))
+    shift = (z_cutoffs - (1 - rho) * mu) / sigma
+    step = max(1, max_block // (num_nodes * (N + 1)))
+    pi = np.empty((N, N))
+    for start in range(0, N, step):
+        stop = start + step
+        cdf = ndtr(shift - (rho / sigma) * x[start:stop, :, np.newaxis])
+        pi[start:stop] = np.einsum("ik,ikj->ij", dens[start:stop],
+                                   np.diff(cdf, axis=2))
+
+    return pi
+
+
+def tauchen(N, mu, rho, sigma, m=3):
+    """
+    Function tauchen
+
+    Purpose:    Finds a Markov chain whose sample paths
+                approximate those of the AR(1) process
+                    z(t+1) = (1-rho)*mu + rho * z(t) + eps(t+1)
+                where eps are normal with stddev sigma, using an
+                evenly spaced grid that covers m unconditional standard
+                deviations on each side of mu
+
+    Format:     {z_grid, pi} = tauchen(N, mu, rho, sigma, m)
+
+    Input:      N     = scalar, number of nodes for Z
+                mu    = scalar, unconditional mean of process
+                rho   = scalar, persistence of the AR(1) process
+                sigma = scalar, std. dev. of epsilons
+                m     = scalar, number of std. dev. of z covered by
+                        the grid on each side of mu
+
+    Output:     z_grid = N*1 vector, nodes for Z
+                pi     = N*N matrix, transition probabilities, rows are
+                         the current state
+
+    This procedure is an implementation of Tauchen's algorithm,
+    Economics Letters (1986, Vol. 20(2), pp. 177-181)
+    """
+    if N < 2:
+        raise ValueError('tauchen requires at least 2 grid points')
+    sigma_z = sigma / ((1 - rho ** 2) ** (1 / 2))
+    z_grid = np.linspace(mu - m * sigma_z, mu + m * sigma_z, N)
+    half_step = (z_grid[1] - z_grid[0]) / 2
+
+    # transition probabilities, the end cells are open intervals
+    cutoffs = np.concatenate(([-np.inf], z_grid[:-1] + half_step,
+                              [np.inf]))
+    EZprime = (1 - rho) * mu + rho * z_grid[:, np.newaxis]
+    pi = np.diff(ndtr((cutoffs - EZprime) / sigma), axis=1)
 
     return z_grid, pi
+
+
+class ChainMoments(collections.namedtuple(
+        'ChainMoments', ['mean', 'std', 'autocorr'])):
+    """
+    Unconditional mean, standard deviation and first-order
+    autocorrelation of a process.
+    """
+    __slots__ = ()
+
+
+class MarkovChain(collections.namedtuple(
+        'MarkovChain', ['method', 'grid', 'P', 'stationary', 'moments',
+                        'target'])):
+    """
+    A discretized AR(1) process, as returned by discretize_ar1.
+
+    method     - name of the discretization method
+    grid       - N vector of states, in ascending order
+    P          - N*N transition matrix, P[i, j] is the probability of
+                 moving from state i to state j (rows sum to one)
+    stationary - N vector, stationary distribution of the chain
+    moments    - ChainMoments of the chain under its stationary
+                 distribution
+    target     - ChainMoments of the AR(1) process
+    """
+    __slots__ = ()
+
+    @property
+    def moment_errors(self):
+        """
+        ChainMoments holding the chain moments less the AR(1) ones.
+        """
+        return ChainMoments(*(float(m - t) for m, t in
+                              zip(self.moments, self.target)))
+
+    def simulate(self, num_periods, num_agents=None, init=None, seed=None):
+        """
+        Simulated paths of grid values, see simulate_markov.
+        """
+        return simulate_markov(self.P, num_periods, num_agents, init,
+                               seed, grid=self.grid)
+
+
+def stationary_dist(P, method=None, tol=1e-13, max_iter=100000,
+                    pi0=None):
+    '''
+    Stationary (ergodic) distribution of a Markov chain.
+
+    INPUTS:
+    P        - N*N transition matrix, P[i, j] the probability of moving
+               from state i to state j (rows sum to one). May be a numpy
+               array or a scipy.sparse matrix, e.g. rouwen(...,
+               sparse_tol=...)[0].T
+    method   - 'direct' solves pi (P - I) = 0 with one equation replaced
+               by sum(pi) = 1 (with a sparse LU if P is sparse),
+               'power' iterates pi <- pi P, which only needs
+               matrix-vector products. Defaults to 'direct' for a dense
+               P and 'power' for a sparse one
+    tol      - power iteration stops when the sup norm of the change in
+               pi is below tol
+    max_iter - maximum number of power iterations
+    pi0      - starting distribution for the power iteration, uniform
+               if None
+
+    OUTPUT:
+    pi - N vector, stationary distribution (non-negative, sums to one)
+    '''
+    is_sparse = sparse.issparse(P)
+    N = P.shape[0]
+    if method is None:
+        method = 'power' if is_sparse else 'direct'
+
+    if method == 'direct':
+        b = np.zeros(N)
+        b[-1] = 1.0
+        if is_sparse:
+            A = sparse.vstack([(P.T - sparse.identity(N))[:-1],
+                               np.ones((1, N))], format='csc')
+            pi = sparse.linalg.spsolve(A, b)
+        else:
+            A = np.asarray(P).T - np.eye(N)
+            A[-1] = 1.0
+            pi = linalg.solve(A, b)
+    elif method == 'power':
+        PT = sparse.csr_matrix(P.T) if is_sparse else np.asarray(P).T
+        pi = (np.full(N, 1.0 / N) if pi0 is None
+              else np.asarray(pi0, dtype=float) / np.sum(pi0))
+        for _ in range(max_iter):
+            pi_new = PT @ pi
+            pi_new /= pi_new.sum()
+            if np.max(np.abs(pi_new - pi)) < tol:
+                pi = pi_new
+                break
+            pi = pi_new
+        else:
+            raise ValueError('Power iteration did not converge in ' +
+                             str(max_iter) + ' iterations; the chain '
+                             'may be periodic')
+    else:
+        raise ValueError("method must be 'direct' or 'power'")
+
+    pi = np.maximum(pi, 0.0)
+
+    return pi / pi.sum()
+
+
+def _cumulative_rows(P):
+    '''
+    Cumulative transition rows of P laid out for a single searchsorted.
+
+    Nonzero entries of P are kept in CSR order. Row i of the cumulative
+    probabilities is shifted by i, so the flat array is increasing and
+    the next state from state i with uniform draw u is
+    indices[searchsorted(flat, i + u, 'right')].
+    '''
+    P = sparse.csr_matrix(P)
+    P.sort_indices()
+    counts = np.diff(P.indptr)
+    if np.any(counts == 0):
+        raise ValueError('Every row of the transition matrix needs a '
+                         'nonzero probability')
+    rows = np.repeat(np.arange(P.shape[0]), counts)
+    cum = np.cumsum(P.data)
+    cum -= np.repeat(np.concatenate(([0.0], cum))[P.indptr[:-1]], counts)
+    cum /= np.repeat(cum[P.indptr[1:] - 1], counts)
+    # the last entry of each row is exactly one, so u < 1 never passes it
+    cum[P.indptr[1:] - 1] = 1.0
+
+    return cum + rows, P.indices.astype(np.int32), P.indptr
+
+
+def iter_simulate_markov(P, num_periods, num_agents=1, chunk_periods=1000,
+                         init=None, seed=None):
+    '''
+    Simulate a panel of Markov chain paths in chunks of periods.
+
+    All agents move at once each period: the uniform draws for a chunk
+    come from one call to a seeded numpy Generator, and the next states
+    are found with one searchsorted on the precomputed cumulative
+    transition rows. Only one chunk is held in memory, so long panels
+    can be streamed to disk or summarized on the fly. The chunks
+    concatenated along the first axis are exactly the output of
+    simulate_markov with the same arguments.
+
+    INPUTS:
+    P             - N*N transition matrix, rows are the current state
+                    (dense or scipy.sparse)
+    num_periods   - number of periods, including the initial one
+    num_agents    - number of independent paths
+    chunk_periods - number of periods in each chunk
+    init          - initial states: None draws them from the stationary
+                    distribution, an integer starts every agent in that
+                    state, an array gives one state per agent
+    seed          - seed or numpy Generator
+
+    OUTPUT (yielded):
+    states - chunk_periods*num_agents int32 array of state indices
+             (the last chunk may be shorter)
+    '''
+    rng = np.random.default_rng(seed)
+    flat, indices, indptr = _cumulative_rows(P)
+    N = P.shape[0]
+    if init is None:
+        cdf = np.cumsum(stationary_dist(P))
+        state = np.minimum(np.searchsorted(cdf / cdf[-1],
+                                           rng.random(num_agents),
+                                           side='right'), N - 1)
+    else:
+        state = np.broadcast_to(np.asarray(init), (num_agents,))
+    state = state.astype(np.int32)
+    if np.any((state < 0) | (state >= N)):
+        raise ValueError('initial states must be between 0 and N - 1')
+
+    for start in range(0, num_periods, chunk_periods):
+        T = min(chunk_periods, num_periods - start)
+        out = np.empty((T, num_agents), dtype=np.int32)
+        u = rng.random((T, num_agents))
+        for t in range(T):
+            if start + t > 0:
+                pos = np.searchsorted(flat, state + u[t], side='right')
+                # guard against rounding in i + u
+                pos = np.minimum(pos, indptr[state + 1] - 1)
+                state = indices[pos]
+            out[t] = state
+        yield out
+
+
+def simulate_markov(P, num_periods, num_agents=None, init=None, seed=None,
+                    grid=None, chunk_periods=1000):
+    '''
+    Simulate Markov chain paths, vectorized across agents.
+
+    INPUTS:
+    P             - N*N transition matrix, rows are the current state
+    num_periods   - number of periods, including the initial one
+    num_agents    - number of independent paths, None for a single path
+    init          - initial states (see iter_simulate_markov)
+    seed          - seed or numpy Generator
+    grid          - if not None, return grid values instead of state
+                    indices
+    chunk_periods - periods drawn per call to the Generator
+
+    OUTPUT:
+    path - num_periods*num_agents array of state indices (or grid
+           values), or a num_periods vector if num_agents is None
+    '''
+    out = np.concatenate(list(iter_simulate_markov(
+        P, num_periods, 1 if num_agents is None else num_agents,
+        chunk_periods, init, seed)))
+    if num_agents is None:
+        out = out[:, 0]
+    if grid is not None:
+        out = np.asarray(grid).ravel()[out]
+
+    return out
+
+
+def _chain_moments(grid, P, stationary):
+    '''
+    ChainMoments of a Markov chain started from its stationary
+    distribution.
+    '''
+    mean = stationary @ grid
+    var = stationary @ (grid - mean) ** 2
+    cov = stationary @ ((grid - mean) * (P @ (grid - mean)))
+    autocorr = cov / var if var > 0 else np.nan
+
+    return ChainMoments(float(mean), float(np.sqrt(var)), float(autocorr))
+
+
+def discretize_ar1(method, N, mu, rho, sigma):
+    """
+    Function discretize_ar1
+
+    Purpose:    Single entry point for the discretization methods in
+                this module. Finds a Markov chain approximating the
+                AR(1) process
+                    z(t+1) = (1-rho)*mu + rho * z(t) + eps(t+1)
+                where eps are normal with stddev sigma, and returns it
+                in one orientation whatever the method.
+
+                'rouwenhorst' - rouwen with the grid spanning
+                                sigma_z * sqrt(N - 1) on each side of mu,
+                                which matches the variance of z exactly
+                'tauchenhussey' - tauchenhussey with
+                                baseSigma = w * sigma + (1 - w) * sigma_z,
+                                w = 0.5 + rho / 4
+                'addacooper'  - addacooper
+                'tauchen'     - tauchen with m = 3
+
+                Chains are cached on (method, N, mu, rho, sigma), so
+                repeated calls, e.g. by a DP solver inside a
+                calibration loop, return the stored chain. Its arrays
+                are read-only; copy them before modifying. Use
+                discretize_ar1.cache_clear() to empty the cache.
+
+    Input:      method = string, one of the methods above
+                N      = scalar, number of nodes
+                mu     = scalar, unconditional mean of process
+                rho    = scalar, persistence of the AR(1) process
+                sigma  = scalar, std. dev. of epsilons
+
+    Output:     chain  = MarkovChain with the grid (N vector), the
+                         transition matrix P (rows are the current
+                         state), the stationary distribution and the
+                         chain and target moments
+    """
+    method = method.lower().replace('-', '').replace('_', '')
+    if method not in _DISCRETIZERS:
+        raise ValueError('method must be one of ' +
+                         ', '.join(sorted(_DISCRETIZERS)))
+    if not -1 < rho < 1:
+        raise ValueError('discretize_ar1 requires -1 < rho < 1')
+
+    return _discretize_ar1(method, int(N), float(mu), float(rho),
+                           float(sigma))
+
+
+def _rouwenhorst_chain(N, mu, rho, sigma):
+    sigma_z = sigma / ((1 - rho ** 2) ** (1 / 2))
+    step = 2 * sigma_z / np.sqrt(N - 1)
+    transP, grid = rouwen(rho, mu, step, N)
+    return grid, transP.T
+
+
+def _tauchenhussey_chain(N, mu, rho, sigma):
+    sigma_z = sigma / ((1 - rho ** 2) ** (1 / 2))
+    wgt = 0.5 + rho / 4
+    baseSigma = wgt * sigma + (1 - wgt) * sigma_z
+    Z, Zprob = tauchenhussey_batch(N, mu, rho, sigma, baseSigma)
+    return Z[0], Zprob[0]
+
+
+_DISCRETIZERS = {
+    'rouwenhorst': _rouwenhorst_chain,
+    'tauchenhussey': _tauchenhussey_chain,
+    'addacooper': addacooper,
+    'tauchen': tauchen,
+}
+
+
+@functools.lru_cache(maxsize=128)
+def _discretize_ar1(method, N, mu, rho, sigma):
+    '''
+    Cached computation of the chain, see discretize_ar1.
+    '''
+    grid, P = _DISCRETIZERS[method](N, mu, rho, sigma)
+    grid = np.asarray(grid, dtype=float).ravel()
+    P = np.asarray(P, dtype=float)
+    stationary = stationary_dist(P)
+    moments = _chain_moments(grid, P, stationary)
+    sigma_z = sigma / ((1 - rho ** 2) ** (1 / 2))
+    target = ChainMoments(mu, sigma_z, rho)
+    for a in (grid, P, stationary):
+        a.flags.writeable = False
+
+    return MarkovChain(method, grid, P, stationary, moments, target)
+
+
+discretize_ar1.cache_clear = _discretize_ar1.cache_clear
+discretize_ar1.cache_info = _discretize_ar1.cache_info
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+import ar1_approx
+
+# tests of the AR(1) discretizations: transition matrices are
+# stochastic, the chains have (close to) the moments of the AR(1)
+# process, and the vectorized, batched and sparse versions agree
+
+MU, RHO, SIGMA = 0.5, 0.9, 0.2
+SIGMA_Z = SIGMA / np.sqrt(1 - RHO ** 2)
+
+
+def test_rouwen_matches_recursion():
+    '''
+    The O(N^2) construction against the O(N^3) recursion in
+    Rouwenhorst (1995)
+    '''
+    N = 9
+    p = q = (RHO + 1) / 2
+    P = np.array([[p, 1 - p], [1 - q, q]])
+    for n in range(3, N + 1):
+        Z = np.zeros((n, n))
+        Z[:-1, :-1] += p * P
+        Z[:-1, 1:] += (1 - p) * P
+        Z[1:, :-1] += (1 - q) * P
+        Z[1:, 1:] += q * P
+        Z[1:-1] /= 2
+        P = Z
+    transP, grid = ar1_approx.rouwen(RHO, MU, 0.3, N)
+    np.testing.assert_allclose(transP.T, P, atol=1e-14)
+    np.testing.assert_allclose(grid, MU + 0.3 * (np.arange(N) - 4))
+
+
+def test_rouwen_sparse_matches_dense():
+    dense = ar1_approx.rouwen(0.99, MU, 0.3, 51)[0]
+    sparse = ar1_approx.rouwen(0.99, MU, 0.3, 51, sparse_tol=1e-14)[0]
+    np.testing.assert_allclose(sparse.toarray(), dense, atol=1e-12)
+    np.testing.assert_allclose(np.asarray(sparse.sum(axis=0)).ravel(), 1)
+
+
+def test_gausshermite_integrates_polynomials():
+    x, w = ar1_approx.gausshermite(10)
+    x, w = x.ravel(), w.ravel()
+    # int x^k exp(-x^2) dx = Gamma((k + 1) / 2) for even k, exact up
+    # to degree 2n - 1
+    assert w.sum() == pytest.approx(np.sqrt(np.pi))
+    assert w @ x ** 2 == pytest.approx(np.sqrt(np.pi) / 2)
+    assert w @ x ** 18 == pytest.approx(34459425 / 512 * np.sqrt(np.pi))
+    assert w @ x ** 7 == pytest.approx(0.0, abs=1e-10)
+
+
+def test_tauchenhussey_batch_matches_single():
+    rhos = np.array([0.5, 0.9, 0.95])
+    Z, Zprob = ar1_approx.tauchenhussey_batch(7, MU, rhos, SIGMA, SIGMA)
+    for i, rho in enumerate(rhos):
+        z, zprob = ar1_approx.tauchenhussey(7, MU, rho, SIGMA, SIGMA)
+        np.testing.assert_allclose(Z[i], np.ravel(z))
+        np.testing.assert_allclose(Zprob[i], zprob)
+
+
+def test_addacooper_gauss_matches_quad():
+    z_gauss, P_gauss = ar1_approx.addacooper(7, MU, RHO, SIGMA)
+    z_quad, P_quad = ar1_approx.addacooper(7, MU, RHO, SIGMA,
+                                           method='quad')
+    np.testing.assert_allclose(z_gauss, z_quad)
+    np.testing.assert_allclose(P_gauss, P_quad, atol=1e-8)
+
+
+# Tauchen's evenly spaced grid overstates the std with few nodes
+@pytest.mark.parametrize('method,tol', [('rouwenhorst', 1e-10),
+                                        ('tauchenhussey', 0.01),
+                                        ('addacooper', 0.03),
+                                        ('tauchen', 0.1)])
+def test_chain_moments(method, tol):
+    chain = ar1_approx.discretize_ar1(method, 11, MU, RHO, SIGMA)
+    np.testing.assert_allclose(chain.P.sum(axis=1), 1)
+    assert np.all(chain.P >= 0)
+    assert chain.target == pytest.approx((MU, SIGMA_Z, RHO))
+    # the Rouwenhorst chain matches all three moments exactly
+    assert chain.moments.mean == pytest.approx(MU, abs=tol)
+    assert chain.moments.std == pytest.approx(SIGMA_Z, rel=tol)
+    assert chain.moments.autocorr == pytest.approx(RHO, rel=tol)
+
+
+def test_stationary_dist_methods_agree():
+    chain = ar1_approx.discretize_ar1('tauchen', 15, MU, RHO, SIGMA)
+    direct = ar1_approx.stationary_dist(chain.P, method='direct')
+    power = ar1_approx.stationary_dist(chain.P, method='power')
+    np.testing.assert_allclose(direct, power, atol=1e-10)
+    np.testing.assert_allclose(direct @ chain.P, direct, atol=1e-14)
+    transP = ar1_approx.rouwen(RHO, MU, 0.3, 15, sparse_tol=1e-14)[0]
+    np.testing.assert_allclose(
+        ar1_approx.stationary_dist(transP.T, method='direct'),
+        ar1_approx.stationary_dist(transP.T.toarray()), atol=1e-10)
+
+
+def test_simulated_frequencies_match_stationary_dist():
+    chain = ar1_approx.discretize_ar1('rouwenhorst', 5, MU, RHO, SIGMA)
+    path = ar1_approx.simulate_markov(chain.P, 2000, num_agents=200,
+                                      seed=0)
+    np.testing.assert_allclose(
+        np.bincount(path[100:].ravel(), minlength=5) / path[100:].size,
+        chain.stationary, atol=0.01)
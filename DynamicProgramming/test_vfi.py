@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+import ar1_approx
+import vfi
+
+# tests of solve_vfi on an income fluctuation problem, where utility is
+# concave and the savings policy is nondecreasing in assets, so every
+# pruned search should find the same solution as the full search
+
+BETA = 0.95
+R_INT = 0.03
+GAMMA = 2.0
+ASSET_GRID = np.linspace(0.0, 10.0, 80)
+MU, RHO, SIGMA = 0.0, 0.9, 0.1
+
+
+def reward(z, a, a_prime):
+    '''
+    CRRA utility of consumption, -inf if consumption is not positive
+    '''
+    c = (1 + R_INT) * a + np.exp(z) - a_prime
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = c ** (1 - GAMMA) / (1 - GAMMA)
+    return np.where(c > 0, u, -np.inf)
+
+
+@pytest.fixture(scope='module')
+def chain():
+    return ar1_approx.discretize_ar1('rouwenhorst', 5, MU, RHO, SIGMA)
+
+
+@pytest.fixture(scope='module')
+def full(chain):
+    return vfi.solve_vfi(reward, ASSET_GRID, chain, BETA, tol=1e-10)
+
+
+def test_full_search_solves_bellman_equation(chain, full):
+    assert full.converged
+    # TV = V at the solution, and the policy attains the max
+    R = reward(chain.grid[:, None, None], ASSET_GRID[None, :, None],
+               ASSET_GRID[None, None, :])
+    obj = R + BETA * (chain.P @ full.V)[:, None, :]
+    np.testing.assert_allclose(obj.max(axis=2), full.V, atol=1e-8)
+    np.testing.assert_array_equal(obj.argmax(axis=2), full.policy_index)
+    np.testing.assert_array_equal(ASSET_GRID[full.policy_index],
+                                  full.policy)
+    assert np.all(np.diff(full.policy_index, axis=1) >= 0)
+
+
+@pytest.mark.parametrize('search', ['monotone', 'concave',
+                                    'monotone_concave'])
+def test_pruned_search_matches_full(chain, full, search):
+    sol = vfi.solve_vfi(reward, ASSET_GRID, chain, BETA, search=search,
+                        tol=1e-10)
+    assert sol.converged
+    assert sol.iterations == full.iterations
+    np.testing.assert_array_equal(sol.policy_index, full.policy_index)
+    np.testing.assert_allclose(sol.V, full.V, atol=1e-12)
+
+
+def test_small_blocks_match_one_block(chain, full):
+    sol = vfi.solve_vfi(reward, ASSET_GRID, chain, BETA, tol=1e-10,
+                        max_block=1000)
+    np.testing.assert_array_equal(sol.policy_index, full.policy_index)
+    np.testing.assert_allclose(sol.V, full.V, atol=1e-12)
+
+
+def test_array_reward_matches_callable(chain, full):
+    R = reward(chain.grid[:, None, None], ASSET_GRID[None, :, None],
+               ASSET_GRID[None, None, :])
+    sol = vfi.solve_vfi(R, ASSET_GRID, chain, BETA, tol=1e-10)
+    np.testing.assert_array_equal(sol.policy_index, full.policy_index)
+    np.testing.assert_allclose(sol.V, full.V, atol=1e-12)
+
+
+def test_howard_steps_reach_the_same_solution(chain, full):
+    sol = vfi.solve_vfi(reward, ASSET_GRID, chain, BETA, howard_steps=20,
+                        search='monotone_concave', tol=1e-10)
+    assert sol.converged
+    assert sol.iterations < full.iterations
+    np.testing.assert_array_equal(sol.policy_index, full.policy_index)
+    np.testing.assert_allclose(sol.V, full.V, atol=1e-8)
+
+
+def test_raw_discretizer_outputs(chain, full):
+    sigma_z = SIGMA / np.sqrt(1 - RHO ** 2)
+    step = 2 * sigma_z / np.sqrt(4)
+    for raw in [ar1_approx.rouwen(RHO, MU, step, 5),
+                ar1_approx.rouwen(RHO, MU, step, 5, sparse_tol=1e-14),
+                (chain.grid, chain.P)]:
+        sol = vfi.solve_vfi(reward, ASSET_GRID, raw, BETA, tol=1e-10)
+        np.testing.assert_array_equal(sol.policy_index, full.policy_index)
+        np.testing.assert_allclose(sol.V, full.V, atol=1e-10)
+    for raw in [ar1_approx.tauchenhussey(5, MU, RHO, SIGMA, SIGMA),
+                ar1_approx.addacooper(5, MU, RHO, SIGMA),
+                ar1_approx.tauchen(5, MU, RHO, SIGMA)]:
+        assert vfi.solve_vfi(reward, ASSET_GRID, raw, BETA).converged
+
+
+def test_bad_chain_is_rejected(chain):
+    with pytest.raises(ValueError, match='n_z\\*n_z'):
+        vfi.solve_vfi(reward, ASSET_GRID, (chain.grid, chain.P[:, :-1]),
+                      BETA)
+    with pytest.raises(ValueError, match='sum to'):
+        # rouwen's column-stochastic matrix passed as (grid, P)
+        transP = ar1_approx.rouwen(RHO, MU, 0.1, 5)[0]
+        vfi.solve_vfi(reward, ASSET_GRID, (chain.grid, transP), BETA)
@@ -0,0 +1,305 @@
+import collections
+import numpy as np
+
+# value function iteration (VFI) on a grid of assets and a Markov chain
+# for the shock
+    # EV[z, a'] = beta * sum_z' P[z, z'] V[z', a'], once per iteration
+    # TV[z, a] = max_a' reward(z, a, a') + EV[z, a'], for all states at
+    # once, in blocks that bound memory
+    # optionally skip choices that monotonicity or concavity rule out
+    # optionally follow each maximization with Howard steps that
+    # iterate on the value of the current policy without maximizing
+    # stop when the sup norm distance between V and TV is below tol
+
+
+class VFISolution(collections.namedtuple(
+        'VFISolution', ['V', 'policy', 'policy_index', 'iterations',
+                        'converged', 'dist'])):
+    """
+    Solution of a dynamic programming problem, as returned by solve_vfi.
+
+    V            - n_z*n_a matrix, value function, V[j, i] is the value
+                   at shock grid[j] and asset asset_grid[i]
+    policy       - n_z*n_a matrix, savings a' chosen at each state
+    policy_index - n_z*n_a matrix, index of policy in asset_grid
+    iterations   - number of maximization steps
+    converged    - whether the distance fell below tol
+    dist         - sup norm distance between the last two value
+                   functions
+    """
+    __slots__ = ()
+
+
+SEARCH_METHODS = ('full', 'monotone', 'concave', 'monotone_concave')
+
+
+def _chain_parts(chain):
+    '''
+    The grid and transition matrix (rows are the current state) of a
+    chain, given as a MarkovChain from ar1_approx.discretize_ar1 or as
+    the output of one of the discretizers in ar1_approx:
+    (transP, grid) from rouwen, whose columns are the current state,
+    or (grid, P) from tauchenhussey, addacooper or tauchen.
+    '''
+    if hasattr(chain, 'P'):
+        grid, P = chain.grid, chain.P
+    else:
+        first, second = chain
+        if np.ndim(first) == 2 and np.ndim(second) == 1:
+            # rouwen
+            P, grid = first.T, second
+        else:
+            grid, P = first, second
+    grid = np.asarray(grid, dtype=float).ravel()
+    n_z = grid.shape[0]
+    if P.ndim != 2 or P.shape != (n_z, n_z):
+        raise ValueError('the transition matrix must be n_z*n_z for a grid '
+                         'of n_z shocks, got shape ' + str(P.shape) +
+                         ' for ' + str(n_z) + ' shocks')
+    if not np.allclose(np.asarray(P.sum(axis=1)).ravel(), 1.0, atol=1e-8):
+        raise ValueError('the rows of the transition matrix must sum to '
+                         'one (P[j, l] is the probability of moving from '
+                         'shock j to shock l)')
+    return grid, P
+
+
+def _reward_lookup(reward, asset_grid, z_grid, max_block):
+    '''
+    A function giving the reward at arrays of (shock, asset, choice)
+    indices. A callable reward is evaluated once on the whole grid and
+    stored if it takes at most max_block elements, and on demand
+    otherwise. NaN rewards count as infeasible (-inf).
+    '''
+    n_a = asset_grid.shape[0]
+    n_z = z_grid.shape[0]
+    if not callable(reward):
+        table = np.asarray(reward, dtype=float)
+        if table.shape != (n_z, n_a, n_a):
+            raise ValueError('reward array must have shape (n_z, n_a, n_a)')
+    elif n_z * n_a * n_a <= max_block:
+        table = reward(z_grid[:, np.newaxis, np.newaxis],
+                       asset_grid[np.newaxis, :, np.newaxis],
+                       asset_grid[np.newaxis, np.newaxis, :])
+        table = np.broadcast_to(table, (n_z, n_a, n_a)).astype(float)
+    else:
+        def lookup(zi, ai, ki):
+            r = np.asarray(reward(z_grid[zi], asset_grid[ai],
+                                  asset_grid[ki]), dtype=float)
+            return np.where(np.isnan(r), -np.inf, r)
+        return lookup
+    table = np.where(np.isnan(table), -np.inf, table)
+
+    def lookup(zi, ai, ki):
+        return table[zi, ai, ki]
+    return lookup
+
+
+def _search_full(R, EV, zi, ai, max_block):
+    '''
+    Maximize over every choice, for blocks of states at a time.
+    '''
+    n_k = EV.shape[1]
+    k = np.arange(n_k)[np.newaxis, :]
+    policy = np.empty(zi.shape[0], dtype=np.intp)
+    value = np.empty(zi.shape[0])
+    rows = max(1, max_block // n_k)
+    for start in range(0, zi.shape[0], rows):
+        s = slice(start, start + rows)
+        z, a = zi[s, np.newaxis], ai[s, np.newaxis]
+        obj = R(z, a, k) + EV[z, k]
+        policy[s] = np.argmax(obj, axis=1)
+        value[s] = np.take_along_axis(obj, policy[s, np.newaxis],
+                                      axis=1)[:, 0]
+    return policy, value
+
+
+def _search_ranges(R, EV, zi, ai, lo, hi, max_block):
+    '''
+    Maximize over the choices lo, ..., hi of each state. The candidate
+    choices of all states are laid out end to end and each state's
+    maximum is found with a segmented reduction, in blocks of about
+    max_block candidates.
+    '''
+    widths = hi - lo + 1
+    policy = np.empty(zi.shape[0], dtype=np.intp)
+    value = np.empty(zi.shape[0])
+    cum_widths = np.cumsum(widths)
+    start = 0
+    while start < zi.shape[0]:
+        done = cum_widths[start - 1] if start > 0 else 0
+        stop = np.searchsorted(cum_widths, done + max_block, 'right')
+        stop = max(stop, start + 1)
+        s = slice(start, stop)
+        w = widths[s]
+        seg_start = np.cumsum(w) - w
+        # position of each candidate within its state's range
+        offset = np.arange(w.sum()) - np.repeat(seg_start, w)
+        z = np.repeat(zi[s], w)
+        k = np.repeat(lo[s], w) + offset
+        obj = R(z, np.repeat(ai[s], w), k) + EV[z, k]
+        best = np.maximum.reduceat(obj, seg_start)
+        # first candidate attaining the maximum
+        first = np.where(obj == np.repeat(best, w), offset, w.max())
+        policy[s] = lo[s] + np.minimum.reduceat(first, seg_start)
+        value[s] = best
+        start = stop
+    return policy, value
+
+
+def _search_bisect(R, EV, zi, ai, lo, hi):
+    '''
+    Maximize a single-peaked objective over the choices lo, ..., hi of
+    each state by bisection on the sign of its first difference, with
+    all states in one batch.
+    '''
+    lo = lo.copy()
+    hi = hi.copy()
+    active = np.flatnonzero(lo < hi)
+    while active.size > 0:
+        z, a = zi[active], ai[active]
+        mid = (lo[active] + hi[active]) // 2
+        rising = (R(z, a, mid + 1) + EV[z, mid + 1]
+                  > R(z, a, mid) + EV[z, mid])
+        lo[active] = np.where(rising, mid + 1, lo[active])
+        hi[active] = np.where(rising, hi[active], mid)
+        active = active[lo[active] < hi[active]]
+    return lo, R(zi, ai, lo) + EV[zi, lo]
+
+
+def _search_monotone(R, EV, n_a, concave, max_block):
+    '''
+    Maximize with a policy that is nondecreasing in assets for each
+    shock, by divide and conquer: solve the middle asset of a range of
+    assets, then the lower half only over choices up to its policy and
+    the upper half only over choices from its policy on. All ranges at
+    the same depth, for every shock, are solved as one batch, so there
+    are about log2(n_a) batches.
+    '''
+    n_z, n_k = EV.shape
+    policy = np.empty((n_z, n_a), dtype=np.intp)
+    value = np.empty((n_z, n_a))
+    # pending ranges of assets [a_lo, a_hi] with choices [k_lo, k_hi]
+    z = np.arange(n_z)
+    a_lo = np.zeros(n_z, dtype=np.intp)
+    a_hi = np.full(n_z, n_a - 1, dtype=np.intp)
+    k_lo = np.zeros(n_z, dtype=np.intp)
+    k_hi = np.full(n_z, n_k - 1, dtype=np.intp)
+    while z.size > 0:
+        mid = (a_lo + a_hi) // 2
+        if concave:
+            pol, val = _search_bisect(R, EV, z, mid, k_lo, k_hi)
+        else:
+            pol, val = _search_ranges(R, EV, z, mid, k_lo, k_hi,
+                                      max_block)
+        policy[z, mid] = pol
+        value[z, mid] = val
+        left = mid > a_lo
+        right = mid < a_hi
+        z = np.concatenate((z[left], z[right]))
+        a_lo, a_hi = (np.concatenate((a_lo[left], mid[right] + 1)),
+                      np.concatenate((mid[left] - 1, a_hi[right])))
+        k_lo, k_hi = (np.concatenate((k_lo[left], pol[right])),
+                      np.concatenate((pol[left], k_hi[right])))
+    return policy.ravel(), value.ravel()
+
+
+def solve_vfi(reward, asset_grid, chain, beta, V0=None, search='full',
+              howard_steps=0, tol=1e-8, max_iter=3000, max_block=2**22):
+    '''
+    Solves the dynamic programming problem
+
+        V(z, a) = max_a' reward(z, a, a') + beta * E[V(z', a') | z]
+
+    by value function iteration, where a and the choice a' are on
+    asset_grid and z follows a Markov chain. Each iteration is a few
+    batched NumPy operations over all (shock, asset, choice) triples,
+    in blocks of at most about max_block elements.
+
+    INPUTS:
+    reward       - callable reward(z, a, a_prime) that broadcasts over
+                   arrays of shocks, assets and choices, or an
+                   n_z*n_a*n_a array with reward[j, i, k] the reward at
+                   shock j and asset i of choosing asset k. Infeasible
+                   choices get -inf (or NaN); every state needs at
+                   least one feasible choice. A callable reward is
+                   stored on the whole grid if that takes at most
+                   max_block elements, otherwise it is evaluated on
+                   each block.
+    asset_grid   - n_a vector of assets, in ascending order
+    chain        - the shock process, a MarkovChain from
+                   ar1_approx.discretize_ar1 (which takes the
+                   Rouwenhorst, Tauchen-Hussey, Adda-Cooper and Tauchen
+                   methods), the output of ar1_approx.rouwen,
+                   tauchenhussey, addacooper or tauchen, or a
+                   (grid, P) pair with P[j, l] the probability of
+                   moving from shock j to shock l. P may be a
+                   scipy.sparse matrix.
+    beta         - discount factor
+    V0           - n_z*n_a initial guess, zeros if None
+    search       - choices searched at each state:
+                   'full'     - all of them
+                   'monotone' - assumes the policy is nondecreasing in
+                                assets for each shock, see
+                                _search_monotone
+                   'concave'  - assumes the objective is single-peaked
+                                in the choice, which is found by
+                                bisection
+                   'monotone_concave' - both
+                   The pruned searches give the same answer as 'full'
+                   when their assumptions hold (e.g., with concave
+                   utility and a concave initial guess).
+    howard_steps - number of Howard improvement steps after each
+                   maximization, which update V with the value of the
+                   current policy without searching
+    tol          - convergence tolerance on the sup norm of TV - V
+    max_iter     - maximum number of maximization steps
+    max_block    - bound on the number of elements evaluated at once
+
+    OUTPUT:
+    solution     - VFISolution with the value function, policy and
+                   convergence information
+    '''
+    if search not in SEARCH_METHODS:
+        raise ValueError('search must be one of ' +
+                         ', '.join(SEARCH_METHODS))
+    asset_grid = np.asarray(asset_grid, dtype=float).ravel()
+    z_grid, P = _chain_parts(chain)
+    n_a = asset_grid.shape[0]
+    n_z = z_grid.shape[0]
+    R = _reward_lookup(reward, asset_grid, z_grid, max_block)
+    V = (np.zeros((n_z, n_a)) if V0 is None
+         else np.array(V0, dtype=float).reshape(n_z, n_a))
+    # states in the order of V.ravel()
+    zi = np.repeat(np.arange(n_z), n_a)
+    ai = np.tile(np.arange(n_a), n_z)
+    all_lo = np.zeros(n_z * n_a, dtype=np.intp)
+    all_hi = np.full(n_z * n_a, n_a - 1, dtype=np.intp)
+
+    dist = np.inf
+    iteration = 0
+    while dist > tol and iteration < max_iter:
+        iteration += 1
+        EV = beta * np.asarray(P @ V)
+        if search == 'full':
+            policy, TV = _search_full(R, EV, zi, ai, max_block)
+        elif search == 'concave':
+            policy, TV = _search_bisect(R, EV, zi, ai, all_lo, all_hi)
+        else:
+            policy, TV = _search_monotone(
+                R, EV, n_a, search == 'monotone_concave', max_block)
+        if not np.all(np.isfinite(TV)):
+            raise ValueError('some states have no feasible choice')
+        TV = TV.reshape(n_z, n_a)
+        dist = np.max(np.abs(TV - V))
+        V = TV
+        if howard_steps > 0 and dist > tol:
+            reward_policy = R(zi, ai, policy).reshape(n_z, n_a)
+            policy_2d = policy.reshape(n_z, n_a)
+            rows = np.arange(n_z)[:, np.newaxis]
+            for _ in range(howard_steps):
+                V = reward_policy + beta * np.asarray(P @ V)[rows,
+                                                             policy_2d]
+
+    policy_index = policy.reshape(n_z, n_a)
+    return VFISolution(V, asset_grid[policy_index], policy_index,
+                       iteration, bool(dist <= tol), float(dist))
@@ -1,40 +1,296 @@
+import time
+import numpy as np
 import necessary_equations as ne
 import scipy.optimize as opt
 
 # then, let's write a function for the SS algorithm
     # guess r -> w
-    # solve for b2 and b3 from hh_foc
-    # use MC with b2, b3, n -> K, L
+    # solve for b_2, ..., b_S from hh_foc
+    # use MC with b_2, ..., b_S, n -> K, L
     # use K, L in get_r -> r'
     # check if r' = guess of r
     # loop again if not
 
 
-def SS_solver(r_guess, b_guesses, n, alpha, delta, A, sigma, beta):
+def solve_b(r, b_guess, n, alpha, delta, A, sigma, beta):
     '''
-    Solves for the SS of the economy
+    Solve the household problem at interest rate r, starting from
+    b_guess. Uses Newton's method on the banded Jacobian (ne.solve_hh),
+    retries from zero savings (where consumption is always positive)
+    if b_guess is infeasible at r, and falls back to opt.root if
+    neither converges.
+
+    Returns the savings, the Euler errors, the wage and whether the
+    household problem was solved.
     '''
-    xi = 0.8
-    tol = 1e-8
-    max_iter = 500
-    dist = 7
-    iter = 0
-    r = r_guess
-    b_sp1 = b_guesses
-    while (dist > tol) & (iter < max_iter):
-        w = ne.get_w(r, (alpha, delta, A))
-        sol = opt.root(
-            ne.hh_foc, b_sp1,
-            args=(r, w, n, (sigma, beta)))
-        b_sp1 = sol.x
-        euler_errors = sol.fun
+    w = ne.get_w(r, (alpha, delta, A))
+    b_guess = np.asarray(b_guess, dtype=float)
+    for b_init in (b_guess, np.zeros_like(b_guess)):
+        b_sp1, euler_errors, ok = ne.solve_hh(
+            r, w, n, (sigma, beta), b_init)
+        if ok:
+            return b_sp1, euler_errors, w, True
+    sol = opt.root(
+        ne.hh_foc, b_guess, jac=ne.hh_foc_jac,
+        args=(r, w, n, (sigma, beta)))
+    ok = bool(sol.success and np.all(np.isfinite(sol.fun)))
+    return sol.x, sol.fun, w, ok
+
+
+class _ExcessDemand:
+    '''
+    The map r -> r' from the SS algorithm, recording the history of
+    evaluations and warm starting each household solve from the
+    savings found at the previous evaluation.
+    '''
+
+    def __init__(self, b_guesses, n, alpha, delta, A, sigma, beta):
+        self.b_sp1 = np.asarray(b_guesses, dtype=float)
+        self.n = n
+        self.params = (alpha, delta, A, sigma, beta)
+        self.history = []
+        self.start = time.perf_counter()
+
+    def r_prime(self, r):
+        alpha, delta, A, sigma, beta = self.params
+        b_sp1, euler_errors, w, ok = solve_b(
+            r, self.b_sp1, self.n, alpha, delta, A, sigma, beta)
         K = ne.get_K(b_sp1)
-        L = ne.get_L(n)
-        r_prime = ne.get_r(K, L, (alpha, delta, A))
-        dist = (r - r_prime) ** 2
-        iter += 1
+        L = ne.get_L(self.n)
+        if ok and K > 0:
+            r_prime = ne.get_r(K, L, (alpha, delta, A))
+            self.b_sp1 = b_sp1
+        else:
+            # no steady state capital stock at r
+            r_prime = np.nan
+        self.history.append({
+            'iter': len(self.history), 'r': r, 'r_prime': r_prime,
+            'resid': abs(r - r_prime),
+            'euler_error': np.max(np.abs(euler_errors)),
+            'time': time.perf_counter() - self.start})
+        return r_prime
+
+    def resid(self, r):
+        return r - self.r_prime(r)
+
+
+def _damped(ed, r, xi, tol, max_iter):
+    '''
+    Damped fixed point iteration r <- xi * r + (1 - xi) * r'
+    '''
+    for _ in range(max_iter):
+        r_prime = ed.r_prime(r)
+        if abs(r - r_prime) < tol:
+            return r, True
+        if not np.isfinite(r_prime):
+            return r, False
         r = xi * r + (1 - xi) * r_prime
-    success = iter < max_iter
+    return r, False
+
+
+def _anderson(ed, r, xi, tol, max_iter, depth=1):
+    '''
+    Anderson acceleration of the fixed point iteration r <- r', mixing
+    the last depth iterates. r is a scalar, so more than one past
+    iterate would leave the mixing weights underdetermined, and with
+    depth=1 this is the secant method on r - r'. The first step, and
+    any step that leaves the region where the household problem has a
+    solution, is a damped step.
+    '''
+    r_hist, f_hist = [], []
+    for _ in range(max_iter):
+        r_prime = ed.r_prime(r)
+        if abs(r - r_prime) < tol:
+            return r, True
+        if not np.isfinite(r_prime):
+            # no household solution at r, step back toward the last
+            # good iterate
+            if not r_hist:
+                return r, False
+            r = (r + r_hist[-1]) / 2
+            continue
+        r_hist = (r_hist + [r])[-(depth + 1):]
+        f_hist = (f_hist + [r_prime - r])[-(depth + 1):]
+        r_new = xi * r + (1 - xi) * r_prime
+        if len(r_hist) > 1:
+            dR = np.diff(r_hist)
+            dF = np.diff(f_hist)
+            gamma = np.linalg.lstsq(dF[np.newaxis, :], f_hist[-1:],
+                                    rcond=None)[0]
+            r_new = r + f_hist[-1] - (dR + dF) @ gamma
+        if not np.isfinite(r_new) or r_new <= -ed.params[1]:
+            r_new = xi * r + (1 - xi) * r_prime
+            r_hist, f_hist = [], []
+        r = float(r_new)
+    return r, False
+
+
+def _brent(ed, r, tol, max_iter):
+    '''
+    Brent's method on the excess demand r - r', after bracketing the
+    root by stepping away from r in both directions. The interest rate
+    must stay above -delta for w to be defined.
+    '''
+    delta = ed.params[1]
+    f = ed.resid(r)
+    if abs(f) < tol:
+        return r, True
+    step = 0.1 * max(abs(r + delta), 0.01)
+    lo = hi = r
+    for _ in range(50):
+        hi = hi + step
+        if ed.resid(hi) * f < 0:
+            lo = r
+            break
+        lo = max(lo - step, (lo - delta) / 2)
+        if ed.resid(lo) * f < 0:
+            hi = r
+            break
+        step *= 2
+    else:
+        return r, False
+    r, res = opt.brentq(ed.resid, lo, hi, xtol=tol, maxiter=max_iter,
+                        full_output=True, disp=False)
+    return r, res.converged and abs(ed.resid(r)) < tol
+
+
+def _joint(ed, r, tol, max_iter):
+    '''
+    Solve the household FOCs and market clearing for (r, b) jointly
+    with Newton's method on the analytic Jacobian, with a backtracking
+    line search. The unknown for r is x = log(r + delta), so every step
+    keeps r above -delta, where w is defined (trial points where
+    r + delta rounds to zero are rejected by the line search). As with
+    the damped iteration, there is no start if the household problem
+    has no solution at the initial r.
+    '''
+    alpha, delta, A, sigma, beta = ed.params
+    n = ed.n
+    L = ne.get_L(n)
+
+    def resid(x):
+        r, b_sp1 = np.exp(x[0]) - delta, x[1:]
+        if not r + delta > 0:
+            return np.full(x.shape, np.nan)
+        w = ne.get_w(r, (alpha, delta, A))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            euler_errors = ne.hh_foc(b_sp1, r, w, n, (sigma, beta))
+            r_prime = ne.get_r(ne.get_K(b_sp1), L, (alpha, delta, A))
+        ed.history.append({
+            'iter': len(ed.history), 'r': r, 'r_prime': r_prime,
+            'resid': abs(r - r_prime),
+            'euler_error': np.max(np.abs(euler_errors)),
+            'time': time.perf_counter() - ed.start})
+        return np.concatenate(([r - r_prime], euler_errors))
+
+    def jac(x):
+        r, b_sp1 = np.exp(x[0]) - delta, x[1:]
+        w = ne.get_w(r, (alpha, delta, A))
+        K = ne.get_K(b_sp1)
+        J = np.empty((x.shape[0], x.shape[0]))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # market clearing row
+            J[0, 0] = 1.0
+            J[0, 1:] = (1 - alpha) * alpha * A * L ** (1 - alpha) * K ** (
+                alpha - 2)
+            # household rows, d/db
+            J[1:, 1:] = ne.hh_foc_jac(b_sp1, r, w, n, (sigma, beta))
+            # household rows, d/dr through the return and the wage
+            b_s = np.concatenate(([0.0], b_sp1))
+            dw = -alpha / (1 - alpha) * w / (r + delta)
+            dc = b_s + dw * n
+            c, _ = ne.get_lifetime(b_sp1, r, w, n)
+            mu_c = ne.mu_c_func(c, sigma)
+            mu_c_prime = ne.mu_c_prime_func(c, sigma)
+            J[1:, 0] = (mu_c_prime[:-1] * dc[:-1] - beta * mu_c[1:]
+                        - beta * (1 + r) * mu_c_prime[1:] * dc[1:])
+        # chain rule for x = log(r + delta)
+        J[:, 0] *= r + delta
+        return J
+
+    # start from the household solution at the initial r
+    if not np.isfinite(ed.r_prime(r)):
+        return r, False
+    x = np.concatenate(([np.log(r + delta)], ed.b_sp1))
+    F = resid(x)
+    # Newton's method, halving steps until the residuals are finite and
+    # smaller
+    for _ in range(max_iter):
+        if np.all(np.abs(F) < tol):
+            break
+        step = np.linalg.solve(jac(x), F)
+        lam = 1.0
+        while lam > 1e-10:
+            x_new = x - lam * step
+            F_new = resid(x_new)
+            if (np.all(np.isfinite(F_new))
+                    and np.linalg.norm(F_new) < np.linalg.norm(F)):
+                break
+            lam /= 2
+        else:
+            break
+        x, F = x_new, F_new
+    ed.b_sp1 = x[1:]
+    return np.exp(x[0]) - delta, bool(np.all(np.abs(F) < tol))
+
+
+def SS_solver(r_guess, b_guesses, n, alpha, delta, A, sigma, beta,
+              method='damped', xi=0.8, tol=1e-8, max_iter=500,
+              full_output=False):
+    '''
+    Solves for the SS of the economy
+
+    method selects the outer loop on r:
+        'damped'   - r <- xi * r + (1 - xi) * r'
+        'anderson' - Anderson acceleration of r <- r'
+        'brent'    - Brent's method on the excess demand r - r'
+        'joint'    - Newton's method over (r, b) jointly
+    Each household solve warm starts from the last savings found. If
+    an accelerated method fails, the damped iteration is run from the
+    initial guesses. Convergence is |r - r'| < tol.
+
+    Returns r, success and the Euler errors, and if full_output is
+    True also a dict with the savings 'b', 'w', 'K', 'L', the
+    'method' that produced the result, whether the damped 'fallback'
+    was used and why (in 'message', empty if it was not), and the
+    'history' of evaluations (a list of dicts with the iteration, r,
+    r', |r - r'|, the max Euler error and the elapsed time).
+    '''
+    if method not in ('damped', 'anderson', 'brent', 'joint'):
+        raise ValueError(
+            "method must be 'damped', 'anderson', 'brent' or 'joint'")
+    ed = _ExcessDemand(b_guesses, n, alpha, delta, A, sigma, beta)
+    r = r_guess
+    message = ''
+    try:
+        if method == 'damped':
+            r, success = _damped(ed, r, xi, tol, max_iter)
+        elif method == 'anderson':
+            r, success = _anderson(ed, r, xi, tol, max_iter)
+        elif method == 'brent':
+            r, success = _brent(ed, r, tol, max_iter)
+        else:
+            r, success = _joint(ed, r, tol, max_iter)
+    except (ArithmeticError, ValueError, np.linalg.LinAlgError) as err:
+        success = False
+        message = method + ' failed: ' + repr(err)
+    fallback = not success and method != 'damped'
+    if fallback:
+        if not message:
+            message = method + ' did not converge'
+        # start over from the initial guesses
+        ed.b_sp1 = np.asarray(b_guesses, dtype=float)
+        r, success = _damped(ed, r_guess, xi, tol, max_iter)
 
-    return r, success, euler_errors
+    # savings and Euler errors at the solution
+    b_sp1, euler_errors, w, ok = solve_b(
+        r, ed.b_sp1, n, alpha, delta, A, sigma, beta)
+    success = success and ok
 
+    if not full_output:
+        return r, success, euler_errors
+    info = {'b': b_sp1, 'w': w, 'K': ne.get_K(b_sp1), 'L': ne.get_L(n),
+            'method': 'damped' if fallback else method,
+            'fallback': fallback, 'message': message,
+            'history': ed.history}
+    return r, success, euler_errors, info
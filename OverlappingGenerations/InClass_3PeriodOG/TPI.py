@@ -0,0 +1,270 @@
+import time
+import numpy as np
+import scipy.optimize as opt
+import necessary_equations as ne
+import SS
+
+# time path iteration (TPI) for the transition to the SS
+    # guess a path for r from r_0 to r_ss -> w
+    # solve the lifetime problems of all cohorts alive in periods
+    # 0, ..., T-1 at once, given their prices
+    # use MC with the savings of each period -> K, L
+    # use K, L in get_r -> r' path
+    # check if the r' path = guess of r path
+    # update the path and loop again if not
+
+
+def solve_tridiagonal(ab, rhs):
+    '''
+    Solve many tridiagonal systems at once with the Thomas algorithm
+
+    ab holds the systems in the banded storage of
+    scipy.linalg.solve_banded((1, 1), ...) along its last two axes and
+    rhs the right hand sides along its last axis. The loop is over the
+    M equations and every step is vectorized across the systems, so
+    the cost is linear in M and in the number of systems.
+    '''
+    M = ab.shape[-1]
+    upper = ab[..., 0, 1:]
+    diag = ab[..., 1, :]
+    lower = ab[..., 2, :-1]
+    c_prime = np.empty(rhs.shape[:-1] + (max(M - 1, 0),))
+    d_prime = np.empty(rhs.shape)
+    denom = diag[..., 0]
+    d_prime[..., 0] = rhs[..., 0] / denom
+    for i in range(1, M):
+        c_prime[..., i - 1] = upper[..., i - 1] / denom
+        denom = diag[..., i] - lower[..., i - 1] * c_prime[..., i - 1]
+        d_prime[..., i] = ((rhs[..., i] - lower[..., i - 1]
+                            * d_prime[..., i - 1]) / denom)
+    x = d_prime
+    for i in range(M - 2, -1, -1):
+        x[..., i] -= c_prime[..., i] * x[..., i + 1]
+    return x
+
+
+def cohort_prices(path, ss_value, S):
+    '''
+    The prices each cohort faces over its life
+
+    Cohorts are indexed by their birth period, -(S-1), ..., T-1, so row
+    i holds the prices of the cohort born in period i - (S-1) at ages
+    1, ..., S. Periods after T-1 have the SS price, and periods before
+    0 (which are in the past for cohorts alive at 0) have the period 0
+    price.
+    '''
+    T = path.shape[0]
+    ext = np.concatenate((np.full(S - 1, path[0]), path,
+                          np.full(S - 1, ss_value)))
+    return np.lib.stride_tricks.sliding_window_view(ext, S)[:T + S - 1]
+
+
+def _fixed_savings(b_init, T, S):
+    '''
+    Mask of the savings already chosen before period 0, with their
+    values. The cohort born in period -k (alive at age k+1 in period
+    0) holds b_init[k-1] at the start of period 0, so savings b_2,
+    ..., b_{k+1} are fixed for it.
+    '''
+    C = T + S - 1
+    age_at_0 = np.arange(C) - (S - 1)
+    fixed = np.arange(S - 1)[np.newaxis, :] < -age_at_0[:, np.newaxis]
+    values = np.broadcast_to(b_init, (C, S - 1))
+    return fixed, values
+
+
+def solve_cohorts(r_path, w_path, r_ss, w_ss, n, sigma, beta, b_init,
+                  b_guess, tol=1e-12, max_iter=100):
+    '''
+    Solve the lifetime problems of all T+S-1 cohorts alive in periods
+    0, ..., T-1 along the price paths, with one batched Newton method
+
+    Every cohort has the S-1 unknowns b_2, ..., b_S. For cohorts alive
+    in period 0 the savings chosen before period 0 are fixed by
+    b_init, and the Euler equations for those periods are replaced by
+    identity rows, so all cohorts share one tridiagonal structure and
+    each Newton step is one call to solve_tridiagonal. Steps are
+    halved, cohort by cohort, until consumption is positive from
+    period 0 on.
+
+    Returns the (T+S-1)*(S-1) savings, the Euler errors (zero in the
+    fixed rows) and whether the max absolute Euler error fell below
+    tol.
+    '''
+    T = r_path.shape[0]
+    S = n.shape[0]
+    r = cohort_prices(r_path, r_ss, S)
+    w = cohort_prices(w_path, w_ss, S)
+    fixed, values = _fixed_savings(b_init, T, S)
+    # periods of life from period 0 on, where consumption must be
+    # positive
+    C = T + S - 1
+    live = (np.arange(C)[:, np.newaxis] - (S - 1)
+            + np.arange(S)[np.newaxis, :]) >= 0
+    params = (sigma, beta)
+
+    def errors(b):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            e = ne.hh_foc(b, r, w, n, params)
+        return np.where(fixed, 0.0, e)
+
+    b = np.where(fixed, values, b_guess)
+    # cohorts the guess leaves with non-positive consumption start from
+    # zero savings instead, where consumption is positive
+    c, _ = ne.get_lifetime(b, r, w, n)
+    infeasible = np.any(live & ~(c > 0), axis=1)
+    b[infeasible] = np.where(fixed[infeasible], values[infeasible], 0.0)
+    euler_errors = errors(b)
+    for _ in range(max_iter):
+        if np.max(np.abs(euler_errors)) < tol:
+            return b, euler_errors, True
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ab = ne.hh_foc_jac_banded(b, r, w, n, params)
+        # identity rows for the fixed savings
+        ab[..., 0, 1:] = np.where(fixed[:, :-1], 0.0, ab[..., 0, 1:])
+        ab[..., 1, :] = np.where(fixed, 1.0, ab[..., 1, :])
+        ab[..., 2, :-1] = np.where(fixed[:, 1:], 0.0, ab[..., 2, :-1])
+        step = solve_tridiagonal(ab, euler_errors)
+        lam = np.ones((C, 1))
+        for _ in range(40):
+            b_new = b - lam * step
+            c, _ = ne.get_lifetime(b_new, r, w, n)
+            bad = np.any(live & ~(c > 0), axis=1)
+            if not np.any(bad):
+                break
+            lam[bad] /= 2
+        else:
+            # no step found for these cohorts
+            b_new[bad] = b[bad]
+        b = b_new
+        euler_errors = errors(b)
+    return b, euler_errors, bool(np.max(np.abs(euler_errors)) < tol)
+
+
+def get_K_path(b, T, S):
+    '''
+    Aggregate capital in periods 0, ..., T-1 from the savings of all
+    cohorts. In period t, savings b_{s+1} are held by the cohort born
+    in period t-s.
+    '''
+    t = np.arange(T)[:, np.newaxis]
+    s = np.arange(1, S)[np.newaxis, :]
+    return b[t - s + S - 1, s - 1].sum(axis=1)
+
+
+class _PathMap:
+    '''
+    The map from a guessed r path to the r' path implied by market
+    clearing, recording the history of evaluations and warm starting
+    each batch of cohort solves from the last savings found.
+    '''
+
+    def __init__(self, b_init, n, alpha, delta, A, sigma, beta, r_ss, b_ss,
+                 T):
+        self.b_init = np.asarray(b_init, dtype=float)
+        self.n = n
+        self.params = (alpha, delta, A, sigma, beta)
+        self.r_ss = r_ss
+        self.w_ss = ne.get_w(r_ss, (alpha, delta, A))
+        self.b = np.broadcast_to(b_ss, (T + len(n) - 1, len(n) - 1)).copy()
+        self.euler_errors = np.zeros_like(self.b)
+        self.history = []
+        self.start = time.perf_counter()
+
+    def r_prime(self, r_path):
+        alpha, delta, A, sigma, beta = self.params
+        T = r_path.shape[0]
+        S = self.n.shape[0]
+        w_path = ne.get_w(r_path, (alpha, delta, A))
+        b, euler_errors, ok = solve_cohorts(
+            r_path, w_path, self.r_ss, self.w_ss, self.n, sigma, beta,
+            self.b_init, self.b)
+        K = get_K_path(b, T, S)
+        L = ne.get_L(self.n)
+        if ok and np.all(K > 0):
+            r_prime = ne.get_r(K, L, (alpha, delta, A))
+            self.b, self.euler_errors = b, euler_errors
+        else:
+            # no solution to some cohort's problem on this path
+            r_prime = np.full(T, np.nan)
+        self.history.append({
+            'iter': len(self.history),
+            'resid': np.max(np.abs(r_path - r_prime)),
+            'euler_error': np.max(np.abs(euler_errors)),
+            'time': time.perf_counter() - self.start})
+        return r_prime
+
+    def resid(self, r_path):
+        return r_path - self.r_prime(r_path)
+
+
+def TPI_solver(b_init, n, alpha, delta, A, sigma, beta, T,
+               ss=None, r_path_guess=None, method='damped', xi=0.8,
+               tol=1e-8, max_iter=500, full_output=False):
+    '''
+    Solves for the transition path of the economy from the savings
+    b_init (b_2, ..., b_S held at the start of period 0) to the SS
+
+    ss is the output of SS.SS_solver(..., full_output=True); if None,
+    the SS is solved for here. The default guess for the r path goes
+    linearly from the r implied by b_init to r_ss. The path reaches
+    the SS at period T, so T should be several times S.
+
+    method selects the update of the r path:
+        'damped'   - r <- xi * r + (1 - xi) * r'
+        'anderson', 'krylov', 'broyden1', ... - the Jacobian-free
+                     opt.root method of that name on r - r'
+    If a root method fails, the damped iteration is run from the
+    guess. Convergence is max |r - r'| < tol.
+
+    Returns the r path, success and the (T+S-1)*(S-1) Euler errors of
+    the cohorts (row i is the cohort born in period i-(S-1)), and if
+    full_output is True also a dict with the cohort savings 'b', the
+    'w' and 'K' paths, 'L', the 'method' that produced the result,
+    whether the damped 'fallback' was used, the 'ss' and the
+    'history' of evaluations.
+    '''
+    n = np.asarray(n, dtype=float)
+    S = n.shape[0]
+    if ss is None:
+        ss = SS.SS_solver(0.1, np.full(S - 1, 0.01), n, alpha, delta, A,
+                          sigma, beta, method='anderson', full_output=True)
+    r_ss, ss_success, _, ss_info = ss
+    if not ss_success:
+        raise ValueError('TPI_solver needs a solved SS')
+    L = ne.get_L(n)
+    if r_path_guess is None:
+        r_0 = ne.get_r(np.sum(b_init), L, (alpha, delta, A))
+        r_path_guess = np.linspace(r_0, r_ss, T)
+    r_path = np.array(r_path_guess, dtype=float)
+    pm = _PathMap(b_init, n, alpha, delta, A, sigma, beta, r_ss,
+                  ss_info['b'], T)
+
+    success = False
+    if method != 'damped':
+        try:
+            sol = opt.root(pm.resid, r_path, method=method,
+                           options={'fatol': tol, 'maxiter': max_iter})
+            r_path = sol.x
+            success = bool(np.max(np.abs(pm.resid(r_path))) < tol)
+        except (ArithmeticError, ValueError, np.linalg.LinAlgError):
+            success = False
+    fallback = not success and method != 'damped'
+    if method == 'damped' or fallback:
+        r_path = np.array(r_path_guess, dtype=float)
+        for _ in range(max_iter):
+            r_prime = pm.r_prime(r_path)
+            if np.max(np.abs(r_path - r_prime)) < tol:
+                success = True
+                break
+            if not np.all(np.isfinite(r_prime)):
+                break
+            r_path = xi * r_path + (1 - xi) * r_prime
+
+    if not full_output:
+        return r_path, success, pm.euler_errors
+    w_path = ne.get_w(r_path, (alpha, delta, A))
+    info = {'b': pm.b, 'w': w_path, 'K': get_K_path(pm.b, T, S), 'L': L,
+            'method': 'damped' if fallback else method,
+            'fallback': fallback, 'ss': ss, 'history': pm.history}
+    return r_path, success, pm.euler_errors, info
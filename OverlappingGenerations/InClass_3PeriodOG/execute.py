@@ -1,4 +1,5 @@
 import SS
+import TPI
 import numpy as np
 
 
@@ -19,3 +20,15 @@ r_ss, success, euler_errors = SS.SS_solver(
 
 print('The SS interest is ', r_ss, 'Did we find the solution? ', success)
 print('The Euler errors are ', euler_errors)
+
+# Solve the transition path from 80% of the SS savings
+ss = SS.SS_solver(r_guess, b_guesses, n, alpha, delta, A, sigma, beta,
+                  method='anderson', full_output=True)
+b_init = 0.8 * ss[3]['b']
+T = 30
+r_path, success, euler_errors = TPI.TPI_solver(
+    b_init, n, alpha, delta, A, sigma, beta, T, ss=ss, method='krylov')
+
+print('The interest rate path is ', r_path, 'Did we find the solution? ',
+      success)
+print('The max Euler error is ', abs(euler_errors).max())
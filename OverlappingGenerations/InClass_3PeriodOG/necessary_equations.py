@@ -1,4 +1,5 @@
 import numpy as np
+from scipy import linalg
 
 
 def get_L(n):
@@ -57,17 +58,121 @@ def get_c(r, w, b_s, b_sp1, n):
     return c
 
 
-# solve for b2 and b3, given r and w, from hh_foc
+def mu_c_prime_func(c, sigma):
+    '''
+    Derivative of the marginal utility of consumption
+    '''
+    mu_c_prime = -sigma * c ** (-sigma - 1)
+    return mu_c_prime
+
+
+def get_lifetime(b_list, r, w, n):
+    '''
+    Savings entering and leaving each period of life, consumption
+    and the gross return in each period, for savings b_list chosen in
+    periods 1 to S-1 (households are born and die with no savings).
+    r and w are scalars or length-S arrays of the prices faced in each
+    period of life. Leading axes of b_list, r and w index households
+    (e.g., cohorts) and are broadcast against each other.
+    '''
+    b_list = np.asarray(b_list, dtype=float)
+    zero = np.zeros(b_list.shape[:-1] + (1,))
+    b_s = np.concatenate((zero, b_list), axis=-1)
+    b_sp1 = np.concatenate((b_list, zero), axis=-1)
+    R = 1 + np.asarray(r, dtype=float)
+    c = get_c(R - 1, w, b_s, b_sp1, n)
+    R = np.broadcast_to(R, c.shape)
+    return c, R
+
+
+# solve for b_2 to b_S, given r and w, from hh_foc
 def hh_foc(b_list, r, w, n, params):
     '''
     Define the household first order conditions
+
+    There are S = len(n) periods of life and the S-1 unknowns are the
+    savings b_2, ..., b_S. r and w are scalars (steady state) or
+    length-S arrays of the prices faced in each period of life. The
+    S-1 Euler errors are computed with vectorized operations, and
+    stacking households along leading axes of b_list, r and w gives
+    the Euler errors of all of them at once.
     '''
     sigma, beta = params
-    b2, b3 = b_list[0], b_list[1]
-    b_s = np.array([0.0, b2, b3])
-    b_sp1 = np.array([b2, b3, 0.0])
-    c = get_c(r, w, b_s, b_sp1, n)
+    c, R = get_lifetime(b_list, r, w, n)
     mu_c = mu_c_func(c, sigma)
-    euler_error = mu_c[:-1] - beta * (1 + r) * mu_c[1:]
-    # note that euler_error is length 2
+    euler_error = mu_c[..., :-1] - beta * R[..., 1:] * mu_c[..., 1:]
+    # note that euler_error is length S-1
     return euler_error
+
+
+def hh_foc_jac_banded(b_list, r, w, n, params):
+    '''
+    Jacobian of hh_foc with respect to b_list in the banded storage of
+    scipy.linalg.solve_banded: row 0 holds the superdiagonal, row 1
+    the diagonal and row 2 the subdiagonal (for stacked households
+    these are the last two axes).
+
+    Euler error s depends only on c_s and c_{s+1}, so it depends only
+    on b_s, b_{s+1} and b_{s+2} and the Jacobian is tridiagonal.
+    '''
+    sigma, beta = params
+    c, R = get_lifetime(b_list, r, w, n)
+    mu_c_prime = mu_c_prime_func(c, sigma)
+    ab = np.zeros(c.shape[:-1] + (3, c.shape[-1] - 1))
+    # d error_s / d b_{s+2}, through c_{s+1}
+    ab[..., 0, 1:] = beta * R[..., 1:-1] * mu_c_prime[..., 1:-1]
+    # d error_s / d b_{s+1}, through c_s and c_{s+1}
+    ab[..., 1, :] = (-mu_c_prime[..., :-1]
+                     - beta * R[..., 1:] ** 2 * mu_c_prime[..., 1:])
+    # d error_s / d b_s, through c_s
+    ab[..., 2, :-1] = R[..., 1:-1] * mu_c_prime[..., 1:-1]
+    return ab
+
+
+def hh_foc_jac(b_list, r, w, n, params):
+    '''
+    Jacobian of hh_foc with respect to b_list, as a dense matrix
+    (the form opt.root expects)
+    '''
+    ab = hh_foc_jac_banded(b_list, r, w, n, params)
+    jac = np.diag(ab[1])
+    if ab.shape[1] > 1:
+        jac += np.diag(ab[0, 1:], 1) + np.diag(ab[2, :-1], -1)
+    return jac
+
+
+def solve_hh(r, w, n, params, b_init, tol=1e-12, max_iter=100):
+    '''
+    Solve the household problem with Newton's method on hh_foc
+
+    Each Newton step solves the tridiagonal system with
+    scipy.linalg.solve_banded, so the cost per iteration is linear in
+    the number of periods. Steps are halved until consumption is
+    positive in every period.
+
+    Returns the savings b_2, ..., b_S, the Euler errors and whether
+    the max absolute Euler error fell below tol.
+    '''
+    b = np.array(b_init, dtype=float)
+    c, _ = get_lifetime(b, r, w, n)
+    if not np.all(c > 0):
+        # infeasible starting point
+        return b, np.full(b.shape, np.nan), False
+    euler_errors = hh_foc(b, r, w, n, params)
+    for _ in range(max_iter):
+        if not np.all(np.isfinite(euler_errors)):
+            return b, euler_errors, False
+        if np.max(np.abs(euler_errors)) < tol:
+            return b, euler_errors, True
+        ab = hh_foc_jac_banded(b, r, w, n, params)
+        step = linalg.solve_banded((1, 1), ab, euler_errors)
+        lam = 1.0
+        while True:
+            b_new = b - lam * step
+            c, _ = get_lifetime(b_new, r, w, n)
+            if np.all(c > 0) or lam < 1e-10:
+                break
+            lam /= 2
+        b = b_new
+        euler_errors = hh_foc(b, r, w, n, params)
+    return b, euler_errors, bool(np.max(np.abs(euler_errors)) < tol)
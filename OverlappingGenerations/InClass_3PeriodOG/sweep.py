@@ -0,0 +1,196 @@
+import hashlib
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import SS
+
+# solve the SS over a grid of parameters
+    # order the grid so neighbors differ in one parameter
+    # cut it into chunks and solve each chunk in a worker,
+    # warm starting every point from the one before it
+    # save each chunk so an interrupted sweep can resume
+    # collect everything in one DataFrame
+
+PARAM_NAMES = ('alpha', 'delta', 'A', 'sigma', 'beta', 'n')
+
+
+def _as_list(values, is_n=False):
+    '''
+    A parameter given as a scalar (or one labor supply vector for n)
+    becomes a list of one value
+    '''
+    if is_n:
+        # np.ndim would fail on a list of vectors of different lengths
+        if all(np.isscalar(v) for v in values):
+            return [np.asarray(values, dtype=float)]
+        return [np.asarray(v, dtype=float) for v in values]
+    return list(np.atleast_1d(values))
+
+
+def _snake(shape):
+    '''
+    Indices of a grid of the given shape, with the last coordinate
+    running back and forth so consecutive indices differ by one step in
+    one coordinate
+    '''
+    if len(shape) == 0:
+        return [()]
+    rest = _snake(shape[1:])
+    order = []
+    for i in range(shape[0]):
+        order.extend((i,) + idx for idx in rest)
+        rest = rest[::-1]
+    return order
+
+
+def param_grid(alpha, delta, A, sigma, beta, n):
+    '''
+    Parameter points for a sweep, in an order where each point differs
+    from the one before it in a single parameter, moving one step on
+    that parameter's grid (a boustrophedon walk over the product grid).
+    This way the solution at each point is a good starting guess for
+    the next one.
+
+    Each argument is a scalar or a list of values, except n, which is
+    one labor supply vector or a list of them.
+
+    Returns a list of (point, params) where point is the position of
+    params in itertools.product order and params is a dict.
+    '''
+    grids = [_as_list(alpha), _as_list(delta), _as_list(A),
+             _as_list(sigma), _as_list(beta), _as_list(n, is_n=True)]
+    shape = [len(g) for g in grids]
+    points = []
+    for idx in _snake(shape):
+        point = int(np.ravel_multi_index(idx, shape))
+        params = {name: grids[d][i]
+                  for d, (name, i) in enumerate(zip(PARAM_NAMES, idx))}
+        points.append((point, params))
+    return points
+
+
+def _solve_chunk(task):
+    '''
+    Solve the SS at each point of a chunk in order, starting each
+    solve from the solution at the previous point
+    '''
+    points, r_guess, b_guesses, solver_kwargs = task
+    rows = []
+    r_start, b_start = r_guess, None
+    for point, params in points:
+        n = params['n']
+        S = n.shape[0]
+        if b_start is None or b_start.shape[0] != S - 1:
+            r_start = r_guess
+            b_start = (np.full(S - 1, 0.01) if b_guesses is None
+                       else np.asarray(b_guesses, dtype=float))
+        start = time.perf_counter()
+        r, success, euler_errors, info = SS.SS_solver(
+            r_start, b_start, n, params['alpha'], params['delta'],
+            params['A'], params['sigma'], params['beta'],
+            full_output=True, **solver_kwargs)
+        row = {'point': point}
+        row.update({name: params[name] for name in PARAM_NAMES[:-1]})
+        row.update({'n_' + str(s + 1): n[s] for s in range(S)})
+        row.update({'r': r, 'w': info['w'], 'K': info['K'],
+                    'L': info['L'], 'success': success,
+                    'max_euler_error': np.max(np.abs(euler_errors)),
+                    'evaluations': len(info['history']),
+                    'method': info['method'],
+                    'time': time.perf_counter() - start})
+        row.update({'b_' + str(s + 2): info['b'][s] for s in range(S - 1)})
+        row.update({'euler_' + str(s + 1): euler_errors[s]
+                    for s in range(S - 1)})
+        rows.append(row)
+        if success:
+            r_start, b_start = r, info['b']
+    return rows
+
+
+def _checkpoint_path(checkpoint_dir, key, chunk_id):
+    return os.path.join(checkpoint_dir,
+                        'sweep_' + key + '_' + str(chunk_id).zfill(5)
+                        + '.pkl')
+
+
+def _write_checkpoint(path, rows):
+    '''
+    Write a chunk's rows atomically, so an interrupted write never
+    leaves a partial checkpoint
+    '''
+    tmp = path + '.tmp' + str(os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(rows, f)
+    os.replace(tmp, path)
+
+
+def sweep(alpha, delta, A, sigma, beta, n, r_guess=0.1, b_guesses=None,
+          chunk_size=20, processes=None, checkpoint_dir=None,
+          **solver_kwargs):
+    '''
+    Solve the SS at every point of a grid of parameters
+
+    The grid is built by param_grid and cut into chunks of chunk_size
+    consecutive points. Each chunk is solved in a worker process,
+    warm starting each point from the solution at the previous point
+    (the first point of a chunk, and any point after a failed solve,
+    starts from r_guess and b_guesses). processes=1 solves the chunks
+    in this process. Extra keyword arguments (e.g., method='anderson')
+    are passed to SS.SS_solver.
+
+    If checkpoint_dir is given, each finished chunk is saved there.
+    Rerunning the same sweep (same grid, chunk_size, starting values
+    and solver options) loads the saved chunks and only solves the
+    rest.
+
+    Returns a DataFrame with one row per point, in itertools.product
+    order of the grid, with the parameters (labor supply as n_1, ...,
+    n_S), r, w, K, L, the savings b_2, ..., b_S, the Euler errors
+    euler_1, ..., euler_S-1 and solver diagnostics.
+    '''
+    points = param_grid(alpha, delta, A, sigma, beta, n)
+    chunks = [points[i:i + chunk_size]
+              for i in range(0, len(points), chunk_size)]
+    tasks = [(chunk, r_guess, b_guesses, solver_kwargs) for chunk in chunks]
+
+    results = {}
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        key = hashlib.sha256(pickle.dumps(
+            ([(p, {k: np.asarray(v).tolist() for k, v in d.items()})
+              for p, d in points], chunk_size, r_guess,
+             None if b_guesses is None else np.asarray(b_guesses).tolist(),
+             sorted(solver_kwargs.items())))).hexdigest()[:16]
+        for chunk_id in range(len(chunks)):
+            path = _checkpoint_path(checkpoint_dir, key, chunk_id)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    results[chunk_id] = pickle.load(f)
+
+    todo = [chunk_id for chunk_id in range(len(chunks))
+            if chunk_id not in results]
+
+    def save(chunk_id, rows):
+        results[chunk_id] = rows
+        if checkpoint_dir is not None:
+            _write_checkpoint(
+                _checkpoint_path(checkpoint_dir, key, chunk_id), rows)
+
+    if processes == 1 or len(todo) <= 1:
+        for chunk_id in todo:
+            save(chunk_id, _solve_chunk(tasks[chunk_id]))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {executor.submit(_solve_chunk, tasks[chunk_id]):
+                       chunk_id for chunk_id in todo}
+            # save chunks as they finish
+            for future in as_completed(futures):
+                save(futures[future], future.result())
+
+    rows = [row for chunk_id in range(len(chunks))
+            for row in results[chunk_id]]
+    df = pd.DataFrame(rows).sort_values('point').set_index('point')
+    return df
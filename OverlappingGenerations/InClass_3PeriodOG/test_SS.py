@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+import necessary_equations as ne
+import SS
+
+# tests of the SS solvers: every method should clear the capital
+# market with the household problem solved, and agree with the others
+
+METHODS = ['damped', 'anderson', 'brent', 'joint']
+TOL = 1e-8
+
+
+def three_period():
+    '''
+    The in-class 3-period model, as in execute.py
+    '''
+    n = np.array([0.3, 0.5, 0.2])
+    return n, 0.3, 0.1, 1.0, 1.5, 0.8
+
+
+def forty_period():
+    '''
+    A 40-period model with annual parameters scaled to 80 years of
+    life, working full time for the first two thirds of it
+    '''
+    S = 40
+    n = np.where(np.arange(S) < round(2 * S / 3), 1.0, 0.2)
+    delta = 1 - (1 - 0.05) ** (80 / S)
+    beta = 0.96 ** (80 / S)
+    return n, 0.35, delta, 1.0, 3.0, beta
+
+
+def check_residuals(r, success, euler_errors, info, n, alpha, delta, A):
+    '''
+    The SS conditions at a solution: market clearing for r, the wage
+    from r, and the household Euler equations
+    '''
+    assert success
+    assert not info['fallback']
+    assert info['message'] == ''
+    K = ne.get_K(info['b'])
+    L = ne.get_L(n)
+    assert K > 0
+    assert r == pytest.approx(ne.get_r(K, L, (alpha, delta, A)),
+                              abs=TOL)
+    assert info['w'] == pytest.approx(ne.get_w(r, (alpha, delta, A)))
+    assert np.max(np.abs(euler_errors)) < 1e-10
+    c, _ = ne.get_lifetime(info['b'], r, info['w'], n)
+    assert np.all(c > 0)
+
+
+@pytest.mark.parametrize('model', [three_period, forty_period])
+@pytest.mark.parametrize('method', METHODS)
+def test_ss_residuals(model, method):
+    n, alpha, delta, A, sigma, beta = model()
+    S = n.shape[0]
+    r, success, euler_errors, info = SS.SS_solver(
+        0.1, np.full(S - 1, 0.01), n, alpha, delta, A, sigma, beta,
+        method=method, tol=TOL, full_output=True)
+    check_residuals(r, success, euler_errors, info, n, alpha, delta, A)
+    assert info['method'] == method
+
+
+@pytest.mark.parametrize('model', [three_period, forty_period])
+def test_methods_agree(model):
+    n, alpha, delta, A, sigma, beta = model()
+    S = n.shape[0]
+    r = [SS.SS_solver(0.1, np.full(S - 1, 0.01), n, alpha, delta, A,
+                      sigma, beta, method=method, tol=TOL)[0]
+         for method in METHODS]
+    np.testing.assert_allclose(r, r[0], atol=1e-6)
+
+
+def test_joint_stays_where_w_is_defined():
+    # from the lowest r where households hold capital the joint Newton
+    # steps must not leave the region r > -delta where w is defined
+    n, alpha, delta, A, sigma, beta = three_period()
+    with np.errstate(all='raise'):
+        r, success, euler_errors, info = SS.SS_solver(
+            0.0, np.array([0.01, 0.01]), n, alpha, delta, A, sigma, beta,
+            method='joint', tol=TOL, full_output=True)
+    check_residuals(r, success, euler_errors, info, n, alpha, delta, A)
+
+
+def test_joint_without_a_household_solution():
+    # below r = 0 households hold no capital, so no method can start
+    n, alpha, delta, A, sigma, beta = three_period()
+    with np.errstate(all='raise'):
+        r, success, _, info = SS.SS_solver(
+            -0.05, np.array([0.01, 0.01]), n, alpha, delta, A, sigma,
+            beta, method='joint', tol=TOL, full_output=True)
+    assert not success
+    assert r > -delta
+    assert info['fallback']
+    assert info['message'] == 'joint did not converge'
+
+
+def test_fallback_is_reported():
+    n, alpha, delta, A, sigma, beta = three_period()
+    r, success, _, info = SS.SS_solver(
+        0.1, np.array([0.01, 0.01]), n, alpha, delta, A, sigma, beta,
+        method='anderson', tol=TOL, max_iter=1, full_output=True)
+    assert info['fallback']
+    assert info['method'] == 'damped'
+    assert 'anderson' in info['message']
+
+
+def test_hh_jacobian_matches_finite_differences():
+    n, alpha, delta, A, sigma, beta = forty_period()
+    S = n.shape[0]
+    r = 0.08
+    w = ne.get_w(r, (alpha, delta, A))
+    b = np.linspace(0.05, 0.5, S - 1) * np.sin(np.linspace(0, np.pi, S - 1))
+    jac = ne.hh_foc_jac(b, r, w, n, (sigma, beta))
+    h = 1e-7
+    fd = np.column_stack([
+        (ne.hh_foc(b + h * e, r, w, n, (sigma, beta))
+         - ne.hh_foc(b - h * e, r, w, n, (sigma, beta))) / (2 * h)
+        for e in np.eye(S - 1)])
+    np.testing.assert_allclose(jac, fd, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import scipy.linalg as la
+import necessary_equations as ne
+import SS
+import TPI
+from test_SS import three_period, forty_period
+
+# tests of the TPI solver: the r path should clear the capital market
+# in every period with every cohort's problem solved, and reach the SS
+
+TOL = 1e-8
+
+
+def solve_ss(model):
+    n, alpha, delta, A, sigma, beta = model()
+    S = n.shape[0]
+    return SS.SS_solver(0.1, np.full(S - 1, 0.01), n, alpha, delta, A,
+                        sigma, beta, method='anderson', tol=TOL,
+                        full_output=True)
+
+
+def test_solve_tridiagonal_matches_solve_banded():
+    rng = np.random.default_rng(0)
+    M = 12
+    ab = rng.standard_normal((5, 3, M))
+    # diagonally dominant, so no pivoting is needed
+    ab[:, 1, :] = 4 + rng.random((5, M))
+    ab[:, 0, 0] = 0.0
+    ab[:, 2, -1] = 0.0
+    rhs = rng.standard_normal((5, M))
+    x = TPI.solve_tridiagonal(ab, rhs)
+    for i in range(5):
+        np.testing.assert_allclose(x[i], la.solve_banded((1, 1), ab[i],
+                                                         rhs[i]))
+
+
+@pytest.mark.parametrize('model,T', [(three_period, 30),
+                                     (forty_period, 160)])
+@pytest.mark.parametrize('method', ['damped', 'krylov'])
+def test_tpi_residuals(model, T, method):
+    n, alpha, delta, A, sigma, beta = model()
+    S = n.shape[0]
+    ss = solve_ss(model)
+    b_init = 0.8 * ss[3]['b']
+    r_path, success, euler_errors, info = TPI.TPI_solver(
+        b_init, n, alpha, delta, A, sigma, beta, T, ss=ss, method=method,
+        tol=TOL, full_output=True)
+    assert success
+    assert not info['fallback']
+    # market clearing in every period
+    K = TPI.get_K_path(info['b'], T, S)
+    np.testing.assert_allclose(K, info['K'])
+    np.testing.assert_allclose(
+        r_path, ne.get_r(K, info['L'], (alpha, delta, A)), atol=TOL)
+    # the savings held at period 0 are b_init
+    np.testing.assert_allclose(K[0], np.sum(b_init))
+    # every cohort's Euler equations hold
+    assert np.max(np.abs(euler_errors)) < 1e-10
+    # (checked directly for the cohorts born from period 0 on, which
+    # have no savings fixed)
+    np.testing.assert_allclose(
+        ne.hh_foc(info['b'], TPI.cohort_prices(r_path, ss[0], S),
+                  TPI.cohort_prices(info['w'], ss[3]['w'], S), n,
+                  (sigma, beta))[S - 1:],
+        0.0, atol=1e-10)
+    # and the path reaches the SS
+    assert r_path[-1] == pytest.approx(ss[0], abs=1e-6)
+
+
+def test_tpi_from_the_ss_stays_there():
+    n, alpha, delta, A, sigma, beta = three_period()
+    ss = solve_ss(three_period)
+    r_path, success, _ = TPI.TPI_solver(
+        ss[3]['b'], n, alpha, delta, A, sigma, beta, 30, ss=ss, tol=TOL)
+    assert success
+    np.testing.assert_allclose(r_path, ss[0], atol=1e-6)
@@ -0,0 +1,75 @@
+import itertools
+import os
+import numpy as np
+import pytest
+import SS
+import sweep
+from test_SS import three_period, forty_period
+
+# tests of the SS sweep: the grid walk, mixed model lengths and resuming
+# from checkpoints
+
+TOL = 1e-8
+
+
+def test_param_grid_is_a_snake_walk():
+    grid = sweep.param_grid([0.3, 0.35], [0.05, 0.1, 0.15], 1.0,
+                            [1.5, 2.0], 0.8, [0.3, 0.5, 0.2])
+    values = [[0.3, 0.35], [0.05, 0.1, 0.15], [1.0], [1.5, 2.0], [0.8]]
+    product = list(itertools.product(*values))
+    assert sorted(point for point, _ in grid) == list(range(len(product)))
+    positions = []
+    for point, params in grid:
+        key = tuple(params[name] for name in sweep.PARAM_NAMES[:-1])
+        assert key == product[point]
+        np.testing.assert_array_equal(params['n'], [0.3, 0.5, 0.2])
+        positions.append([v.index(x) for v, x in zip(values, key)])
+    # consecutive points are one step apart in a single parameter
+    steps = np.abs(np.diff(positions, axis=0))
+    np.testing.assert_array_equal(steps.sum(axis=1), 1)
+
+
+def test_mixed_length_n_grid():
+    # the 40-period parameters, with a 3-period labor supply as well
+    n40, alpha, delta, A, sigma, beta = forty_period()
+    n3 = three_period()[0]
+    grid = sweep.param_grid(alpha, delta, A, sigma, beta, [n3, n40])
+    assert [params['n'].shape[0] for _, params in grid] == [3, 40]
+    df = sweep.sweep(alpha, delta, A, sigma, beta, [n3, n40],
+                     processes=1, method='anderson', tol=TOL)
+    assert df['success'].all()
+    for point, n in enumerate([n3, n40]):
+        S = n.shape[0]
+        r = SS.SS_solver(0.1, np.full(S - 1, 0.01), n, alpha, delta, A,
+                         sigma, beta, method='anderson', tol=TOL)[0]
+        assert df.loc[point, 'r'] == pytest.approx(r, abs=1e-6)
+    # the 3-period model has no labor supply past n_3
+    assert np.isnan(df.loc[0, 'n_4'])
+    assert df.loc[1, 'n_40'] == n40[-1]
+
+
+def test_checkpoints_resume_the_sweep(tmp_path, monkeypatch):
+    n, alpha, delta, A, sigma, beta = three_period()
+    args = ([0.25, 0.3, 0.35], delta, A, [1.5, 2.0], beta, n)
+    kwargs = dict(chunk_size=2, processes=1, checkpoint_dir=str(tmp_path),
+                  method='anderson', tol=TOL)
+    full = sweep.sweep(*args, **kwargs)
+    files = sorted(os.listdir(tmp_path))
+    assert len(files) == 3
+    # lose one chunk, as if the sweep had been interrupted
+    os.remove(os.path.join(tmp_path, files[1]))
+    solved = []
+    solve_chunk = sweep._solve_chunk
+
+    def counting(task):
+        solved.append(task)
+        return solve_chunk(task)
+
+    monkeypatch.setattr(sweep, '_solve_chunk', counting)
+    resumed = sweep.sweep(*args, **kwargs)
+    assert len(solved) == 1
+    assert sorted(os.listdir(tmp_path)) == files
+    assert resumed.drop(columns='time').equals(full.drop(columns='time'))
+    # a different sweep does not pick up these checkpoints
+    sweep.sweep(*args, **dict(kwargs, chunk_size=3))
+    assert len(solved) == 3
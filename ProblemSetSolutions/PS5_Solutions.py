@@ -1,430 +1,253 @@
+"""
+Estimate the matching model of radio station mergers by maximum score.
+
+The estimator lives in merger_mse.py and its functions are re-exported
+here. Run this file to estimate the models in the problem set, or other
+models, e.g.
+
+    python PS5_Solutions.py
+    python PS5_Solutions.py --covariates stations_pop distance --init 1
+        --method NM --format csv
+"""
+
 # Import the packages we would use
-import numpy as np
-import pandas as pd
-import scipy.optimize as opt
-from scipy.stats import norm
-from geopy.distance import distance
+import argparse
 import os
-import time
+import sys
 
+import numpy as np
 
-""""
-Define function to use for estimation
-"""
+from merger_mse import (  # noqa: F401
+    EARTH_RADIUS_MILES,
+    IncrementalQscore,
+    MSEData,
+    Qscore,
+    Qscore_grad,
+    Qscore_hess,
+    cached_data_dict,
+    coordinate_ascent,
+    count_inequalities,
+    create_array_ids,
+    create_char_tables,
+    create_data_dict,
+    create_mse_data,
+    create_mse_data_chunked,
+    create_x,
+    estimate_mse,
+    exact_mse,
+    haversine_miles,
+    iter_array_ids,
+    load_mse_data_chunked,
+    merger_estimate,
+    multistart_estimate,
+    pair_distances,
+    payoff,
+    resample_estimate,
+    vincenty_miles,
+)
 
+DEFAULT_DATA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "Matching",
+    "radio_merger_data.csv",
+)
 
-def create_array_ids(x):
+# Models estimated in the problem set: covariates, initial guesses and
+# whether prices are used
+PROBLEM_SET_MODELS = [
+    # Note, only specify two since first coefficient will be normalized
+    # to 1
+    (["stations_pop", "corp_owner_pop", "distance"], [7.54, 2.28], False),
+    # Note, only specify 4 since last coeff on price normalized to -1
+    (
+        ["stations_pop", "corp_owner_pop", "distance", "hhi_target", "price"],
+        [-0.002, 7.54, 2.28, -0.18],
+        True,
+    ),
+]
+
+
+def results_table(mse_results, covariate_lists):
     """
-    This function creates arrays of buyer and target ids to represent
-    all actual and counter factural combinations
-
-    The four arrays are:
-    (b, t), (b', t'), (b, t'), (b', t)
+    Put estimates in a DataFrame with one column per model.
 
     Args:
-        x (Pandas DataFrame): dataframe with columns identifying buyer
-            and target ids for observed mergers and market year named
-            buyer_id, target_id, year
+        mse_results (list): Scipy optimize results objects
+        covariate_lists (list): list of covariates of each model
 
     Returns:
-        bt_arrays (dict): dictionary with Numpy arrays of buyer
-            and target ids
+        df_out (Pandas DataFrame): estimates and scores, with the
+            variable names of the longest covariate list
     """
-    # Set number of rows to put in arrays - will delete rows that aren't
-    # filled in later
-    N = 10000
-    # Find list of unique years
-    set_of_years = set(x.year)
-    # initialize numpy arrays - columns will represent year, buyer_id,
-    # target_id
-    bt, bptp, btp, bpt = (
-        np.zeros((N, 3)),
-        np.zeros((N, 3)),
-        np.zeros((N, 3)),
-        np.zeros((N, 3)),
-    )
-    # set counter to identify row to put loop items into
-    counter = 0
-    for y in set_of_years:
-        # get targets of buyer b
-        x = x.sort_index()
-        df = x[x.year == y]
-        buyers_in_year = list(set(df.buyer_id.values))
-        for b in buyers_in_year[:-1]:  # all but last buyer
-            df = x[(x.buyer_id == b) & (x.year == y)]
-            # get targets of buyer i
-            b_target = set(df.target_id.values)
-            for t in b_target:
-                # get buyers b' who are not buyer b
-                for bp in buyers_in_year[buyers_in_year.index(b) + 1:]:
-                    df = df = x[(x.buyer_id == bp) & (x.year == y)]
-                    # get targets of buyer b'
-                    bp_target = set(df.target_id.values)
-                    for tp in bp_target:
-                        bt[counter, :] = [y, b, t]
-                        bptp[counter, :] = [y, bp, tp]
-                        btp[counter, :] = [y, b, tp]
-                        bpt[counter, :] = [y, bp, t]
-                        counter += 1
-
-    # delete rows not filled in
-    bt = bt[:counter, :]
-    bptp = bptp[:counter, :]
-    btp = btp[:counter, :]
-    bpt = bpt[:counter, :]
+    import pandas as pd
 
-    bt_arrays = {"bt": bt, "bptp": bptp, "btp": btp, "bpt": bpt}
+    names = max(covariate_lists, key=len)
+    out_dict = {"Variable": names + ["Score"]}
+    for i, v in enumerate(mse_results):
+        column = list(v["x"])
+        if len(column) < len(names):
+            column.extend(["-"] * (len(names) - len(column)))
+        column.append(v["fun"] * -1)
+        out_dict["Model " + str(i + 1)] = column
 
-    return bt_arrays
+    return pd.DataFrame(out_dict)
 
 
-def create_x(merger_df, id_array):
+def format_table(df_out, output_format):
+    """
+    Render the results table as markdown, CSV or JSON.
     """
-    Creates arrays with covariates for buyer-target combinations
+    if output_format == "markdown":
+        return df_out.to_markdown(index=False)
+    if output_format == "csv":
+        return df_out.to_csv(index=False)
+    return df_out.to_json(orient="records", indent=2)
 
-    Args:
-        merger_df (Pandas DataFrame):  data with matches and characteristics
-        id_array (Numpy array): array with buyer and target ids
 
-    Returns:
-        df (Pandas DataFrame): dataframe of specified buyer and target
-            pairs with characteristics and calculated variables
-    """
-    # separate out buyer and target characteristics
-    buyer_chars = merger_df[
-        [
-            "buyer_id",
-            "year",
-            "buyer_lat",
-            "buyer_long",
-            "num_stations_buyer",
-            "corp_owner_buyer",
-        ]
-    ].copy()
-    # in case buyers are repeated (i.e., matches are one to many),
-    # drop any duplicates
-    buyer_chars.drop_duplicates(
-        subset=["buyer_id", "year"], keep="first", inplace=True)
-    target_chars = merger_df[
-        [
-            "year",
-            "target_id",
-            "target_lat",
-            "target_long",
-            "hhi_target",
-            "population_target",
-            "price",
-        ]
-    ].copy()
-    # there should not be repeated targets, but drop duplicates to be safe
-    target_chars.drop_duplicates(
-        subset=["target_id", "year"], keep="first", inplace=True
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Maximum score estimation of radio merger payoffs."
     )
-
-    # put buyer and target ids in a dataframe to enable merge with X's
-    df = pd.DataFrame(
-        id_array,
-        index=range(id_array.shape[0]),
-        columns=["year", "buyer_id", "target_id"],
+    parser.add_argument(
+        "--data",
+        default=DEFAULT_DATA,
+        help="path to the CSV file with the merger data",
     )
-
-    # Merge buyer and target characteristics onto dataframes with buyer
-    # and target ids
-    df = df.merge(
-        buyer_chars,
-        how="left",
-        left_on=["year", "buyer_id"],
-        right_on=["year", "buyer_id"],
-        copy=True,
+    parser.add_argument(
+        "--covariates",
+        nargs="+",
+        help="covariates of one model to estimate, instead of the "
+        "problem set models; the first coefficient (or the one on "
+        "price, which must be last) is normalized",
     )
-    df = df.merge(
-        target_chars,
-        how="left",
-        left_on=["year", "target_id"],
-        right_on=["year", "target_id"],
-        copy=True,
+    parser.add_argument(
+        "--init",
+        nargs="+",
+        type=float,
+        help="initial guesses for the free coefficients (default: ones)",
     )
-
-    # create additional variables for the X matrix in response to the
-    # question
-    df["pop"] = df["population_target"] / 1000000
-    df["price"] = df["price"] / 1000000
-    df["stations_pop"] = df["num_stations_buyer"] * df["pop"]
-    df["corp_owner_pop"] = df["corp_owner_buyer"] * df["pop"]
-    df["buyer_loc"] = df[["buyer_lat", "buyer_long"]].apply(tuple, axis=1)
-    df["target_loc"] = df[["target_lat", "target_long"]].apply(tuple, axis=1)
-    df["distance"] = df.apply(
-        lambda row: distance(row["buyer_loc"], row["target_loc"]).miles, axis=1
+    parser.add_argument(
+        "--method",
+        default="SA",
+        choices=["NM", "LBFGS", "NEWTON", "DE", "SA", "EXACT", "CA"],
+        help="optimization method, see estimate_mse; EXACT proves the "
+        "global maximum only on small models (not on the price model, "
+        "see exact_mse) and warns when it stops short",
     )
+    parser.add_argument(
+        "--bounds",
+        nargs=2,
+        type=float,
+        metavar=("MIN", "MAX"),
+        help="bounds on every free coefficient for DE, EXACT, CA and "
+        "LBFGS (default: -20000 20000; EXACT needs them, as tight as "
+        "possible)",
+    )
+    parser.add_argument(
+        "--time-limit",
+        type=float,
+        help="maximum time in seconds for EXACT",
+    )
+    parser.add_argument(
+        "--smoothed",
+        action="store_true",
+        help="use the smoothed maximum score estimator",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=float,
+        default=1 / 30,
+        help="bandwidth of the normal kernel of the smoothed estimator",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes for differential evolution",
+    )
+    parser.add_argument(
+        "--build-processes",
+        type=int,
+        default=1,
+        help="processes to build the buyer-target data with, one "
+        "market-year at a time (0 for all cores)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default="mse_cache",
+        help="directory for the buyer-target data cache ('' disables it)",
+    )
+    parser.add_argument(
+        "--format",
+        default="markdown",
+        choices=["markdown", "csv", "json"],
+        help="output format of the results table",
+    )
+    parser.add_argument(
+        "--output",
+        help="file to write the results table to (default: standard "
+        "output)",
+    )
+    return parser.parse_args(argv)
 
-    return df
-
-
-# create the payoff function
-def payoff(parameters, df, covariates):
-    """
-    Compute the payoff matrices for a buyer-target match, f(b,t)
-
-    Args:
-        parameters (Numpy array): values of parameters in model
-        df (Pandas DataFrame): data of buyer, target, and match characteristics
-        covariates (list): list of strings with names of covariates to
-            use in the payoff function
-
-    Returns:
-        f (Numpy array): vectors with payoffs to the mergers in df
-
-    """
-
-    f = (parameters * df[covariates]).sum(axis=1)
-
-    return f
-
-
-def Qscore(coeffs, data_dict, covariates, use_price, smoothed_estimator):
-    """
-    Statistical objective function for the maximum score estimator.
-
-    Args:
-        parameters (Numpy array): guesses for coefficients on covariates
-        data_dict (dictionary): keys represent buyer-target pairs
-            (e.g, (b,t), (b',t')), values are
-            dataframes with buyer, target, match characteristics
-        covariates (list): list of strings with names of covariates to
-            use in the payoff function
-        use_price (boolean): indicator for use estimator with prices
-        smoothed_estimator (boolean): indicator for use smoothed MSE
-
-    Returns:
-        f (scalar): the fraction of inequalities that are satisfied
-    """
-    if smoothed_estimator:
-        if use_price:
-            coeffs = np.append(coeffs, -1.0)  # price in last column
-            value = (
-                payoff(coeffs, data_dict["bt"], covariates)
-                - payoff(coeffs, data_dict["btp"], covariates)
-            ) + (
-                payoff(coeffs, data_dict["bptp"], covariates)
-                - payoff(coeffs, data_dict["bpt"], covariates)
-            )
-            ineq = norm.cdf(value.astype(float), scale=1 / 30)
-        else:
-            # 1st covariate has coeff of one
-            coeffs = np.insert(coeffs, 0, 1.0)
-            value = (
-                payoff(coeffs, data_dict["bt"], covariates)
-                + payoff(coeffs, data_dict["bptp"], covariates)
-            ) - (
-                payoff(coeffs, data_dict["btp"], covariates)
-                + payoff(coeffs, data_dict["bpt"], covariates)
-            )
-            ineq = norm.cdf(value.astype(float), scale=1 / 30)
 
+def main(argv=None):
+    args = parse_args(argv)
+    if args.covariates is None:
+        models = PROBLEM_SET_MODELS
     else:
-        if use_price:
-            coeffs = np.append(coeffs, -1.0)  # price in last column
-            ineq = (
-                payoff(coeffs, data_dict["bt"], covariates)
-                >= payoff(coeffs, data_dict["btp"], covariates)
-            ) & (
-                payoff(coeffs, data_dict["bptp"], covariates)
-                >= payoff(coeffs, data_dict["bpt"], covariates)
+        use_price = args.covariates[-1] == "price"
+        init = args.init
+        if init is None:
+            init = [1.0] * (len(args.covariates) - 1)
+        if len(init) != len(args.covariates) - 1:
+            sys.exit(
+                "--init needs one value for each covariate but the "
+                "normalized one"
             )
-        else:
-            # 1st covariate has coeff of one
-            coeffs = np.insert(coeffs, 0, 1.0)
-            ineq = (
-                payoff(coeffs, data_dict["bt"], covariates)
-                + payoff(coeffs, data_dict["bptp"], covariates)
-            ) >= (
-                payoff(coeffs, data_dict["btp"], covariates)
-                + payoff(coeffs, data_dict["bpt"], covariates)
+        models = [(args.covariates, init, use_price)]
+
+    # the buyer-target data built from the data are cached in cache_dir
+    # and shared by the models
+    mse_results = []
+    for covariates, init, use_price in models:
+        results = merger_estimate(
+            np.array(init),
+            covariates,
+            args.data,
+            use_price=use_price,
+            smoothed_estimator=args.smoothed,
+            method=args.method,
+            workers=args.workers,
+            cache_dir=args.cache_dir or None,
+            build_processes=args.build_processes or None,
+            bounds=(
+                None
+                if args.bounds is None
+                else [tuple(args.bounds)] * (len(covariates) - 1)
+            ),
+            time_limit=args.time_limit,
+            bandwidth=args.bandwidth,
+        )
+        if args.method == "EXACT" and not results.success:
+            print(
+                f"warning: EXACT did not prove the maximum for "
+                f"{covariates} ({results.message.strip()}); the score "
+                f"{-results.fun:.4f} is only bounded by "
+                f"{results.score_bound:.4f}",
+                file=sys.stderr,
             )
+        mse_results.append(results)
 
-    # sum over all years - number satisfied and total number
-    Q = sum(ineq)
-    H = len(ineq)
-    # return standardized score (fraction of inequalities satisfied)
-    f = -Q / H
-
-    return f
-
-
-def estimate_mse(
-    init_params,
-    covariates,
-    data_dict,
-    use_price=True,
-    smoothed_estimator=False,
-    method="NM",
-    print_results=False,
-):
-    """
-    This function calls the optimizer to estimate the Maximum Score Estimator.
-
-    Args:
-        init_params parameters (Numpy array): guesses for coefficients
-            on covariates
-        data_dict (dictionary): keys represent buyer-target pairs
-            (e.g, (b,t), (b',t')), values are
-            dataframes with buyer, target, match characteristics
-        covariates (list): list of strings with names of covariates to
-            use in the payoff function
-        use_price (boolean): indicator for use estimator with prices
-        smoothed_estimator (boolean): indicator for use smoothed MSE
-        method (string): minimization method to use (NM = Nelder-Mead,
-                DE = differential evolution, SA = simulated annealing)
-        print_results (boolean): whether results of the estimation printed
-
-    Returns:
-        results (Scipy optimize results object): results from optimization
-    """
-    start_time = time.time()
-
-    # Nelder-Mead method
-    if method == "NM":
-        results = opt.minimize(
-            Qscore,
-            init_params,
-            method="Nelder-Mead",
-            args=(data_dict, covariates, use_price, smoothed_estimator),
-            tol=1e-13,
-        )
-    # Differential evolution method
-    elif method == "DE":
-        bnds = [(-20000, 20000)] * (len(covariates) - 1)
-        results = opt.differential_evolution(
-            Qscore,
-            bnds,
-            args=(data_dict, covariates, use_price, smoothed_estimator),
-            strategy="best1bin",
-            maxiter=1000,
-            popsize=15,
-            tol=0.01,
-            mutation=(0.5, 1.0),
-            recombination=0.7,
-            seed=None,
-            callback=None,
-            disp=False,
-            polish=True,
-            init="random",
-            atol=0,
-        )
-    # Simulated annealing method
-    elif method == "SA":
-        results = opt.basinhopping(
-            Qscore,
-            init_params,
-            niter=1000,
-            T=1.0,
-            stepsize=0.05,
-            minimizer_kwargs={
-                "args": (data_dict, covariates, use_price, smoothed_estimator)
-            },
-            interval=50,
-        )
+    df_out = results_table(mse_results, [m[0] for m in models])
+    text = format_table(df_out, args.format)
+    if args.output is None:
+        print(text)
     else:
-        print(
-            "Please enter a valid optimization method - or nothing"
-            + " to use the default (Nelder-Mead)."
-        )
-        results = None
-    end_time = time.time()
-    if use_price:
-        results["x"] = np.append(results["x"], -1.0)
-    else:
-        results["x"] = np.insert(results["x"], 0, 1.0)
-    if print_results:
-        print("beta_hat: ", results["x"])
-        print("Estimation took ", end_time - start_time, " seconds to complete")
-
-    return results
-
-
-def merger_estimate(
-    init_params,
-    covariates,
-    data,
-    use_price=False,
-    smoothed_estimator=False,
-    method="DE",
-):
-    """
-    Interface function to estimate model of radio mergers.
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
 
-    Args:
-        init_params parameters (Numpy array): guesses for coefficients
-            on covariates
-        data (Pandas DataFrame): raw data with mergers
-        covariates (list): list of strings with names of covariates to
-            use in the payoff function
-        use_price (boolean): indicator for use estimator with prices
-        smoothed_estimator (boolean): indicator for use smoothed MSE
-        method (string): minimization method to use (NM = Nelder-Mead,
-                DE = differential evolution, SA = simulated annealing)
-        print_results (boolean): whether results of the estimation printed
-
-    Returns:
-        results (Scipy optimize results object): results from optimization
-    """
-    bt_arrays = create_array_ids(data)
-    data_dict = {}
-    for k, v in bt_arrays.items():
-        data_dict[k] = create_x(data, v)
-    results = estimate_mse(
-        init_params, covariates, data_dict, use_price, smoothed_estimator, method
-    )
 
-    return results
-
-
-## Do the stuff
-
-# Read in data
-filepath = os.path.join("..", "Matching", "radio_merger_data.csv")
-radio_data = pd.read_csv(filepath)
-
-# initialize list for results
-mse_results = []
-
-# Model 1
-covariate_list1 = ["stations_pop", "corp_owner_pop", "distance"]
-# Note, only specify two since first coefficient will be normalized to 1
-init_guesses = np.array([7.54, 2.28])
-results = merger_estimate(
-    init_guesses,
-    covariate_list1,
-    radio_data,
-    use_price=False,
-    smoothed_estimator=False,
-    method="SA",
-)
-mse_results.append(results)
-# Model 2
-covariate_list2 = ["stations_pop", "corp_owner_pop", "distance", "hhi_target", "price"]
-# Note, only specify 4 since last coeff on price normalized to -1
-init_guesses = np.array(
-    [-0.002, 7.54, 2.28, -0.18]
-)
-results = merger_estimate(
-    init_guesses,
-    covariate_list2,
-    radio_data,
-    use_price=True,
-    smoothed_estimator=False,
-    method="SA",
-)
-mse_results.append(results)
-
-# Put results in a dict, then dataframe, so can print in markdown easily
-out_dict = {"Variable": covariate_list2 + ["Score"], "Model 1": [], "Model 2": []}
-for i, v in enumerate(mse_results):
-    out_dict["Model " + str(i + 1)].extend(v["x"])
-    if len(out_dict["Model " + str(i + 1)]) < len(covariate_list2):
-        out_dict["Model " + str(i + 1)].extend(
-            ["-"] * (len(covariate_list2) - len(out_dict["Model " + str(i + 1)]))
-        )
-    out_dict["Model " + str(i + 1)].append(v["fun"] * -1)
-df_out = pd.DataFrame(out_dict)
-print(df_out.to_markdown(index=False))
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2344 @@
+"""
+Maximum score estimation of a matching model of radio station mergers.
+
+This module only imports numpy and the standard library when it is
+imported. pandas, scipy, geopy, and the process pools and shared memory
+used by the parallel drivers, are imported the first time a function
+needs them, so worker processes and scripts that only use part of the
+estimator start quickly. PS5_Solutions.py runs the estimation from the
+command line.
+"""
+
+import hashlib
+import importlib
+import os
+import time
+
+import numpy as np
+
+
+class _LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+    Args:
+        name (string): full name of the module, e.g. "scipy.optimize"
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+pd = _LazyModule("pandas")
+opt = _LazyModule("scipy.optimize")
+sparse = _LazyModule("scipy.sparse")
+stats = _LazyModule("scipy.stats")
+special = _LazyModule("scipy.special")
+geopy_distance = _LazyModule("geopy.distance")
+futures = _LazyModule("concurrent.futures")
+shared_memory = _LazyModule("multiprocessing.shared_memory")
+
+
+def _pair_counts(buyers):
+    """
+    Count the rows (b', t') that can be combined with each row (b, t) in
+    a market, i.e., the rows with a buyer that comes after buyer b.
+
+    Args:
+        buyers (Numpy array): buyer ids for the matches in one market,
+            sorted in ascending order
+
+    Returns:
+        first_bp (Numpy array): first row with a buyer after buyer b
+        counts (Numpy array): number of rows with a buyer after buyer b
+    """
+    # since buyers are sorted, all rows after the last row for buyer b
+    # belong to some buyer b' != b
+    first_bp = np.searchsorted(buyers, buyers, side="right")
+    counts = buyers.shape[0] - first_bp
+
+    return first_bp, counts
+
+
+def _pair_indices(buyers, start=0, stop=None):
+    """
+    Find all combinations of rows (i, j) in a market where the buyer in
+    row j comes after the buyer in row i.
+
+    Args:
+        buyers (Numpy array): buyer ids for the matches in one market,
+            sorted in ascending order
+        start, stop (int): only return combinations for rows i in
+            [start, stop)
+
+    Returns:
+        i_idx (Numpy array): row indices of (b, t)
+        j_idx (Numpy array): row indices of (b', t')
+    """
+    first_bp, counts = _pair_counts(buyers)
+    first_bp, counts = first_bp[start:stop], counts[start:stop]
+    i_idx = np.repeat(np.arange(start, start + counts.shape[0]), counts)
+    # position within each run of b' rows, shifted to the first b' row
+    run_start = np.cumsum(counts) - counts
+    j_idx = (
+        np.arange(counts.sum())
+        - np.repeat(run_start, counts)
+        + np.repeat(first_bp, counts)
+    )
+
+    return i_idx, j_idx
+
+
+def _as_int32(values, name):
+    """
+    Convert identifiers to int32, checking that nothing is lost.
+    """
+    values = np.asarray(values)
+    with np.errstate(invalid="ignore"):
+        ids = values.astype(np.int32)
+    if not np.array_equal(ids, values):
+        raise ValueError(name + " must be integers in the int32 range")
+
+    return ids
+
+
+def _sorted_matches(x):
+    """
+    Find the unique matches sorted by year, buyer and target, so each
+    market-year is a contiguous block with buyers in ascending order.
+
+    Returns:
+        matches (Numpy array): year, buyer_id, target_id of each match,
+            as int32
+        year_starts, year_ends (Numpy arrays): first and one past the
+            last row of each market-year
+    """
+    matches = (
+        x[["year", "buyer_id", "target_id"]]
+        .drop_duplicates()
+        .sort_values(["year", "buyer_id", "target_id"])
+        .to_numpy()
+    )
+    matches = _as_int32(matches, "year, buyer_id and target_id")
+    _, year_starts = np.unique(matches[:, 0], return_index=True)
+    year_ends = np.append(year_starts[1:], matches.shape[0])
+
+    return matches, year_starts, year_ends
+
+
+def _bt_arrays(matches, i_idx, j_idx):
+    """
+    Create the (b, t), (b', t'), (b, t'), (b', t) arrays from the rows
+    of matches with (b, t) and (b', t').
+    """
+    # columns represent year, buyer_id, target_id
+    bt = matches[i_idx]
+    bptp = matches[j_idx]
+    btp = np.column_stack((bt[:, 0], bt[:, 1], bptp[:, 2]))
+    bpt = np.column_stack((bt[:, 0], bptp[:, 1], bt[:, 2]))
+
+    return {"bt": bt, "bptp": bptp, "btp": btp, "bpt": bpt}
+
+
+def create_array_ids(x):
+    """
+    This function creates arrays of buyer and target ids to represent
+    all actual and counter factural combinations
+
+    The four arrays are:
+    (b, t), (b', t'), (b, t'), (b', t)
+
+    Matches are sorted by year, buyer and target and each market-year
+    is expanded in one pass, so the arrays are sized exactly and the
+    work is linear in the number of inequalities.
+
+    Args:
+        x (Pandas DataFrame): dataframe with columns identifying buyer
+            and target ids for observed mergers and market year named
+            buyer_id, target_id, year
+
+    Returns:
+        bt_arrays (dict): dictionary with int32 Numpy arrays of year,
+            buyer and target ids
+    """
+    matches, year_starts, year_ends = _sorted_matches(x)
+    # get row indices of (b, t) and (b', t') for each year
+    i_list, j_list = [], []
+    for start, end in zip(year_starts, year_ends):
+        i_idx, j_idx = _pair_indices(matches[start:end, 1])
+        i_list.append(i_idx + start)
+        j_list.append(j_idx + start)
+    i_idx = np.concatenate(i_list) if i_list else np.zeros(0, dtype=int)
+    j_idx = np.concatenate(j_list) if j_list else np.zeros(0, dtype=int)
+
+    bt_arrays = _bt_arrays(matches, i_idx, j_idx)
+
+    return bt_arrays
+
+
+def count_inequalities(x):
+    """
+    Count the inequalities create_array_ids would create, without
+    creating them.
+
+    Args:
+        x (Pandas DataFrame): dataframe with columns buyer_id,
+            target_id, year
+
+    Returns:
+        num_ineq (int): number of inequalities
+    """
+    return int(_year_inequality_counts(x)[1].sum())
+
+
+def _year_inequality_counts(x):
+    """
+    Count the inequalities create_array_ids would create in each
+    market-year.
+
+    Returns:
+        years (Numpy array): unique market-years, ascending
+        counts (Numpy array): number of inequalities in each year
+    """
+    matches, year_starts, year_ends = _sorted_matches(x)
+    counts = np.array(
+        [
+            _pair_counts(matches[start:end, 1])[1].sum()
+            for start, end in zip(year_starts, year_ends)
+        ],
+        dtype=np.int64,
+    )
+
+    return matches[year_starts, 0], counts
+
+
+def iter_array_ids(x, chunk_size=100000):
+    """
+    Generator version of create_array_ids that yields the arrays in
+    chunks, one market-year at a time, so they never have to be held in
+    memory at once. Rows come in the same order as create_array_ids.
+
+    Args:
+        x (Pandas DataFrame): dataframe with columns buyer_id,
+            target_id, year
+        chunk_size (int): maximum number of inequalities in a chunk
+            (a chunk can be larger if a single (b, t) has more than
+            chunk_size counterfactual combinations)
+
+    Yields:
+        bt_arrays (dict): dictionary with Numpy arrays of buyer
+            and target ids for a chunk of inequalities
+    """
+    matches, year_starts, year_ends = _sorted_matches(x)
+    for start, end in zip(year_starts, year_ends):
+        buyers = matches[start:end, 1]
+        cum_counts = np.cumsum(_pair_counts(buyers)[1])
+        # split the rows (b, t) so each chunk has about chunk_size rows
+        row = 0
+        while row < buyers.shape[0]:
+            done = cum_counts[row - 1] if row > 0 else 0
+            stop = np.searchsorted(cum_counts, done + chunk_size, "right")
+            stop = max(stop, row + 1)
+            i_idx, j_idx = _pair_indices(buyers, row, stop)
+            if i_idx.shape[0] > 0:
+                yield _bt_arrays(matches, i_idx + start, j_idx + start)
+            row = stop
+
+
+# Constants for distance calculations
+EARTH_RADIUS_MILES = 6371.009 / 1.609344  # mean radius, as in geopy
+WGS84_A = 6378137.0  # semi-major axis (meters)
+WGS84_F = 1 / 298.257223563  # flattening
+METERS_PER_MILE = 1609.344
+
+
+def haversine_miles(lat1, long1, lat2, long2):
+    """
+    Great-circle distance between points on a sphere with the Earth's
+    mean radius.
+
+    Args:
+        lat1, long1 (Numpy arrays): latitude and longitude of first
+            points, in degrees
+        lat2, long2 (Numpy arrays): latitude and longitude of second
+            points, in degrees
+
+    Returns:
+        d (Numpy array): distances in miles
+    """
+    lat1, long1, lat2, long2 = (
+        np.radians(np.asarray(v, dtype=np.float64))
+        for v in (lat1, long1, lat2, long2)
+    )
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+    )
+    d = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    return d
+
+
+def vincenty_miles(lat1, long1, lat2, long2, tol=1e-12, max_iter=200):
+    """
+    Geodesic distance on the WGS-84 ellipsoid using Vincenty's inverse
+    formula, iterating on all pairs at once. Agrees with
+    geopy.distance.distance to well under a millimeter. The few nearly
+    antipodal pairs where the iteration does not converge are computed
+    with geopy.
+
+    Args:
+        lat1, long1 (Numpy arrays): latitude and longitude of first
+            points, in degrees
+        lat2, long2 (Numpy arrays): latitude and longitude of second
+            points, in degrees
+        tol (scalar): convergence tolerance on lambda (radians)
+        max_iter (int): maximum number of iterations
+
+    Returns:
+        d (Numpy array): distances in miles
+    """
+    lat1, long1, lat2, long2 = np.broadcast_arrays(
+        *(np.asarray(v, dtype=np.float64) for v in (lat1, long1, lat2, long2))
+    )
+    a, f = WGS84_A, WGS84_F
+    b = (1 - f) * a
+    L = np.radians(long2 - long1)
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(max_iter):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt(
+                (cosU2 * sin_lam) ** 2
+                + (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam) ** 2
+            )
+            cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(
+                sin_sigma == 0, 0.0, cosU1 * cosU2 * sin_lam / sin_sigma
+            )
+            cos2_alpha = 1 - sin_alpha**2
+            # equatorial lines have cos2_alpha = 0
+            cos_2sigma_m = np.where(
+                cos2_alpha == 0,
+                0.0,
+                cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha,
+            )
+            C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_next = L + (1 - C) * f * sin_alpha * (
+                sigma
+                + C
+                * sin_sigma
+                * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m**2))
+            )
+            # a pair that has converged keeps the lambda the terms
+            # above were computed from, so its distance does not
+            # depend on how long the other pairs in the batch take
+            converged |= np.abs(lam_next - lam) <= tol
+            lam = np.where(converged, lam, lam_next)
+            if converged.all():
+                break
+
+        u2 = cos2_alpha * (a**2 - b**2) / b**2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = (
+            B
+            * sin_sigma
+            * (
+                cos_2sigma_m
+                + B
+                / 4
+                * (
+                    cos_sigma * (-1 + 2 * cos_2sigma_m**2)
+                    - B
+                    / 6
+                    * cos_2sigma_m
+                    * (-3 + 4 * sin_sigma**2)
+                    * (-3 + 4 * cos_2sigma_m**2)
+                )
+            )
+        )
+        d = b * A * (sigma - delta_sigma) / METERS_PER_MILE
+    # coincident points
+    d = np.where(sin_sigma == 0, 0.0, d)
+
+    # fall back to geopy where the iteration failed
+    failed = ~converged | ~np.isfinite(d)
+    failed &= np.isfinite(lat1) & np.isfinite(lat2)
+    for i in zip(*np.nonzero(failed)):
+        d[i] = geopy_distance.distance(
+            (lat1[i], long1[i]), (lat2[i], long2[i])
+        ).miles
+
+    return d
+
+
+def pair_distances(df, method="geodesic", cache=None):
+    """
+    Compute the distance between buyer and target for each row of a
+    dataframe of buyer-target pairs.
+
+    Args:
+        df (Pandas DataFrame): buyer-target pairs with columns year,
+            buyer_id, target_id, buyer_lat, buyer_long, target_lat,
+            target_long
+        method (string): "geodesic" for distance on the WGS-84
+            ellipsoid (same as geopy.distance.distance) or
+            "haversine" for great-circle distance on a sphere
+        cache (dict): optional dictionary mapping (year, buyer_id,
+            target_id) to distance, updated in place. Pass the same
+            dictionary across calls so no pair is computed twice.
+
+    Returns:
+        d (Numpy array): distances in miles
+    """
+    if method == "geodesic":
+        dist_func = vincenty_miles
+    elif method == "haversine":
+        dist_func = haversine_miles
+    else:
+        raise ValueError(
+            "Distance method must be 'geodesic' or 'haversine', not "
+            + str(method)
+        )
+    if cache is None:
+        cache = {}
+    # each pair only needs to be looked up and computed once
+    pairs = df[
+        [
+            "year",
+            "buyer_id",
+            "target_id",
+            "buyer_lat",
+            "buyer_long",
+            "target_lat",
+            "target_long",
+        ]
+    ]
+    codes, uniques = pd.factorize(
+        pd.MultiIndex.from_frame(pairs[["year", "buyer_id", "target_id"]])
+    )
+    first_row = np.zeros(len(uniques), dtype=np.int64)
+    first_row[codes[::-1]] = np.arange(len(codes))[::-1]
+    keys = list(uniques)
+    d_unique = np.array([cache.get(k, np.nan) for k in keys], dtype=np.float64)
+    missing = np.isnan(d_unique)
+    if missing.any():
+        rows = pairs.iloc[first_row[missing]]
+        d_unique[missing] = dist_func(
+            rows["buyer_lat"].to_numpy(),
+            rows["buyer_long"].to_numpy(),
+            rows["target_lat"].to_numpy(),
+            rows["target_long"].to_numpy(),
+        )
+        cache.update(
+            zip((k for k, m in zip(keys, missing) if m), d_unique[missing])
+        )
+
+    return d_unique[codes]
+
+
+# buyer and target characteristics in the data, and the variables
+# create_x computes from them
+_BUYER_CHARS = [
+    "buyer_lat",
+    "buyer_long",
+    "num_stations_buyer",
+    "corp_owner_buyer",
+]
+_TARGET_CHARS = [
+    "target_lat",
+    "target_long",
+    "hhi_target",
+    "population_target",
+    "price",
+]
+_PAIR_VARS = ["pop", "stations_pop", "corp_owner_pop", "distance"]
+
+
+def _id_keys(year, ids):
+    """
+    Combine int32 market-years and ids into one sortable int64 key.
+    """
+    return year.astype(np.int64) * 2**32 + (ids.astype(np.int64) + 2**31)
+
+
+def create_char_tables(merger_df):
+    """
+    Store the buyer and target characteristics once, in lookup tables
+    sorted on (year, id), so create_x can gather them for any set of
+    pairs by fancy indexing instead of merging them onto every pair.
+
+    Args:
+        merger_df (Pandas DataFrame):  data with matches and characteristics
+
+    Returns:
+        tables (dict): "buyer" and "target" lookup tables, each a
+            dictionary with the sorted (year, id) keys under "keys" and
+            a Numpy array for each characteristic
+    """
+    year = _as_int32(merger_df["year"].to_numpy(), "year")
+    tables = {}
+    for side, chars in [("buyer", _BUYER_CHARS), ("target", _TARGET_CHARS)]:
+        ids = _as_int32(merger_df[side + "_id"].to_numpy(), side + "_id")
+        # in case buyers are repeated (i.e., matches are one to many),
+        # keep the first row of each; there should not be repeated
+        # targets, but do the same to be safe
+        keys, first = np.unique(_id_keys(year, ids), return_index=True)
+        tables[side] = {"keys": keys}
+        for c in chars:
+            tables[side][c] = merger_df[c].to_numpy()[first]
+
+    return tables
+
+
+def _lookup(table, year, ids):
+    """
+    Find the rows of a lookup table for (year, id) pairs.
+
+    Returns:
+        rows (Numpy array): row of each pair, clipped to the table
+        found (Numpy array): whether the pair is in the table
+    """
+    keys = _id_keys(year, ids)
+    num_rows = table["keys"].shape[0]
+    if num_rows == 0:
+        rows = np.zeros(keys.shape[0], dtype=np.intp)
+        return rows, np.zeros(keys.shape[0], dtype=bool)
+    rows = np.minimum(np.searchsorted(table["keys"], keys), num_rows - 1)
+    found = table["keys"][rows] == keys
+
+    return rows, found
+
+
+def create_x(
+    merger_df,
+    id_array,
+    distance_method="geodesic",
+    distance_cache=None,
+    tables=None,
+    columns=None,
+):
+    """
+    Creates arrays with covariates for buyer-target combinations
+
+    Identifiers are stored as int32, and buyer and target
+    characteristics are gathered from lookup tables (see
+    create_char_tables) by fancy indexing. Pairs with a buyer or target
+    that is not in the data get missing characteristics.
+
+    Args:
+        merger_df (Pandas DataFrame):  data with matches and characteristics
+        id_array (Numpy array): array with buyer and target ids
+        distance_method (string): "geodesic" or "haversine", see
+            pair_distances
+        distance_cache (dict): optional cache of distances keyed on
+            (year, buyer_id, target_id), shared across calls
+        tables (dict): output of create_char_tables for merger_df, to
+            share across calls; created here if None
+        columns (list): buyer, target and match characteristics to
+            create, None for all of them (only those needed, e.g., the
+            covariates of a model, keeps memory down)
+
+    Returns:
+        df (Pandas DataFrame): dataframe of specified buyer and target
+            pairs with characteristics and calculated variables
+    """
+    if tables is None:
+        tables = create_char_tables(merger_df)
+    if columns is None:
+        columns = _BUYER_CHARS + _TARGET_CHARS + _PAIR_VARS
+    year = _as_int32(id_array[:, 0], "year")
+    buyer_id = _as_int32(id_array[:, 1], "buyer_id")
+    target_id = _as_int32(id_array[:, 2], "target_id")
+    rows = {
+        "buyer": _lookup(tables["buyer"], year, buyer_id),
+        "target": _lookup(tables["target"], year, target_id),
+    }
+
+    def gather(c):
+        side = "buyer" if c in _BUYER_CHARS else "target"
+        idx, found = rows[side]
+        values = tables[side][c][idx]
+        if not found.all():
+            values = values.astype(np.float64)
+            values[~found] = np.nan
+        return values
+
+    # create additional variables for the X matrix in response to the
+    # question
+    def column(c):
+        if c in _BUYER_CHARS or c in _TARGET_CHARS:
+            values = gather(c)
+            if c == "price":
+                values = values / 1000000
+        elif c == "pop":
+            values = gather("population_target") / 1000000
+        elif c == "stations_pop":
+            values = gather("num_stations_buyer") * column("pop")
+        elif c == "corp_owner_pop":
+            values = gather("corp_owner_buyer") * column("pop")
+        elif c == "distance":
+            pairs = pd.DataFrame(
+                {
+                    "year": year,
+                    "buyer_id": buyer_id,
+                    "target_id": target_id,
+                    "buyer_lat": gather("buyer_lat"),
+                    "buyer_long": gather("buyer_long"),
+                    "target_lat": gather("target_lat"),
+                    "target_long": gather("target_long"),
+                }
+            )
+            values = pair_distances(pairs, distance_method, distance_cache)
+        else:
+            raise KeyError(c + " is not a characteristic of the pairs")
+        return values
+
+    df = pd.DataFrame(
+        {"year": year, "buyer_id": buyer_id, "target_id": target_id}
+    )
+    for c in columns:
+        if c not in df:
+            df[c] = column(c)
+
+    return df
+
+
+# create the payoff function
+def payoff(parameters, df, covariates):
+    """
+    Compute the payoff matrices for a buyer-target match, f(b,t)
+
+    Args:
+        parameters (Numpy array): values of parameters in model
+        df (Pandas DataFrame): data of buyer, target, and match characteristics
+        covariates (list): list of strings with names of covariates to
+            use in the payoff function
+
+    Returns:
+        f (Numpy array): vectors with payoffs to the mergers in df
+
+    """
+
+    f = (parameters * df[covariates]).sum(axis=1)
+
+    return f
+
+
+class MSEData:
+    """
+    Pre-differenced covariates for the maximum score objective.
+
+    Built once from the (b,t), (b',t'), (b,t'), (b',t) dataframes so that
+    each evaluation of Qscore is a matrix-vector product on contiguous
+    float64 arrays rather than pandas operations on four dataframes.
+
+    The normalized coefficient (1 on the first covariate, or -1 on price
+    in the last column if use_price) is folded into an offset vector, so
+    the index for each inequality is X @ coeffs + offset.
+
+    Args:
+        data_dict (dictionary): keys represent buyer-target pairs
+            (e.g, (b,t), (b',t')), values are
+            dataframes with buyer, target, match characteristics
+        covariates (list): list of strings with names of covariates to
+            use in the payoff function
+        use_price (boolean): indicator for use estimator with prices
+        bandwidth (scalar): bandwidth of the normal kernel used by the
+            smoothed estimator
+
+    Attributes:
+        X (Numpy array): X_bt + X_b't' - X_bt' - X_b't for the free
+            coefficients, number of inequalities by number of free
+            coefficients
+        offset (Numpy array): X_bt + X_b't' - X_bt' - X_b't times the
+            normalized coefficient
+        X_b, offset_b (Numpy arrays): same for X_bt - X_bt', only if
+            use_price
+        X_bp, offset_bp (Numpy arrays): same for X_b't' - X_b't, only
+            if use_price
+        markets (Numpy array): unique market-years
+        market_codes (Numpy array): index into markets of the market
+            each inequality belongs to
+        weights (Numpy array): weight on each inequality in the score,
+            None to weight them equally (see reweight)
+        chunk_size (int): number of inequalities Qscore evaluates at a
+            time, None for all of them
+        bandwidth (scalar): bandwidth of the normal kernel used by the
+            smoothed estimator
+    """
+
+    def __init__(self, data_dict, covariates, use_price, bandwidth=1 / 30):
+        self.covariates = list(covariates)
+        self.use_price = use_price
+        self.markets, self.market_codes = np.unique(
+            data_dict["bt"]["year"].to_numpy(), return_inverse=True
+        )
+        self.weights = None
+        self.chunk_size = None
+        self.bandwidth = bandwidth
+        x = {
+            k: data_dict[k][self.covariates].to_numpy(dtype=np.float64)
+            for k in ["bt", "bptp", "btp", "bpt"]
+        }
+        if use_price:
+            # price in last column, coefficient of -1
+            self.X_b, self.offset_b = self._split(x["bt"] - x["btp"])
+            self.X_bp, self.offset_bp = self._split(x["bptp"] - x["bpt"])
+            self.X = np.ascontiguousarray(self.X_b + self.X_bp)
+            self.offset = self.offset_b + self.offset_bp
+        else:
+            self.X, self.offset = self._split(
+                self._difference([x["bt"], x["bptp"]], [x["btp"], x["bpt"]])
+            )
+        self.num_ineq = self.X.shape[0]
+
+    @staticmethod
+    def _difference(plus, minus):
+        """
+        Sum of plus less the sum of minus, with differences that are
+        within rounding of the size of the terms set to exactly zero,
+        so inequalities that are ties in exact arithmetic (and hold in
+        the comparison of summed payoffs) are not lost to the order of
+        the floating point operations.
+        """
+        diff = sum(plus) - sum(minus)
+        size = sum(np.abs(v) for v in plus + minus)
+        diff[np.abs(diff) <= 8 * np.finfo(np.float64).eps * size] = 0.0
+
+        return diff
+
+    def _split(self, diff):
+        """
+        Separate the column with the normalized coefficient from the
+        columns with free coefficients.
+        """
+        if self.use_price:
+            X, offset = diff[:, :-1], -1.0 * diff[:, -1]
+        else:
+            X, offset = diff[:, 1:], diff[:, 0]
+
+        return np.ascontiguousarray(X), np.ascontiguousarray(offset)
+
+    def arrays(self):
+        """
+        Return a dictionary with the Numpy arrays held by the object.
+        """
+        names = ["X", "offset", "markets", "market_codes"]
+        if self.use_price:
+            names += ["X_b", "offset_b", "X_bp", "offset_bp"]
+
+        return {k: getattr(self, k) for k in names}
+
+    @classmethod
+    def from_arrays(cls, arrays, covariates, use_price, bandwidth=1 / 30):
+        """
+        Create an MSEData object from arrays already differenced (e.g.,
+        the output of the arrays method), without copying them.
+        """
+        mse_data = cls.__new__(cls)
+        mse_data.covariates = list(covariates)
+        mse_data.use_price = use_price
+        mse_data.weights = None
+        mse_data.chunk_size = None
+        mse_data.bandwidth = bandwidth
+        for k, v in arrays.items():
+            setattr(mse_data, k, v)
+        mse_data.num_ineq = mse_data.X.shape[0]
+
+        return mse_data
+
+    def reweight(self, weights):
+        """
+        Return a copy of the object that shares its arrays but weights
+        the inequalities in the score, e.g., for a bootstrap or
+        subsample replicate.
+
+        Args:
+            weights (Numpy array): weight on each inequality
+
+        Returns:
+            mse_data (MSEData): reweighted data
+        """
+        mse_data = MSEData.from_arrays(
+            self.arrays(), self.covariates, self.use_price
+        )
+        mse_data.weights = np.asarray(weights, dtype=np.float64)
+        mse_data.chunk_size = self.chunk_size
+        mse_data.bandwidth = self.bandwidth
+
+        return mse_data
+
+    def market_weights(self, market_counts):
+        """
+        Return a reweighted copy of the object where every inequality
+        in a market gets that market's count (e.g., the number of times
+        the market is drawn in a bootstrap sample).
+
+        Args:
+            market_counts (Numpy array): count for each market in
+                self.markets
+
+        Returns:
+            mse_data (MSEData): reweighted data
+        """
+        market_counts = np.asarray(market_counts, dtype=np.float64)
+
+        return self.reweight(market_counts[self.market_codes])
+
+
+def _index(X, offset, coeffs):
+    """
+    Compute X @ coeffs + offset for one coefficient vector or for a
+    2-D array with one coefficient vector per column.
+    """
+    value = X @ coeffs
+    if value.ndim == 2:
+        value += offset[:, None]
+    else:
+        value += offset
+
+    return value
+
+
+def _satisfied(coeffs, mse_data, smoothed_estimator, rows):
+    """
+    Find which of a block of inequalities are satisfied (or the
+    smoothed equivalent) for the given coefficients.
+    """
+    if smoothed_estimator:
+        value = _index(mse_data.X[rows], mse_data.offset[rows], coeffs)
+        ineq = special.ndtr(value / mse_data.bandwidth)
+    elif mse_data.use_price:
+        ineq = (
+            _index(mse_data.X_b[rows], mse_data.offset_b[rows], coeffs) >= 0
+        ) & (
+            _index(mse_data.X_bp[rows], mse_data.offset_bp[rows], coeffs) >= 0
+        )
+    else:
+        ineq = _index(mse_data.X[rows], mse_data.offset[rows], coeffs) >= 0
+
+    return ineq
+
+
+def _Qscore_compiled(coeffs, mse_data, smoothed_estimator):
+    """
+    Maximum score objective function evaluated on an MSEData object.
+    If mse_data.chunk_size is set, the inequalities are evaluated in
+    blocks of that many rows so memory use does not grow with the
+    number of inequalities (e.g., for arrays memory-mapped from disk).
+
+    Args:
+        coeffs (Numpy array): guesses for the free coefficients, either
+            a vector or a 2-D array with one candidate per column (as
+            passed by opt.differential_evolution with vectorized=True)
+        mse_data (MSEData): pre-differenced covariates
+        smoothed_estimator (boolean): indicator for use smoothed MSE
+
+    Returns:
+        f (scalar or Numpy array): the fraction of inequalities that are
+            satisfied, one for each candidate if coeffs is 2-D
+    """
+    coeffs = np.asarray(coeffs, dtype=np.float64)
+    num_ineq = mse_data.num_ineq
+    chunk_size = mse_data.chunk_size or max(num_ineq, 1)
+    Q = 0.0
+    for start in range(0, num_ineq, chunk_size):
+        rows = slice(start, start + chunk_size)
+        ineq = _satisfied(coeffs, mse_data, smoothed_estimator, rows)
+        if mse_data.weights is None:
+            Q = Q + ineq.sum(axis=0)
+        else:
+            Q = Q + mse_data.weights[rows] @ ineq
+    if mse_data.weights is None:
+        f = -Q / num_ineq
+    else:
+        f = -Q / mse_data.weights.sum()
+
+    return f
+
+
+def _smoothed_derivatives(coeffs, mse_data, hessian):
+    """
+    Gradient and (optionally) Hessian of the smoothed maximum score
+    objective, -sum_i w_i Phi(v_i / h) / sum_i w_i with
+    v = X @ coeffs + offset and bandwidth h.
+    """
+    coeffs = np.asarray(coeffs, dtype=np.float64)
+    num_ineq, k = mse_data.X.shape
+    h = mse_data.bandwidth
+    chunk_size = mse_data.chunk_size or max(num_ineq, 1)
+    grad = np.zeros(k)
+    hess = np.zeros((k, k)) if hessian else None
+    for start in range(0, num_ineq, chunk_size):
+        rows = slice(start, start + chunk_size)
+        X = mse_data.X[rows]
+        u = _index(X, mse_data.offset[rows], coeffs) / h
+        pdf = np.exp(-0.5 * u**2) / np.sqrt(2 * np.pi)
+        if mse_data.weights is not None:
+            pdf = pdf * mse_data.weights[rows]
+        grad += X.T @ pdf / h
+        if hessian:
+            # derivative of the normal pdf is -u * pdf
+            hess -= (X.T * (u * pdf)) @ X / h**2
+    total = num_ineq if mse_data.weights is None else mse_data.weights.sum()
+
+    return -grad / total, None if hess is None else -hess / total
+
+
+def Qscore_grad(coeffs, data_dict, covariates, use_price, smoothed_estimator):
+    """
+    Analytic gradient of the smoothed maximum score objective, for use
+    as the jac argument of opt.minimize with the same args as Qscore.
+
+    Args:
+        coeffs (Numpy array): guesses for the free coefficients
+        data_dict (MSEData): pre-differenced covariates
+        covariates (list): not used, for the same signature as Qscore
+        use_price (boolean): not used, for the same signature as Qscore
+        smoothed_estimator (boolean): must be True, the unsmoothed
+            objective is a step function
+
+    Returns:
+        grad (Numpy array): gradient of Qscore with respect to coeffs
+    """
+    _check_smoothed(data_dict, smoothed_estimator)
+    grad, _ = _smoothed_derivatives(coeffs, data_dict, False)
+
+    return grad
+
+
+def Qscore_hess(coeffs, data_dict, covariates, use_price, smoothed_estimator):
+    """
+    Analytic Hessian of the smoothed maximum score objective, for use
+    as the hess argument of opt.minimize with the same args as Qscore.
+
+    Args:
+        coeffs (Numpy array): guesses for the free coefficients
+        data_dict (MSEData): pre-differenced covariates
+        covariates (list): not used, for the same signature as Qscore
+        use_price (boolean): not used, for the same signature as Qscore
+        smoothed_estimator (boolean): must be True, the unsmoothed
+            objective is a step function
+
+    Returns:
+        hess (Numpy array): Hessian of Qscore with respect to coeffs
+    """
+    _check_smoothed(data_dict, smoothed_estimator)
+    _, hess = _smoothed_derivatives(coeffs, data_dict, True)
+
+    return hess
+
+
+def _check_smoothed(data_dict, smoothed_estimator):
+    """
+    Derivatives are only available for the smoothed objective computed
+    from an MSEData object.
+    """
+    if not smoothed_estimator or not isinstance(data_dict, MSEData):
+        raise ValueError(
+            "Derivatives of Qscore require an MSEData object and the"
+            + " smoothed estimator."
+        )
+
+
+def Qscore(coeffs, data_dict, covariates, use_price, smoothed_estimator):
+    """
+    Statistical objective function for the maximum score estimator.
+
+    Args:
+        parameters (Numpy array): guesses for coefficients on covariates
+        data_dict (dictionary or MSEData): keys represent buyer-target
+            pairs (e.g, (b,t), (b',t')), values are
+            dataframes with buyer, target, match characteristics, or
+            the same data pre-differenced in an MSEData object
+        covariates (list): list of strings with names of covariates to
+            use in the payoff function
+        use_price (boolean): indicator for use estimator with prices
+        smoothed_estimator (boolean): indicator for use smoothed MSE
+
+    Returns:
+        f (scalar): the fraction of inequalities that are satisfied
+    """
+    if isinstance(data_dict, MSEData):
+        return _Qscore_compiled(coeffs, data_dict, smoothed_estimator)
+    if smoothed_estimator:
+        if use_price:
+            coeffs = np.append(coeffs, -1.0)  # price in last column
+            value = (
+                payoff(coeffs, data_dict["bt"], covariates)
+                - payoff(coeffs, data_dict["btp"], covariates)
+            ) + (
+                payoff(coeffs, data_dict["bptp"], covariates)
+                - payoff(coeffs, data_dict["bpt"], covariates)
+            )
+            ineq = stats.norm.cdf(value.astype(float), scale=1 / 30)
+        else:
+            # 1st covariate has coeff of one
+            coeffs = np.insert(coeffs, 0, 1.0)
+            value = (
+                payoff(coeffs, data_dict["bt"], covariates)
+                + payoff(coeffs, data_dict["bptp"], covariates)
+            ) - (
+                payoff(coeffs, data_dict["btp"], covariates)
+                + payoff(coeffs, data_dict["bpt"], covariates)
+            )
+            ineq = stats.norm.cdf(value.astype(float), scale=1 / 30)
+
+    else:
+        if use_price:
+            coeffs = np.append(coeffs, -1.0)  # price in last column
+            ineq = (
+                payoff(coeffs, data_dict["bt"], covariates)
+                >= payoff(coeffs, data_dict["btp"], covariates)
+            ) & (
+                payoff(coeffs, data_dict["bptp"], covariates)
+                >= payoff(coeffs, data_dict["bpt"], covariates)
+            )
+        else:
+            # 1st covariate has coeff of one
+            coeffs = np.insert(coeffs, 0, 1.0)
+            ineq = (
+                payoff(coeffs, data_dict["bt"], covariates)
+                + payoff(coeffs, data_dict["bptp"], covariates)
+            ) >= (
+                payoff(coeffs, data_dict["btp"], covariates)
+                + payoff(coeffs, data_dict["bpt"], covariates)
+            )
+
+    # sum over all years - number satisfied and total number
+    Q = sum(ineq)
+    H = len(ineq)
+    # return standardized score (fraction of inequalities satisfied)
+    f = -Q / H
+
+    return f
+
+
+class IncrementalQscore:
+    """
+    Stateful maximum score objective for moves in a few coefficients.
+
+    Keeps the index vector X @ coeffs + offset (both halves of it if
+    use_price) for the current coefficients. A move in some
+    coefficients updates the index with a low-rank correction instead
+    of recomputing it from scratch.
+
+    Along coordinate j, with the other coefficients fixed, inequality i
+    holds for c_j in a closed interval [lo_i, hi_i] whose ends are the
+    points where the index changes sign. Sorting those breakpoints
+    (with cumulative weights) once gives the score at any c_j with two
+    binary searches. The breakpoints do not move when c_j itself
+    changes, so the sorted index for a coordinate stays valid until
+    another coordinate moves. Line searches (line_scores) and exact
+    maximization along a coordinate (maximize_coordinate) then cost
+    O(log n) per candidate after an O(n log n) sort.
+
+    Only the unsmoothed estimator is supported.
+
+    Args:
+        mse_data (MSEData): pre-differenced covariates
+        coeffs (Numpy array): starting free coefficients
+
+    Attributes:
+        coeffs (Numpy array): current free coefficients
+        score (scalar): weighted number of satisfied inequalities at
+            coeffs
+        total (scalar): weighted number of inequalities
+    """
+
+    def __init__(self, mse_data, coeffs):
+        self.mse_data = mse_data
+        if mse_data.use_price:
+            self._X = [mse_data.X_b, mse_data.X_bp]
+            self._offset = [mse_data.offset_b, mse_data.offset_bp]
+        else:
+            self._X = [mse_data.X]
+            self._offset = [mse_data.offset]
+        n = mse_data.num_ineq
+        self._weights = (
+            np.ones(n)
+            if mse_data.weights is None
+            else np.asarray(mse_data.weights, dtype=np.float64)
+        )
+        self.total = self._weights.sum()
+        self.coeffs = np.array(coeffs, dtype=np.float64)
+        # number of moves of each coordinate, to tell when a sorted
+        # breakpoint index is stale
+        self._moves = np.zeros(self.coeffs.shape[0], dtype=np.int64)
+        self._breakpoints = {}
+        self._reset()
+
+    def _reset(self):
+        """
+        Recompute the index vectors and the score from scratch.
+        """
+        self._value = [
+            _index(X, o, self.coeffs) for X, o in zip(self._X, self._offset)
+        ]
+        self.score = self._weights @ self._holds()
+
+    def _holds(self):
+        holds = self._value[0] >= 0
+        for v in self._value[1:]:
+            holds &= v >= 0
+
+        return holds
+
+    def fun(self):
+        """
+        Return the objective at the current coefficients, as Qscore.
+        """
+        return -self.score / self.total
+
+    def _index_for(self, j):
+        """
+        Return the sorted breakpoints along coordinate j, building them
+        if they are missing or stale.
+        """
+        stamp = np.delete(self._moves, j).tobytes()
+        cached = self._breakpoints.get(j)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        n = self.mse_data.num_ineq
+        lo = np.full(n, -np.inf)
+        hi = np.full(n, np.inf)
+        others = np.arange(self.coeffs.shape[0]) != j
+        for X, o in zip(self._X, self._offset):
+            x = X[:, j]
+            # the index without coordinate j, from scratch rather than
+            # from the updated index vectors, so it is exactly zero
+            # when only coordinate j enters the inequality
+            rest = _index(X[:, others], o, self.coeffs[others])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = -rest / x
+            lo = np.where(x > 0, np.maximum(lo, t), lo)
+            hi = np.where(x < 0, np.minimum(hi, t), hi)
+            never = (x == 0) & (rest < 0)
+            lo[never] = np.inf
+            hi[never] = -np.inf
+        keep = lo <= hi
+        w = self._weights[keep]
+        lo, hi = lo[keep], hi[keep]
+        lo_order = np.argsort(lo, kind="stable")
+        hi_order = np.argsort(hi, kind="stable")
+        index = (
+            lo[lo_order],
+            np.concatenate(([0.0], np.cumsum(w[lo_order]))),
+            hi[hi_order],
+            np.concatenate(([0.0], np.cumsum(w[hi_order]))),
+        )
+        self._breakpoints[j] = (stamp, index)
+
+        return index
+
+    def line_scores(self, j, values):
+        """
+        Weighted number of satisfied inequalities with coordinate j set
+        to each of values and the other coefficients at their current
+        values.
+
+        Args:
+            j (int): coordinate
+            values (scalar or Numpy array): values of coefficient j
+
+        Returns:
+            scores (scalar or Numpy array): score at each value
+        """
+        lo, lo_cum, hi, hi_cum = self._index_for(j)
+        values = np.asarray(values, dtype=np.float64)
+
+        # holds if lo <= c and not hi < c
+        return (
+            lo_cum[np.searchsorted(lo, values, side="right")]
+            - hi_cum[np.searchsorted(hi, values, side="left")]
+        )
+
+    def maximize_coordinate(self, j, bounds=(-np.inf, np.inf)):
+        """
+        Find the value of coefficient j in bounds that maximizes the
+        score with the other coefficients fixed.
+
+        The score along the coordinate is constant between consecutive
+        breakpoints, so every segment is scored at its midpoint. Each
+        inequality holds on a closed interval, so the score can also
+        peak at a breakpoint itself (e.g., where an inequality holds
+        only at one point), and the breakpoints and bounds are scored
+        too. Ties go to segment midpoints, and the current value is
+        kept if no candidate does strictly better.
+
+        Args:
+            j (int): coordinate
+            bounds (tuple): (min, max) for the coefficient
+
+        Returns:
+            c_j (scalar): maximizing value
+            score (scalar): weighted number of satisfied inequalities
+                at c_j
+        """
+        lo, _, hi, _ = self._index_for(j)
+        lb, ub = bounds
+        points = np.concatenate((lo, hi))
+        points = points[np.isfinite(points)]
+        points = np.unique(points[(points > lb) & (points < ub)])
+        if points.size == 0:
+            points = np.array([self.coeffs[j]])
+        # open ends are scored a unit past the outermost breakpoint
+        lb = lb if np.isfinite(lb) else points[0] - 1.0
+        ub = ub if np.isfinite(ub) else points[-1] + 1.0
+        edges = np.concatenate(([lb], points, [ub]))
+        candidates = np.concatenate(((edges[:-1] + edges[1:]) / 2, edges))
+        candidates = np.clip(candidates, lb, ub)
+        scores = self.line_scores(j, candidates)
+        best = np.argmax(scores)
+        current = self.line_scores(j, self.coeffs[j])
+        if scores[best] <= current:
+            return self.coeffs[j], current
+
+        return candidates[best], scores[best]
+
+    def move(self, j, value):
+        """
+        Set coefficient j to value, updating the index vectors with a
+        rank-1 correction and the score from the sorted breakpoints
+        (only the inequalities with a breakpoint between the old and
+        new values change sign).
+        """
+        delta = value - self.coeffs[j]
+        if delta == 0:
+            return self.fun()
+        self.score = self.line_scores(j, value)
+        for X, v in zip(self._X, self._value):
+            v += X[:, j] * delta
+        self.coeffs[j] = value
+        self._moves[j] += 1
+
+        return self.fun()
+
+    def __call__(self, coeffs):
+        """
+        Objective at coeffs, as Qscore, moving the state there. Moves
+        in one coordinate go through move; moves in several update the
+        index vectors with a low-rank correction and recount.
+        """
+        coeffs = np.asarray(coeffs, dtype=np.float64)
+        changed = np.flatnonzero(coeffs != self.coeffs)
+        if changed.size == 1:
+            return self.move(changed[0], coeffs[changed[0]])
+        if changed.size > 0:
+            delta = coeffs[changed] - self.coeffs[changed]
+            for X, v in zip(self._X, self._value):
+                v += X[:, changed] @ delta
+            self.coeffs[changed] = coeffs[changed]
+            self._moves[changed] += 1
+            self.score = self._weights @ self._holds()
+
+        return self.fun()
+
+
+def coordinate_ascent(inc, bounds, max_sweeps=100):
+    """
+    Maximize the score by exact maximization along one coordinate at a
+    time, sweeping over the coordinates until no move improves it.
+
+    Args:
+        inc (IncrementalQscore): objective, started at the initial
+            coefficients
+        bounds (list): (min, max) tuples for each free coefficient
+        max_sweeps (int): maximum number of sweeps
+
+    Returns:
+        results (Scipy optimize results object): results from
+            optimization
+    """
+    k = inc.coeffs.shape[0]
+    nfev = 0
+    for sweep in range(1, max_sweeps + 1):
+        improved = False
+        for j in range(k):
+            value, score = inc.maximize_coordinate(j, bounds[j])
+            nfev += 1
+            if score > inc.score:
+                inc.move(j, value)
+                improved = True
+        if not improved:
+            break
+
+    return opt.OptimizeResult(
+        x=inc.coeffs.copy(),
+        fun=inc.fun(),
+        success=not improved,
+        message=(
+            "No coordinate move improves the score."
+            if not improved
+            else "Maximum number of sweeps reached."
+        ),
+        nit=sweep,
+        nfev=nfev,
+    )
+
+
+def _max_margin(A, o, bounds):
+    """
+    Find the coefficients in bounds that maximize the smallest distance
+    to the boundary of any of the inequalities A @ coeffs + o >= 0,
+    i.e., the center of the largest ball inside the set where they all
+    hold. Rows with (numerically) zero coefficients do not depend on
+    the coefficients and are left out.
+
+    Returns:
+        coeffs (Numpy array): coefficients
+        margin (scalar): smallest distance, capped at 1, or -inf if no
+            coefficients in bounds satisfy the inequalities
+    """
+    k = A.shape[1]
+    norms = np.sqrt((A**2).sum(axis=1))
+    keep = norms > 1e-9 * max(norms.max(initial=0.0), 1.0)
+    # variables are (coeffs, margin), maximize margin
+    c = np.zeros(k + 1)
+    c[-1] = -1.0
+    results = opt.linprog(
+        c,
+        A_ub=np.column_stack((-A[keep], norms[keep])),
+        b_ub=o[keep],
+        bounds=list(bounds) + [(None, 1.0)],
+        method="highs",
+    )
+    if results.x is None:
+        return np.full(k, np.nan), -np.inf
+
+    return results.x[:k], results.x[-1]
+
+
+def _tolerant_holds(rows, coeffs, tol):
+    """
+    Find the inequalities that hold at coeffs up to rounding, i.e.,
+    a @ coeffs + o >= -tol * (|a| @ |coeffs| + |o|) for every half.
+    """
+    holds = True
+    for A, o in rows:
+        value = A @ coeffs + o
+        scale = np.abs(A) @ np.abs(coeffs) + np.abs(o)
+        holds = holds & (value >= -tol * scale)
+
+    return holds
+
+
+def exact_mse(mse_data, bounds, time_limit=None, tol=1e-9, x0=None):
+    """
+    Find the global maximum of the (unsmoothed) maximum score objective
+    as a mixed integer linear program.
+
+    Each inequality i gets a binary z_i that can only be one if the
+    inequality holds, using the big-M constraint
+    a_i @ coeffs + o_i >= -M_i (1 - z_i), and the weighted sum of the
+    z_i is maximized. M_i is the largest violation possible within the
+    bounds, so the bounds must be finite, and tighter bounds give a
+    stronger and numerically safer program: with a wide box the M_i
+    are large and the solver can set z_i to one for inequalities that
+    only hold within its integrality tolerance. The program is solved
+    with HiGHS through opt.milp.
+
+    The satisfied inequalities define the set of maximizers, a convex
+    polytope. The coefficients returned are the center of the largest
+    ball inside it, found by a linear program, unless the set has no
+    interior (e.g., the optimum is a vertex), in which case the
+    solver's incumbent is returned if it scores higher. Inequalities
+    that hold within tol relative to the size of their terms count as
+    satisfied, so those that are exactly zero in theory (e.g., ties
+    between identical pairs) are not lost to rounding.
+
+    The program has one binary per inequality, and the LP relaxation
+    of a big-M program is weak, so proving optimality is only practical
+    for small problems: two free coefficients on the problem set data
+    take seconds, but the model with price (three free coefficients
+    and both halves of the inequalities) is not solved to optimality
+    within minutes even with bounds of (-10, 10), and the solver's
+    incumbent is worse than coordinate ascent finds in a fraction of a
+    second. opt.milp takes no starting solution, so coordinate ascent
+    from x0 is run first and its coefficients are returned if they
+    score higher than the solver's. Check success (and score_bound)
+    before taking the result as the global maximum.
+
+    Args:
+        mse_data (MSEData): pre-differenced covariates
+        bounds (list): finite (min, max) tuples for each free
+            coefficient
+        time_limit (scalar): maximum time in seconds for the solver
+        tol (scalar): relative tolerance for an inequality to count as
+            satisfied
+        x0 (Numpy array): coefficients to start coordinate ascent from,
+            clipped to the bounds (default: the middle of the bounds)
+
+    Returns:
+        results (Scipy optimize results object): results from
+            optimization, with the boolean array ineq_satisfied marking
+            the inequalities that hold at x and score_bound, the bound
+            on the score proved by the solver. success is True if the
+            solver proved optimality and the score at x attains it.
+    """
+    if mse_data.use_price:
+        rows = [
+            (mse_data.X_b, mse_data.offset_b),
+            (mse_data.X_bp, mse_data.offset_bp),
+        ]
+    else:
+        rows = [(mse_data.X, mse_data.offset)]
+    num_ineq, k = mse_data.num_ineq, mse_data.X.shape[1]
+    lb = np.array([b[0] for b in bounds], dtype=np.float64)
+    ub = np.array([b[1] for b in bounds], dtype=np.float64)
+    finite = np.isfinite(lb).all() and np.isfinite(ub).all()
+    if lb.shape[0] != k or not finite:
+        raise ValueError(
+            "exact_mse needs finite bounds for each free coefficient."
+        )
+    weights = (
+        np.ones(num_ineq) if mse_data.weights is None else mse_data.weights
+    )
+    total = weights.sum()
+    x0 = (lb + ub) / 2 if x0 is None else np.clip(x0, lb, ub)
+    heuristic = coordinate_ascent(
+        IncrementalQscore(mse_data, np.asarray(x0, dtype=np.float64)),
+        bounds,
+    )
+
+    # a @ coeffs - M z >= -o - M
+    constraints = []
+    for A, o in rows:
+        M = np.maximum(-(np.minimum(A * lb, A * ub).sum(axis=1) + o), 0.0)
+        constraints.append(
+            opt.LinearConstraint(
+                sparse.hstack(
+                    (sparse.csr_matrix(A), sparse.diags(-M))
+                ).tocsr(),
+                -o - M,
+                np.inf,
+            )
+        )
+    c = np.concatenate((np.zeros(k), -weights))
+    options = {} if time_limit is None else {"time_limit": time_limit}
+    milp_results = opt.milp(
+        c,
+        constraints=constraints,
+        integrality=np.concatenate((np.zeros(k), np.ones(num_ineq))),
+        bounds=opt.Bounds(
+            np.concatenate((lb, np.zeros(num_ineq))),
+            np.concatenate((ub, np.ones(num_ineq))),
+        ),
+        options=options,
+    )
+    if milp_results.x is None:
+        return opt.OptimizeResult(
+            x=heuristic.x,
+            fun=heuristic.fun,
+            success=False,
+            status=milp_results.status,
+            message=milp_results.message,
+            nfev=heuristic.nfev,
+            ineq_satisfied=_tolerant_holds(rows, heuristic.x, tol),
+            score_bound=np.nan,
+        )
+
+    # move to the middle of the set of maximizers, dropping any
+    # inequality the solver only satisfied within its tolerances
+    incumbent = milp_results.x[:k]
+    satisfied = milp_results.x[k:] > 0.5
+    while satisfied.any():
+        A = np.vstack([A[satisfied] for A, _ in rows])
+        o = np.concatenate([o[satisfied] for _, o in rows])
+        coeffs, margin = _max_margin(A, o, bounds)
+        if margin >= 0:
+            break
+        still_holds = satisfied & _tolerant_holds(rows, coeffs, tol)
+        if (still_holds == satisfied).all():
+            # nothing to drop, so the set has no interior and the
+            # margin is only negative by rounding
+            break
+        satisfied = still_holds
+    else:
+        coeffs, margin = incumbent, 0.0
+    holds = _tolerant_holds(rows, coeffs, tol)
+    if margin <= 0:
+        # no interior, keep the incumbent if it does better
+        incumbent_holds = _tolerant_holds(rows, incumbent, tol)
+        if weights @ incumbent_holds > weights @ holds:
+            coeffs, holds = incumbent, incumbent_holds
+    heuristic_holds = _tolerant_holds(rows, heuristic.x, tol)
+    if weights @ heuristic_holds > weights @ holds:
+        coeffs, holds = heuristic.x, heuristic_holds
+    score = weights @ holds / total
+    milp_score = -milp_results.fun / total
+
+    return opt.OptimizeResult(
+        x=coeffs,
+        fun=-score,
+        success=milp_results.success and score >= milp_score - 1e-12,
+        status=milp_results.status,
+        message=milp_results.message,
+        nfev=heuristic.nfev + 1,
+        ineq_satisfied=holds,
+        score_bound=-1 * milp_results.mip_dual_bound / total,
+    )
+
+
+def estimate_mse(
+    init_params,
+    covariates,
+    data_dict,
+    use_price=True,
+    smoothed_estimator=False,
+    method="NM",
+    print_results=False,
+    workers=1,
+    bounds=None,
+    time_limit=None,
+):
+    """
+    This function calls the optimizer to estimate the Maximum Score Estimator.
+
+    Args:
+        init_params parameters (Numpy array): guesses for coefficients
+            on covariates
+        data_dict (dictionary or MSEData): keys represent buyer-target
+            pairs (e.g, (b,t), (b',t')), values are
+            dataframes with buyer, target, match characteristics, or
+            the same data pre-differenced in an MSEData object
+        covariates (list): list of strings with names of covariates to
+            use in the payoff function
+        use_price (boolean): indicator for use estimator with prices
+        smoothed_estimator (boolean): indicator for use smoothed MSE
+        method (string): minimization method to use (NM = Nelder-Mead,
+                DE = differential evolution, SA = simulated annealing,
+                EXACT = mixed integer program, see exact_mse, CA =
+                coordinate ascent, see coordinate_ascent, and for
+                the smoothed estimator only, LBFGS = L-BFGS-B and
+                NEWTON = trust-region Newton, both with analytic
+                derivatives)
+        print_results (boolean): whether results of the estimation printed
+        workers (int): number of processes differential evolution uses
+            to score the population (-1 for all cores). With the
+            default of 1 and an MSEData object, the whole population
+            is instead scored in one matrix product.
+        bounds (list): (min, max) tuples for each free coefficient, used
+            by DE, EXACT, CA and LBFGS, defaults to (-20000, 20000)
+            except for EXACT, which needs them given (see exact_mse)
+        time_limit (scalar): maximum time in seconds for EXACT
+
+    Returns:
+        results (Scipy optimize results object): results from optimization
+    """
+    start_time = time.time()
+    if method == "EXACT" and bounds is None:
+        raise ValueError(
+            "The EXACT method needs explicit bounds, as tight as"
+            + " possible, see exact_mse."
+        )
+    if bounds is None:
+        bounds = [(-20000, 20000)] * (len(covariates) - 1)
+
+    # Nelder-Mead method
+    if method == "NM":
+        results = opt.minimize(
+            Qscore,
+            init_params,
+            method="Nelder-Mead",
+            args=(data_dict, covariates, use_price, smoothed_estimator),
+            tol=1e-13,
+        )
+    # Quasi-Newton method with the analytic gradient
+    elif method == "LBFGS":
+        _check_smoothed(data_dict, smoothed_estimator)
+        results = opt.minimize(
+            Qscore,
+            init_params,
+            method="L-BFGS-B",
+            jac=Qscore_grad,
+            args=(data_dict, covariates, use_price, smoothed_estimator),
+            bounds=bounds,
+        )
+    # Newton method with the analytic gradient and Hessian
+    elif method == "NEWTON":
+        _check_smoothed(data_dict, smoothed_estimator)
+        results = opt.minimize(
+            Qscore,
+            init_params,
+            method="trust-exact",
+            jac=Qscore_grad,
+            hess=Qscore_hess,
+            args=(data_dict, covariates, use_price, smoothed_estimator),
+        )
+    # Differential evolution method
+    elif method == "DE":
+        # score the population at once if Qscore can take a 2-D array,
+        # otherwise spread candidates across processes
+        if workers == 1 and isinstance(data_dict, MSEData):
+            parallel_kwargs = {"vectorized": True, "updating": "deferred"}
+        elif workers != 1:
+            parallel_kwargs = {"workers": workers, "updating": "deferred"}
+        else:
+            parallel_kwargs = {}
+        results = opt.differential_evolution(
+            Qscore,
+            bounds,
+            args=(data_dict, covariates, use_price, smoothed_estimator),
+            strategy="best1bin",
+            maxiter=1000,
+            popsize=15,
+            tol=0.01,
+            mutation=(0.5, 1.0),
+            recombination=0.7,
+            seed=None,
+            callback=None,
+            disp=False,
+            polish=True,
+            init="random",
+            atol=0,
+            **parallel_kwargs,
+        )
+    # Simulated annealing method
+    elif method == "SA":
+        results = opt.basinhopping(
+            Qscore,
+            init_params,
+            niter=1000,
+            T=1.0,
+            stepsize=0.05,
+            minimizer_kwargs={
+                "args": (data_dict, covariates, use_price, smoothed_estimator)
+            },
+            interval=50,
+        )
+    # Coordinate ascent with exact maximization along each coordinate
+    elif method == "CA":
+        if smoothed_estimator or not isinstance(data_dict, MSEData):
+            raise ValueError(
+                "The CA method requires an MSEData object and the"
+                + " unsmoothed estimator."
+            )
+        results = coordinate_ascent(
+            IncrementalQscore(data_dict, init_params), bounds
+        )
+    # Exact solution as a mixed integer linear program
+    elif method == "EXACT":
+        if smoothed_estimator or not isinstance(data_dict, MSEData):
+            raise ValueError(
+                "The EXACT method requires an MSEData object and the"
+                + " unsmoothed estimator."
+            )
+        results = exact_mse(data_dict, bounds, time_limit, x0=init_params)
+    else:
+        print(
+            "Please enter a valid optimization method - or nothing"
+            + " to use the default (Nelder-Mead)."
+        )
+        results = None
+    end_time = time.time()
+    if use_price:
+        results["x"] = np.append(results["x"], -1.0)
+    else:
+        results["x"] = np.insert(results["x"], 0, 1.0)
+    if print_results:
+        print("beta_hat: ", results["x"])
+        print(
+            "Estimation took ", end_time - start_time, " seconds to complete"
+        )
+
+    return results
+
+
+def _build_data_dict(data, distance_method, columns):
+    """
+    Create the dataframes of buyer, target and match characteristics
+    for the (b,t), (b',t'), (b,t'), (b',t) pairs in one process.
+    """
+    bt_arrays = create_array_ids(data)
+    data_dict = {}
+    # share characteristics and distances across the four sets of pairs
+    tables = create_char_tables(data)
+    distance_cache = {}
+    for k, v in bt_arrays.items():
+        data_dict[k] = create_x(
+            data,
+            v,
+            distance_method=distance_method,
+            distance_cache=distance_cache,
+            tables=tables,
+            columns=columns,
+        )
+
+    return data_dict
+
+
+def _build_partition(task):
+    """
+    Build the data for one partition of the markets in a worker
+    process.
+    """
+    data, distance_method, columns = task
+
+    return _build_data_dict(data, distance_method, columns)
+
+
+def create_data_dict(
+    data,
+    distance_method="geodesic",
+    processes=1,
+    market="year",
+    columns=None,
+):
+    """
+    Create the dataframes of buyer, target and match characteristics
+    for the (b,t), (b',t'), (b,t'), (b',t) pairs.
+
+    Inequalities only compare matches in the same market-year, so with
+    processes other than 1 the data are partitioned on the market
+    column and each partition is built in a process pool. The market
+    column must be constant within each year (e.g., the year itself or
+    a group of years), so no partition splits a market-year, and the
+    rows are put back in year order, so the result does not depend on
+    processes or market.
+
+    Args:
+        data (Pandas DataFrame): raw data with mergers
+        distance_method (string): "geodesic" or "haversine", see
+            pair_distances
+        processes (int): number of processes, None for all cores
+        market (string): column to partition the data on, constant
+            within each year
+        columns (list): characteristics to create, None for all of
+            them, see create_x
+
+    Returns:
+        data_dict (dictionary): keys represent buyer-target pairs
+            (e.g, (b,t), (b',t')), values are
+            dataframes with buyer, target, match characteristics
+    """
+    if market != "year" and (data.groupby("year")[market].nunique() > 1).any():
+        raise ValueError(
+            "The market column must be constant within each year."
+        )
+    if processes == 1:
+        return _build_data_dict(data, distance_method, columns)
+
+    partitions = [part for _, part in data.groupby(market, sort=True)]
+    if len(partitions) <= 1:
+        return _build_data_dict(data, distance_method, columns)
+    # start the largest partitions first so no process is left with a
+    # big one at the end
+    order = sorted(
+        range(len(partitions)), key=lambda i: len(partitions[i]), reverse=True
+    )
+    parts = [None] * len(partitions)
+    with futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        jobs = {
+            executor.submit(
+                _build_partition, (partitions[i], distance_method, columns)
+            ): i
+            for i in order
+        }
+        for job in futures.as_completed(jobs):
+            parts[jobs[job]] = job.result()
+    data_dict = {
+        k: pd.concat([part[k] for part in parts], ignore_index=True)
+        for k in parts[0]
+    }
+    # each year is in one partition, in the serial order, so a stable
+    # sort on year gives the serial order
+    order = np.argsort(data_dict["bt"]["year"].to_numpy(), kind="stable")
+    data_dict = {
+        k: v.iloc[order].reset_index(drop=True) for k, v in data_dict.items()
+    }
+
+    return data_dict
+
+
+# bump when the construction of the data changes to invalidate caches
+_CACHE_VERSION = "2"
+
+
+def cached_data_dict(
+    data, cache_dir, distance_method="geodesic", processes=1, market="year"
+):
+    """
+    Load the output of create_data_dict from an on-disk cache, creating
+    and saving it if it is not there. The cache is keyed on a hash of
+    the contents of the input data and the construction options, so a
+    change to either creates a new entry.
+
+    Args:
+        data (string or Pandas DataFrame): path to a CSV file with the
+            raw data with mergers, or the data
+        cache_dir (string): directory for cache files
+        distance_method (string): "geodesic" or "haversine", see
+            pair_distances
+        processes (int): number of processes to build the data with,
+            see create_data_dict
+        market (string): column to partition the data on, see
+            create_data_dict
+
+    Returns:
+        data_dict (dictionary): keys represent buyer-target pairs
+            (e.g, (b,t), (b',t')), values are
+            dataframes with buyer, target, match characteristics
+    """
+    key = hashlib.sha256()
+    if isinstance(data, pd.DataFrame):
+        key.update(pd.util.hash_pandas_object(data, index=False).values)
+        key.update(repr(list(data.columns)).encode())
+    else:
+        with open(data, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                key.update(block)
+    # the number of processes and the market partition do not change
+    # the data
+    key.update(repr((_CACHE_VERSION, distance_method)).encode())
+    cache_file = os.path.join(
+        cache_dir, "mse_data_" + key.hexdigest()[:24] + ".npz"
+    )
+
+    if os.path.exists(cache_file):
+        data_dict = {}
+        with np.load(cache_file, allow_pickle=False) as cached:
+            for k in ["bt", "bptp", "btp", "bpt"]:
+                columns = cached[k + "/columns"]
+                data_dict[k] = pd.DataFrame(
+                    {c: cached[k + "/" + c] for c in columns},
+                    columns=columns,
+                )
+        return data_dict
+
+    if not isinstance(data, pd.DataFrame):
+        data = pd.read_csv(data)
+    data_dict = create_data_dict(data, distance_method, processes, market)
+    arrays = {}
+    for k, df in data_dict.items():
+        arrays[k + "/columns"] = np.array(df.columns, dtype=str)
+        for c in df.columns:
+            arrays[k + "/" + c] = df[c].to_numpy()
+    # write to a temporary file first so an interrupted run does not
+    # leave a broken cache entry
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = cache_file[:-4] + "_" + str(os.getpid()) + ".tmp.npz"
+    np.savez(tmp_file, **arrays)
+    os.replace(tmp_file, cache_file)
+
+    return data_dict
+
+
+def create_mse_data(
+    data,
+    covariates,
+    use_price,
+    distance_method="geodesic",
+    cache_dir=None,
+    processes=1,
+    market="year",
+    bandwidth=1 / 30,
+):
+    """
+    Build the inequalities for the maximum score estimator from the raw
+    merger data.
+
+    Args:
+        data (string or Pandas DataFrame): path to a CSV file with the
+            raw data with mergers, or the data
+        covariates (list): list of strings with names of covariates to
+            use in the payoff function
+        use_price (boolean): indicator for use estimator with prices
+        distance_method (string): "geodesic" or "haversine", see
+            pair_distances
+        cache_dir (string): if given, directory for a cache of the
+            buyer-target data, see cached_data_dict
+        processes (int): number of processes to build the data with,
+            see create_data_dict
+        market (string): column to partition the data on, see
+            create_data_dict
+        bandwidth (scalar): bandwidth of the normal kernel used by the
+            smoothed estimator
+
+    Returns:
+        mse_data (MSEData): pre-differenced covariates
+    """
+    if cache_dir is not None:
+        data_dict = cached_data_dict(
+            data, cache_dir, distance_method, processes, market
+        )
+    else:
+        if not isinstance(data, pd.DataFrame):
+            data = pd.read_csv(data)
+        # only the covariates are needed
+        data_dict = create_data_dict(
+            data, distance_method, processes, market, columns=covariates
+        )
+    mse_data = MSEData(data_dict, covariates, use_price, bandwidth)
+
+    return mse_data
+
+
+def create_mse_data_chunked(
+    data,
+    covariates,
+    use_price,
+    path,
+    chunk_size=100000,
+    distance_method="geodesic",
+    bandwidth=1 / 30,
+):
+    """
+    Build the inequalities for the maximum score estimator in chunks and
+    write them to memory-mapped .npy files, so peak memory depends on
+    chunk_size rather than the number of inequalities. Qscore then
+    evaluates the returned object chunk by chunk.
+
+    Args:
+        data (Pandas DataFrame): raw data with mergers
+        covariates (list): list of strings with names of covariates to
+            use in the payoff function
+        use_price (boolean): indicator for use estimator with prices
+        path (string): directory to write the arrays to
+        chunk_size (int): number of inequalities built and evaluated at
+            a time
+        distance_method (string): "geodesic" or "haversine", see
+            pair_distances
+        bandwidth (scalar): bandwidth of the normal kernel used by the
+            smoothed estimator
+
+    Returns:
+        mse_data (MSEData): pre-differenced covariates, with arrays
+            memory-mapped from the files in path
+    """
+    os.makedirs(path, exist_ok=True)
+    years, counts = _year_inequality_counts(data)
+    num_ineq = int(counts.sum())
+    # like MSEData, only the years that produce inequalities are markets
+    markets = years[counts > 0]
+    num_free = len(covariates) - 1
+    shapes = {
+        "X": (num_ineq, num_free),
+        "offset": (num_ineq,),
+        "market_codes": (num_ineq,),
+    }
+    if use_price:
+        shapes.update(
+            {
+                "X_b": (num_ineq, num_free),
+                "offset_b": (num_ineq,),
+                "X_bp": (num_ineq, num_free),
+                "offset_bp": (num_ineq,),
+            }
+        )
+    files = {
+        k: np.lib.format.open_memmap(
+            os.path.join(path, k + ".npy"),
+            mode="w+",
+            dtype=np.int64 if k == "market_codes" else np.float64,
+            shape=shape,
+        )
+        for k, shape in shapes.items()
+    }
+
+    start = 0
+    tables = create_char_tables(data)
+    for bt_arrays in iter_array_ids(data, chunk_size):
+        data_dict = {}
+        # share distances across the four sets of pairs in the chunk
+        distance_cache = {}
+        for k, v in bt_arrays.items():
+            data_dict[k] = create_x(
+                data,
+                v,
+                distance_method=distance_method,
+                distance_cache=distance_cache,
+                tables=tables,
+                columns=covariates,
+            )
+        chunk = MSEData(data_dict, covariates, use_price)
+        stop = start + chunk.num_ineq
+        for k, v in chunk.arrays().items():
+            if k == "market_codes":
+                files[k][start:stop] = np.searchsorted(
+                    markets, chunk.markets[v]
+                )
+            elif k != "markets":
+                files[k][start:stop] = v
+        start = stop
+    for v in files.values():
+        v.flush()
+    np.save(os.path.join(path, "markets.npy"), markets)
+    del files
+
+    return load_mse_data_chunked(
+        path, covariates, use_price, chunk_size, bandwidth
+    )
+
+
+def load_mse_data_chunked(
+    path, covariates, use_price, chunk_size=100000, bandwidth=1 / 30
+):
+    """
+    Open inequalities written by create_mse_data_chunked.
+
+    Args:
+        path (string): directory the arrays were written to
+        covariates (list): list of strings with names of covariates
+            used to build the arrays
+        use_price (boolean): indicator for use estimator with prices
+        chunk_size (int): number of inequalities Qscore evaluates at a
+            time
+        bandwidth (scalar): bandwidth of the normal kernel used by the
+            smoothed estimator
+
+    Returns:
+        mse_data (MSEData): pre-differenced covariates, with arrays
+            memory-mapped from the files in path
+    """
+    names = ["X", "offset", "markets", "market_codes"]
+    if use_price:
+        names += ["X_b", "offset_b", "X_bp", "offset_bp"]
+    arrays = {
+        k: np.load(os.path.join(path, k + ".npy"), mmap_mode="r")
+        for k in names
+    }
+    mse_data = MSEData.from_arrays(arrays, covariates, use_price, bandwidth)
+    mse_data.chunk_size = chunk_size
+
+    return mse_data
+
+
+def merger_estimate(
+    init_params,
+    covariates,
+    data,
+    use_price=False,
+    smoothed_estimator=False,
+    method="DE",
+    workers=1,
+    cache_dir=None,
+    build_processes=1,
+    bounds=None,
+    time_limit=None,
+    bandwidth=1 / 30,
+):
+    """
+    Interface function to estimate model of radio mergers.
+
+    Args:
+        init_params parameters (Numpy array): guesses for coefficients
+            on covariates
+        data (string or Pandas DataFrame): path to a CSV file with the
+            raw data with mergers, or the data
+        covariates (list): list of strings with names of covariates to
+            use in the payoff function
+        use_price (boolean): indicator for use estimator with prices
+        smoothed_estimator (boolean): indicator for use smoothed MSE
+        method (string): minimization method to use, see estimate_mse
+        workers (int): number of processes for differential evolution,
+            see estimate_mse
+        cache_dir (string): if given, directory for a cache of the
+            buyer-target data, so that repeat runs and other covariate
+            lists or methods skip building it (see cached_data_dict)
+        build_processes (int): number of processes to build the
+            buyer-target data with, one market-year at a time (None
+            for all cores), see create_data_dict
+        bounds (list): (min, max) tuples for each free coefficient, see
+            estimate_mse
+        time_limit (scalar): maximum time in seconds for EXACT
+        bandwidth (scalar): bandwidth of the normal kernel used by the
+            smoothed estimator
+
+    Returns:
+        results (Scipy optimize results object): results from optimization
+    """
+    mse_data = create_mse_data(
+        data,
+        covariates,
+        use_price,
+        cache_dir=cache_dir,
+        processes=build_processes,
+        bandwidth=bandwidth,
+    )
+    results = estimate_mse(
+        init_params,
+        covariates,
+        mse_data,
+        use_price,
+        smoothed_estimator,
+        method,
+        workers=workers,
+        bounds=bounds,
+        time_limit=time_limit,
+    )
+
+    return results
+
+
+# data attached to by each worker process in multistart_estimate
+_worker_data = {}
+
+
+def _share_arrays(arrays):
+    """
+    Copy Numpy arrays into shared memory blocks.
+
+    Args:
+        arrays (dict): Numpy arrays to share
+
+    Returns:
+        blocks (list): SharedMemory objects, to be closed and unlinked
+            by the caller
+        spec (dict): name, shape and dtype of the block for each array,
+            used by _attach_arrays
+    """
+    blocks, spec = [], {}
+    for k, v in arrays.items():
+        shm = shared_memory.SharedMemory(create=True, size=max(v.nbytes, 1))
+        np.ndarray(v.shape, dtype=v.dtype, buffer=shm.buf)[...] = v
+        blocks.append(shm)
+        spec[k] = (shm.name, v.shape, v.dtype.str)
+
+    return blocks, spec
+
+
+def _attach_arrays(spec, covariates, use_price, bandwidth, chunk_size):
+    """
+    Initializer for worker processes in multistart_estimate. Builds an
+    MSEData object from arrays in shared memory without copying them,
+    with the weights (if shared), bandwidth and chunk size of the
+    object in the parent process.
+    """
+    blocks, arrays = [], {}
+    for k, (name, shape, dtype) in spec.items():
+        shm = shared_memory.SharedMemory(name=name)
+        blocks.append(shm)
+        arrays[k] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    # keep references so the buffers stay mapped
+    _worker_data["blocks"] = blocks
+    weights = arrays.pop("weights", None)
+    mse_data = MSEData.from_arrays(arrays, covariates, use_price, bandwidth)
+    mse_data.weights = weights
+    mse_data.chunk_size = chunk_size
+    _worker_data["mse_data"] = mse_data
+
+
+def _estimate_task(task):
+    """
+    Run estimate_mse for one starting value and method in a worker
+    process, optionally with the markets reweighted.
+    """
+    task_id, init_params, method, smoothed_estimator, market_counts = task
+    mse_data = _worker_data["mse_data"]
+    if market_counts is not None:
+        mse_data = mse_data.market_weights(market_counts)
+    start_time = time.time()
+    results = estimate_mse(
+        init_params,
+        mse_data.covariates,
+        mse_data,
+        mse_data.use_price,
+        smoothed_estimator,
+        method,
+    )
+    run_time = time.time() - start_time
+
+    return {
+        "id": task_id,
+        "method": method,
+        "score": -1 * float(results["fun"]),
+        "x": np.asarray(results["x"]),
+        "nfev": results.get("nfev", np.nan),
+        "time": run_time,
+    }
+
+
+def _run_tasks(mse_data, tasks, processes):
+    """
+    Run _estimate_task on each task in a process pool whose workers
+    share mse_data through shared memory.
+    """
+    arrays = mse_data.arrays()
+    if mse_data.weights is not None:
+        arrays["weights"] = np.asarray(mse_data.weights, dtype=np.float64)
+    blocks, spec = _share_arrays(arrays)
+    try:
+        with futures.ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_attach_arrays,
+            initargs=(
+                spec,
+                mse_data.covariates,
+                mse_data.use_price,
+                mse_data.bandwidth,
+                mse_data.chunk_size,
+            ),
+        ) as executor:
+            results = list(executor.map(_estimate_task, tasks))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    return results
+
+
+def _results_table(results, covariates, id_name):
+    """
+    Put the output of _estimate_task in a dataframe.
+    """
+    results_df = pd.DataFrame(
+        {
+            id_name: [r["id"] for r in results],
+            "method": [r["method"] for r in results],
+            "score": [r["score"] for r in results],
+        }
+    )
+    results_df[covariates] = np.array([r["x"] for r in results])
+    results_df["nfev"] = [r["nfev"] for r in results]
+    results_df["time"] = [r["time"] for r in results]
+
+    return results_df
+
+
+def multistart_estimate(
+    init_params_list,
+    covariates,
+    data,
+    use_price=False,
+    smoothed_estimator=False,
+    methods=("NM", "SA", "DE"),
+    processes=None,
+):
+    """
+    Estimate the maximum score estimator from many starting values and
+    methods in parallel and rank the results.
+
+    The inequalities are built once and placed in shared memory, which
+    the worker processes attach to when they start, so the data are not
+    pickled and sent with each task.
+
+    Args:
+        init_params_list (Numpy array): starting values, one row per
+            start
+        covariates (list): list of strings with names of covariates to
+            use in the payoff function
+        data (Pandas DataFrame or MSEData): raw data with mergers, or
+            inequalities already built with create_mse_data
+        use_price (boolean): indicator for use estimator with prices
+        smoothed_estimator (boolean): indicator for use smoothed MSE
+        methods (tuple): minimization methods to run from each start
+            (NM = Nelder-Mead, DE = differential evolution,
+            SA = simulated annealing)
+        processes (int): number of worker processes (defaults to the
+            number of CPUs)
+
+    Returns:
+        results_df (Pandas DataFrame): one row per start and method,
+            with the score, coefficient estimates, number of function
+            evaluations and time in seconds, sorted from best to worst
+            score
+    """
+    if isinstance(data, MSEData):
+        mse_data = data
+    else:
+        mse_data = create_mse_data(data, covariates, use_price)
+    init_params_list = np.atleast_2d(init_params_list)
+    tasks = [
+        (i, init_params, method, smoothed_estimator, None)
+        for i, init_params in enumerate(init_params_list)
+        for method in methods
+    ]
+    results = _run_tasks(mse_data, tasks, processes)
+
+    results_df = _results_table(results, mse_data.covariates, "start")
+    results_df = results_df.sort_values(
+        ["score", "time"], ascending=[False, True], kind="stable"
+    ).reset_index(drop=True)
+
+    return results_df
+
+
+def resample_estimate(
+    init_params,
+    covariates,
+    data,
+    use_price=False,
+    smoothed_estimator=False,
+    method="NM",
+    num_reps=200,
+    subsample_size=None,
+    bootstrap=False,
+    seed=None,
+    processes=None,
+):
+    """
+    Subsampling or bootstrap replicates of the maximum score estimator.
+
+    Markets are resampled, but the inequalities are built only once:
+    each replicate is a vector of market counts that reweights the
+    inequalities in Qscore. Replicates are run in parallel with the
+    inequalities in shared memory (see multistart_estimate).
+
+    Args:
+        init_params (Numpy array): starting values for each replicate,
+            typically the point estimates of the free coefficients
+        covariates (list): list of strings with names of covariates to
+            use in the payoff function
+        data (Pandas DataFrame or MSEData): raw data with mergers, or
+            inequalities already built with create_mse_data
+        use_price (boolean): indicator for use estimator with prices
+        smoothed_estimator (boolean): indicator for use smoothed MSE
+        method (string): minimization method to use (NM = Nelder-Mead,
+                DE = differential evolution, SA = simulated annealing)
+        num_reps (int): number of replicates
+        subsample_size (int): number of markets in each replicate,
+            defaults to all markets if bootstrap and half of them
+            otherwise
+        bootstrap (boolean): draw markets with replacement (bootstrap)
+            rather than without replacement (subsampling)
+        seed (int): seed for the random number generator
+        processes (int): number of worker processes (defaults to the
+            number of CPUs)
+
+    Returns:
+        results_df (Pandas DataFrame): one row per replicate with the
+            score, coefficient estimates, number of function
+            evaluations and time in seconds
+    """
+    if isinstance(data, MSEData):
+        mse_data = data
+    else:
+        mse_data = create_mse_data(data, covariates, use_price)
+    num_markets = mse_data.markets.shape[0]
+    if subsample_size is None:
+        subsample_size = num_markets if bootstrap else max(num_markets // 2, 1)
+    if not bootstrap and subsample_size > num_markets:
+        raise ValueError(
+            "Subsample size cannot be larger than the number of markets ("
+            + str(num_markets)
+            + ")"
+        )
+
+    rng = np.random.default_rng(seed)
+    tasks = []
+    for r in range(num_reps):
+        draws = rng.choice(num_markets, size=subsample_size, replace=bootstrap)
+        market_counts = np.bincount(draws, minlength=num_markets)
+        tasks.append(
+            (r, init_params, method, smoothed_estimator, market_counts)
+        )
+    results = _run_tasks(mse_data, tasks, processes)
+
+    return _results_table(results, mse_data.covariates, "replicate")
@@ -0,0 +1,378 @@
+"""
+Regression tests for merger_mse: the pre-differenced and incremental
+objectives against the original loop over the data, and the chunked,
+cached and parallel builds against the in-memory one.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import merger_mse as mm
+
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "Matching",
+    "radio_merger_data.csv",
+)
+COVARIATES = ["stations_pop", "corp_owner_pop", "distance"]
+PRICE_COVARIATES = COVARIATES + ["price"]
+
+
+@pytest.fixture(scope="module")
+def data():
+    return pd.read_csv(DATA_PATH)
+
+
+@pytest.fixture(scope="module")
+def data_dict(data):
+    return mm.create_data_dict(data, columns=PRICE_COVARIATES)
+
+
+def _coeff_draws(k, num=20, seed=0):
+    """
+    Coefficients on a range of scales, so both near-ties and clearly
+    signed inequalities are scored.
+    """
+    rng = np.random.default_rng(seed)
+    scales = np.logspace(-2, 4, num)
+
+    return rng.standard_normal((num, k)) * scales[:, None]
+
+
+def _mse_data_from_rows(X, offset):
+    return mm.MSEData.from_arrays(
+        {
+            "X": np.asarray(X, dtype=np.float64),
+            "offset": np.asarray(offset, dtype=np.float64),
+            "markets": np.array([0]),
+            "market_codes": np.zeros(len(offset), dtype=np.int64),
+        },
+        COVARIATES,
+        False,
+    )
+
+
+def _loop_array_ids(x):
+    """
+    The inequalities as the original nested loop over market-years,
+    buyers and targets created them.
+    """
+    rows = []
+    for y in sorted(set(x.year)):
+        df = x[x.year == y]
+        buyers = sorted(set(df.buyer_id))
+        for i, b in enumerate(buyers[:-1]):
+            for t in sorted(set(df.target_id[df.buyer_id == b])):
+                for bp in buyers[i + 1 :]:
+                    for tp in sorted(set(df.target_id[df.buyer_id == bp])):
+                        rows.append((y, b, t, bp, tp))
+
+    return np.array(rows)
+
+
+def test_array_ids_match_loop(data):
+    bt_arrays = mm.create_array_ids(data)
+    ids = np.column_stack(
+        (
+            bt_arrays["bt"],
+            bt_arrays["bptp"][:, 1:],
+        )
+    ).astype(np.int64)
+    expected = _loop_array_ids(data)
+    assert ids.shape[0] == mm.count_inequalities(data)
+    np.testing.assert_array_equal(
+        np.unique(ids, axis=0), np.unique(expected, axis=0)
+    )
+    np.testing.assert_array_equal(
+        bt_arrays["btp"][:, 2], bt_arrays["bptp"][:, 2]
+    )
+    np.testing.assert_array_equal(
+        bt_arrays["bpt"][:, 2], bt_arrays["bt"][:, 2]
+    )
+
+
+@pytest.mark.parametrize("use_price", [False, True])
+@pytest.mark.parametrize("smoothed", [False, True])
+def test_compiled_qscore_matches_loop(data_dict, use_price, smoothed):
+    covariates = PRICE_COVARIATES if use_price else COVARIATES
+    mse_data = mm.MSEData(data_dict, covariates, use_price)
+    k = len(covariates) - 1
+    for coeffs in _coeff_draws(k):
+        expected = mm.Qscore(
+            coeffs, data_dict, covariates, use_price, smoothed
+        )
+        assert mm.Qscore(
+            coeffs, mse_data, covariates, use_price, smoothed
+        ) == pytest.approx(expected, abs=1e-12)
+
+
+@pytest.mark.parametrize("use_price", [False, True])
+def test_incremental_qscore_matches_recompute(data_dict, use_price):
+    covariates = PRICE_COVARIATES if use_price else COVARIATES
+    mse_data = mm.MSEData(data_dict, covariates, use_price)
+    k = len(covariates) - 1
+    draws = _coeff_draws(k, seed=1)
+    inc = mm.IncrementalQscore(mse_data, draws[0])
+    rng = np.random.default_rng(2)
+    for coeffs in draws:
+        # single-coordinate moves go through the sorted breakpoints,
+        # several at once through the low-rank update
+        j = rng.integers(k)
+        one = inc.coeffs.copy()
+        one[j] = coeffs[j]
+        for c in [one, coeffs]:
+            assert inc(c) == pytest.approx(
+                mm._Qscore_compiled(c, mse_data, False), abs=1e-12
+            )
+        values = coeffs[j] * np.linspace(-2, 2, 9)
+        expected = []
+        for v in values:
+            c = inc.coeffs.copy()
+            c[j] = v
+            expected.append(-mm._Qscore_compiled(c, mse_data, False))
+        np.testing.assert_allclose(
+            inc.line_scores(j, values) / inc.total, expected, atol=1e-12
+        )
+
+
+def test_maximize_coordinate_scores_breakpoints(data_dict):
+    # two copies of x >= 1 and of x <= 1: every segment scores 2 and
+    # the unique maximum, 4, is at the breakpoint x = 1
+    mse_data = _mse_data_from_rows(
+        [[1.0, 0.0], [-1.0, 0.0], [1.0, 0.0], [-1.0, 0.0]],
+        [-1.0, 1.0, -1.0, 1.0],
+    )
+    inc = mm.IncrementalQscore(mse_data, np.zeros(2))
+    for bounds in [(-10, 10), (1, 10), (-np.inf, np.inf)]:
+        assert inc.maximize_coordinate(0, bounds) == (1.0, 4.0)
+    results = mm.coordinate_ascent(inc, [(-10, 10)] * 2)
+    assert results.fun == -1.0
+
+    mse_data = mm.MSEData(data_dict, COVARIATES, False)
+    inc = mm.IncrementalQscore(mse_data, np.array([7.5, 2.3]))
+    for j in range(2):
+        value, score = inc.maximize_coordinate(j)
+        lo, _, hi, _ = inc._index_for(j)
+        points = np.unique(np.concatenate((lo, hi)))
+        points = points[np.isfinite(points)]
+        midpoints = (points[:-1] + points[1:]) / 2
+        assert score == inc.line_scores(j, value)
+        assert score >= inc.line_scores(j, points).max()
+        assert score >= inc.line_scores(j, midpoints).max()
+
+
+def test_coordinate_ascent_does_not_lose_score(data_dict):
+    mse_data = mm.MSEData(data_dict, COVARIATES, False)
+    start = np.array([1.0, 1.0])
+    inc = mm.IncrementalQscore(mse_data, start)
+    results = mm.coordinate_ascent(inc, [(-100, 100)] * 2)
+    assert results.fun <= mm.Qscore(start, mse_data, COVARIATES, False, False)
+    assert results.fun == pytest.approx(
+        mm.Qscore(results.x, mse_data, COVARIATES, False, False), abs=1e-12
+    )
+
+
+def test_exact_mse_certifies_its_score(data_dict):
+    mse_data = mm.MSEData(data_dict, COVARIATES, False)
+    results = mm.exact_mse(mse_data, [(-100, 100)] * 2, time_limit=60)
+    assert results.success
+    assert results.fun == pytest.approx(
+        mm.Qscore(results.x, mse_data, COVARIATES, False, False), abs=1e-12
+    )
+    with pytest.raises(ValueError):
+        mm.exact_mse(mse_data, [(-np.inf, np.inf)] * 2)
+
+
+def test_exact_mse_with_an_equality_pair():
+    # a @ x + o >= 0 and -(a @ x + o) >= 0 only hold on a line, where
+    # the largest ball has a radius that rounds to slightly below zero
+    a = np.array([71.47731517796211, -0.06596362644080085])
+    o = 99.25642602544647
+    mse_data = _mse_data_from_rows([a, -a], [o, -o])
+    results = mm.exact_mse(mse_data, [(-10, 10)] * 2, time_limit=10)
+    assert results.success
+    assert results.fun == -1.0
+    assert results.ineq_satisfied.all()
+
+
+def test_exact_mse_is_no_worse_than_coordinate_ascent(data_dict):
+    # the price model is not solved within the time limit, so the
+    # solver's incumbent has to compete with coordinate ascent
+    mse_data = mm.MSEData(data_dict, PRICE_COVARIATES, True)
+    bounds = [(-10, 10)] * 3
+    start = np.ones(3)
+    results = mm.exact_mse(mse_data, bounds, time_limit=2, x0=start)
+    heuristic = mm.coordinate_ascent(
+        mm.IncrementalQscore(mse_data, start), bounds
+    )
+    assert not results.success
+    assert results.fun <= heuristic.fun
+    assert results.score_bound >= -results.fun
+    assert results.fun == pytest.approx(
+        mm.Qscore(results.x, mse_data, PRICE_COVARIATES, True, False),
+        abs=1e-12,
+    )
+
+
+def test_vincenty_distance_does_not_depend_on_the_batch(data):
+    from geopy import distance as geopy_distance
+
+    lat1, lat2 = np.meshgrid(data["buyer_lat"], data["target_lat"])
+    long1, long2 = np.meshgrid(data["buyer_long"], data["target_long"])
+    points = [v.ravel()[:500] for v in (lat1, long1, lat2, long2)]
+    batch = mm.vincenty_miles(*points)
+    for i in range(0, 500, 7):
+        alone = mm.vincenty_miles(*(v[i : i + 1] for v in points))
+        assert alone[0] == batch[i]
+        assert batch[i] == pytest.approx(
+            geopy_distance.distance(
+                (points[0][i], points[1][i]), (points[2][i], points[3][i])
+            ).miles,
+            abs=1e-6,
+        )
+
+
+def _assert_same_mse_data(a, b):
+    np.testing.assert_array_equal(a.markets, b.markets)
+    assert a.arrays().keys() == b.arrays().keys()
+    for k, v in a.arrays().items():
+        if k in ("markets", "market_codes"):
+            np.testing.assert_array_equal(v, b.arrays()[k])
+        else:
+            np.testing.assert_allclose(v, b.arrays()[k], rtol=1e-12)
+
+
+@pytest.mark.parametrize("use_price", [False, True])
+def test_chunked_build_matches_in_memory(data, tmp_path, use_price):
+    covariates = PRICE_COVARIATES if use_price else COVARIATES
+    expected = mm.create_mse_data(data, covariates, use_price)
+    chunked = mm.create_mse_data_chunked(
+        data, covariates, use_price, str(tmp_path), chunk_size=500
+    )
+    # the differenced covariates are read from the files
+    assert isinstance(chunked.X, np.memmap)
+    np.testing.assert_allclose(chunked.X, expected.X, rtol=1e-12)
+    np.testing.assert_allclose(chunked.offset, expected.offset, rtol=1e-12)
+    _assert_same_mse_data(expected, chunked)
+    for c in _coeff_draws(len(covariates) - 1):
+        # the same number of inequalities hold
+        assert mm.Qscore(c, chunked, covariates, use_price, False) == (
+            mm.Qscore(c, expected, covariates, use_price, False)
+        )
+        assert mm.Qscore(
+            c, chunked, covariates, use_price, True
+        ) == pytest.approx(
+            mm.Qscore(c, expected, covariates, use_price, True), rel=1e-12
+        )
+
+
+def test_chunked_markets_skip_years_without_inequalities(data, tmp_path):
+    # a market-year with a single merger has no inequalities
+    extra = data.iloc[[0]].copy()
+    extra["year"] = data["year"].max() + 1
+    data = pd.concat([data, extra], ignore_index=True)
+    expected = mm.create_mse_data(data, COVARIATES, False)
+    chunked = mm.create_mse_data_chunked(
+        data, COVARIATES, False, str(tmp_path)
+    )
+    _assert_same_mse_data(expected, chunked)
+
+
+def test_parallel_and_cached_builds_match_serial(data, tmp_path):
+    serial = mm.create_data_dict(data)
+    # a partition that is not sorted by year
+    shuffled = data.assign(grp=-data["year"])
+    parallel = mm.create_data_dict(shuffled, processes=2, market="grp")
+    cache_dir = str(tmp_path)
+    built = mm.cached_data_dict(data, cache_dir)
+    loaded = mm.cached_data_dict(data, cache_dir)
+    for k in ["bt", "bptp", "btp", "bpt"]:
+        for other in [parallel, built, loaded]:
+            pd.testing.assert_frame_equal(
+                serial[k].reset_index(drop=True),
+                other[k][serial[k].columns].reset_index(drop=True),
+                check_dtype=False,
+            )
+
+
+def test_market_must_be_constant_within_year(data):
+    bad = data.assign(grp=np.arange(data.shape[0]) % 2)
+    with pytest.raises(ValueError):
+        mm.create_data_dict(bad, processes=2, market="grp")
+
+
+def test_bandwidth_reaches_the_smoothed_score(data_dict):
+    narrow = mm.MSEData(data_dict, COVARIATES, False)
+    wide = mm.MSEData(data_dict, COVARIATES, False, bandwidth=0.5)
+    assert wide.reweight(np.ones(wide.num_ineq)).bandwidth == 0.5
+    coeffs = np.array([7.5, 2.3])
+    assert mm.Qscore(coeffs, narrow, COVARIATES, False, True) != mm.Qscore(
+        coeffs, wide, COVARIATES, False, True
+    )
+
+
+def test_multistart_workers_keep_bandwidth_and_weights(data_dict):
+    mse_data = mm.MSEData(data_dict, COVARIATES, False, bandwidth=5.0)
+    weights = np.random.default_rng(3).integers(0, 3, mse_data.num_ineq)
+    weighted = mse_data.reweight(weights)
+    weighted.chunk_size = 1000
+    starts = np.array([[1.0, 1.0], [7.5, 2.3]])
+    for data, smoothed in [(mse_data, True), (weighted, False)]:
+        results_df = mm.multistart_estimate(
+            starts,
+            COVARIATES,
+            data,
+            smoothed_estimator=smoothed,
+            methods=("NM",),
+            processes=1,
+        )
+        for _, row in results_df.iterrows():
+            expected = mm.estimate_mse(
+                starts[row["start"]],
+                COVARIATES,
+                data,
+                False,
+                smoothed,
+                "NM",
+            )
+            assert row["score"] == pytest.approx(-expected.fun, rel=1e-12)
+            # estimate_mse also reports the normalized coefficient
+            np.testing.assert_array_equal(
+                row[COVARIATES].to_numpy(dtype=np.float64), expected.x
+            )
+
+
+def test_resample_replicates_reweight_the_markets(data_dict):
+    mse_data = mm.MSEData(data_dict, COVARIATES, False, bandwidth=5.0)
+    init_params = np.array([7.5, 2.3])
+    results_df = mm.resample_estimate(
+        init_params,
+        COVARIATES,
+        mse_data,
+        smoothed_estimator=True,
+        num_reps=3,
+        bootstrap=True,
+        seed=4,
+        processes=1,
+    )
+    assert list(results_df["replicate"]) == [0, 1, 2]
+    # the same draws as resample_estimate
+    rng = np.random.default_rng(4)
+    num_markets = mse_data.markets.shape[0]
+    for _, row in results_df.iterrows():
+        draws = rng.choice(num_markets, size=num_markets, replace=True)
+        replicate = mse_data.market_weights(
+            np.bincount(draws, minlength=num_markets)
+        )
+        expected = mm.estimate_mse(
+            init_params, COVARIATES, replicate, False, True, "NM"
+        )
+        assert row["score"] == pytest.approx(-expected.fun, rel=1e-12)
+    with pytest.raises(ValueError):
+        mm.resample_estimate(
+            init_params, COVARIATES, mse_data, subsample_size=3
+        )